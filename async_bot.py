@@ -0,0 +1,774 @@
+import os
+import time
+import signal
+import asyncio
+import logging
+from telebot.async_telebot import AsyncTeleBot
+from contextlib import ExitStack
+from telebot import asyncio_helper, types
+from config import (
+    TOKEN, SEND_BY_URL, URL_UPLOAD_MAX_SIZE, URL_UPLOAD_MAX_PHOTO_SIZE,
+    ASYNC_MAX_JOBS, ASYNC_MAX_PENDING, WEBHOOK_URL, ALLOWED_UPDATES, TRANSCODE_MAX_SOURCE_SIZE,
+    METRICS_ENABLED, INLINE_CACHE_CHAT_ID, INLINE_CACHE_TIME
+)
+from utils import (
+    get_platform, extract_media_id,
+    get_file_id, plan_media_groups
+)
+from messages import (
+    START_MESSAGE, HELP_MESSAGE, PROCESSING_MESSAGE, DOWNLOADING_MESSAGE,
+    SUCCESS_MESSAGE, ERROR_INVALID_URL, ERROR_UNSUPPORTED_PLATFORM,
+    ERROR_RATE_LIMIT, ERROR_SERVICE_BUSY, ERROR_DOWNLOAD_FAILED, ERROR_FILE_TOO_LARGE,
+    ERROR_GENERAL, MEDIA_CAPTION, ERROR_QUEUE_FULL, COMPRESSING_MESSAGE, MULTIPLE_MEDIA_FOUND
+)
+from async_downloader import AsyncMediaDownloader
+from downloader import FileTooLargeError
+from cache import MediaCache
+from ratelimit import RateLimiter
+from storage import StorageManager
+from transcoder import create_transcoder
+from singleflight import AsyncSingleFlight
+from journal import JobJournal, EXTRACTING, DOWNLOADED, UPLOADING
+from inline import InlineIndex
+from batch import LinkBatch, extract_links
+from webhook import WebhookServer
+from http_pool import pool_stats
+from metrics import (
+    REGISTRY, STAGE_SECONDS, REQUESTS, ACTIVE_JOBS, QUEUE_DEPTH, TEMP_BYTES,
+    MetricsServer, observe_stats, observe_pool_stats, result_of
+)
+
+# Инициализация бота
+bot = AsyncTeleBot(TOKEN)
+downloader = AsyncMediaDownloader()
+media_cache = MediaCache()
+rate_limiter = RateLimiter()
+storage = StorageManager()
+transcoder = create_transcoder()
+inflight = AsyncSingleFlight()
+journal = JobJournal()
+inline_index = InlineIndex(media_cache, downloader.resolver)
+
+# Ограничение количества одновременно выполняемых задач
+job_slots = asyncio.Semaphore(ASYNC_MAX_JOBS)
+
+# Задачи, которые выполняются или ждут свободного слота
+jobs = set()
+
+@bot.message_handler(commands=['start'])
+async def send_welcome(message):
+    """Обработчик команды /start"""
+    try:
+        await bot.send_message(message.from_user.id, START_MESSAGE)
+    except Exception as e:
+        logging.error(f"Ошибка при отправке приветственного сообщения: {e}")
+
+@bot.message_handler(commands=['help'])
+async def send_help(message):
+    """Обработчик команды /help"""
+    try:
+        await bot.send_message(message.from_user.id, HELP_MESSAGE)
+    except Exception as e:
+        logging.error(f"Ошибка при отправке справки: {e}")
+
+@bot.inline_handler(func=lambda query: True)
+async def process_inline_query(query):
+    """Отвечает на inline-запрос по кэшу загруженных медиа, не дожидаясь загрузки"""
+    started = time.monotonic()
+    platform = 'unknown'
+    try:
+        found_platform, url, cached = inline_index.lookup(query.query)
+        if not found_platform:
+            await bot.answer_inline_query(query.id, [], cache_time=INLINE_CACHE_TIME, button=inline_index.start_button())
+            return
+        platform = found_platform
+
+        if cached:
+            REQUESTS.inc(platform=platform, result='inline_cached')
+            await bot.answer_inline_query(
+                query.id, inline_index.results(platform, url, cached), cache_time=INLINE_CACHE_TIME
+            )
+            return
+
+        # Медиа еще нет в кэше - отвечаем заглушкой, а загружаем его в фоне
+        pending = prefetch_inline(query.from_user.id, platform, url)
+        REQUESTS.inc(platform=platform, result='inline_pending' if pending else 'inline_miss')
+        await bot.answer_inline_query(query.id, [inline_index.placeholder(url, pending)], cache_time=0, is_personal=True)
+
+    except Exception as e:
+        logging.error(f"Ошибка при ответе на inline-запрос: {e}")
+    finally:
+        STAGE_SECONDS.observe(time.monotonic() - started, stage='inline', platform=platform)
+
+def prefetch_inline(user_id, platform, url):
+    """
+    Запускает загрузку медиа для inline-режима
+
+    Returns:
+        bool: True, если медиа загружается и скоро появится в кэше
+    """
+    if not INLINE_CACHE_CHAT_ID:
+        return False
+    if not inline_index.start_prefetch(url):
+        return True
+    if len(jobs) >= ASYNC_MAX_PENDING or not rate_limiter.check(user_id, platform)[0]:
+        inline_index.finish_prefetch(url)
+        return False
+    job = asyncio.create_task(fetch_inline(url))
+    jobs.add(job)
+    QUEUE_DEPTH.inc()
+    job.add_done_callback(jobs.discard)
+    return True
+
+async def fetch_inline(url):
+    """Загружает медиа в служебный чат, чтобы следующие inline-запросы нашли его в кэше"""
+    try:
+        status_msg = await bot.send_message(INLINE_CACHE_CHAT_ID, PROCESSING_MESSAGE)
+        await process_url(INLINE_CACHE_CHAT_ID, url, status_msg.message_id)
+    except Exception as e:
+        QUEUE_DEPTH.dec()
+        logging.error(f"Ошибка при загрузке медиа для inline-режима: {e}")
+    finally:
+        inline_index.finish_prefetch(url)
+
+@bot.message_handler(func=lambda message: True)
+async def process_message(message):
+    """Обработчик всех текстовых сообщений"""
+    try:
+        started = time.monotonic()
+        user_id = message.from_user.id
+        text = message.text.strip()
+
+        logging.info(f"Получено новое сообщение от пользователя {user_id}: {text}")
+
+        # Ссылки могут быть в любом месте текста, и их может быть несколько
+        urls = extract_links(message.text, message.entities)
+        if not urls:
+            logging.info(f"Недействительный URL: {text}")
+            REQUESTS.inc(platform='unknown', result='invalid_url')
+            await bot.send_message(user_id, ERROR_INVALID_URL)
+            return
+
+        if len(urls) == 1:
+            await process_link(user_id, urls[0], started)
+        else:
+            await process_batch(user_id, urls)
+            STAGE_SECONDS.observe(time.monotonic() - started, stage='handle', platform='batch')
+
+    except Exception as e:
+        logging.error(f"Ошибка при обработке сообщения: {e}")
+        try:
+            await bot.send_message(user_id, ERROR_GENERAL)
+        except:
+            pass
+
+async def process_link(user_id, url, started):
+    """Запускает обработку одной ссылки с отдельным сообщением о статусе"""
+    # Проверяем поддерживаемую платформу
+    platform = get_platform(url)
+    if not platform:
+        logging.warning(f"Неподдерживаемая платформа: {url}")
+        REQUESTS.inc(platform='unknown', result='unsupported')
+        await bot.send_message(user_id, ERROR_UNSUPPORTED_PLATFORM)
+        return
+
+    # Проверяем ограничение на количество запросов
+    allowed, scope = rate_limiter.check(user_id, platform)
+    if not allowed:
+        logging.warning(f"Превышен лимит запросов ({scope}) для пользователя {user_id}")
+        # Общий лимит бота или платформы исчерпан не по вине пользователя
+        if scope == 'user':
+            REQUESTS.inc(platform=platform, result='rate_limited')
+            await bot.send_message(user_id, ERROR_RATE_LIMIT)
+        else:
+            REQUESTS.inc(platform=platform, result='service_busy')
+            await bot.send_message(user_id, ERROR_SERVICE_BUSY)
+        return
+
+    if len(jobs) >= ASYNC_MAX_PENDING:
+        logging.warning(f"Слишком много задач в обработке, ссылка отклонена: {url}")
+        REQUESTS.inc(platform=platform, result='queue_full')
+        await bot.send_message(user_id, ERROR_QUEUE_FULL)
+        return
+
+    # Отправляем сообщение о начале обработки
+    processing_msg = await bot.send_message(user_id, PROCESSING_MESSAGE)
+    logging.info(f"Начинаем обработку URL: {url} (платформа: {platform})")
+    await asyncio.to_thread(journal.add, user_id, processing_msg.message_id, url, platform)
+
+    start_job(user_id, url, processing_msg.message_id)
+    STAGE_SECONDS.observe(time.monotonic() - started, stage='handle', platform=platform)
+
+async def process_batch(user_id, urls):
+    """
+    Обрабатывает несколько ссылок из одного сообщения
+
+    Ссылки обрабатываются параллельно с одним общим сообщением о статусе.
+    Медиа, которые уже есть в кэше, отправляются сразу по file_id,
+    остальные - по мере загрузки.
+    """
+    batch = LinkBatch(user_id, urls, edit_lock=asyncio.Lock())
+    batch.message_id = (await bot.send_message(user_id, batch.changed_text())).message_id
+    await asyncio.to_thread(journal.add_batch, user_id, batch.message_id, urls, batch.snapshot())
+    logging.info(f"Начинаем обработку {len(urls)} ссылок от пользователя {user_id}")
+
+    for index, (url, platform) in enumerate(zip(urls, batch.platforms)):
+        if not platform:
+            REQUESTS.inc(platform='unknown', result='unsupported')
+            batch.finish(index, 'unsupported')
+            continue
+        allowed, scope = rate_limiter.check(user_id, platform)
+        if not allowed:
+            result = 'rate_limited' if scope == 'user' else 'service_busy'
+            REQUESTS.inc(platform=platform, result=result)
+            batch.finish(index, result)
+            continue
+
+        # Медиа из кэша отправляем сразу, не занимая слоты задач.
+        # Каждая ссылка отправляется отдельно, чтобы при ошибке не повторить уже доставленные
+        canonical = downloader.resolver.lookup(url)
+        media_id = extract_media_id(canonical, platform) if canonical else None
+        # Промах учтет process_url, поэтому здесь кэш проверяем без учета в статистике
+        cached = None
+        if media_id and await asyncio.to_thread(media_cache.contains, platform, media_id):
+            cached = await asyncio.to_thread(media_cache.get, platform, media_id)
+        if cached and await send_cached_media(user_id, platform, cached, None):
+            REQUESTS.inc(platform=platform, result='cached')
+            batch.finish(index, 'cached')
+            continue
+
+        start_batch_item(batch, index, url, platform)
+
+    await update_batch_status(batch)
+
+def start_batch_item(batch, index, url, platform):
+    """Запускает задачу обработки ссылки из общего сообщения"""
+    if len(jobs) >= ASYNC_MAX_PENDING:
+        logging.warning(f"Слишком много задач в обработке, ссылка отклонена: {url}")
+        REQUESTS.inc(platform=platform, result='queue_full')
+        batch.finish(index, 'queue_full')
+        return
+    job = asyncio.create_task(process_batch_item(batch, index, url))
+    jobs.add(job)
+    QUEUE_DEPTH.inc()
+    job.add_done_callback(jobs.discard)
+
+async def process_batch_item(batch, index, url):
+    """Обрабатывает ссылку из общего сообщения и отмечает ее результат"""
+    result = 'error'
+    try:
+        result = await process_url(batch.user_id, url, None)
+    finally:
+        batch.finish(index, result)
+        await update_batch_status(batch)
+
+async def update_batch_status(batch):
+    """Обновляет общее сообщение о статусе, если его текст изменился"""
+    async with batch.edit_lock:
+        text = batch.changed_text()
+        if not text:
+            return
+        await asyncio.to_thread(journal.update_batch, batch.user_id, batch.message_id, batch.snapshot())
+        try:
+            await bot.edit_message_text(text, chat_id=batch.user_id, message_id=batch.message_id)
+        except asyncio_helper.ApiException as e:
+            logging.warning(f"Не удалось обновить статус ссылок: {e}")
+
+def start_job(user_id, url, message_id):
+    """Запускает задачу обработки ссылки"""
+    job = asyncio.create_task(process_url(user_id, url, message_id))
+    jobs.add(job)
+    QUEUE_DEPTH.inc()
+    job.add_done_callback(jobs.discard)
+
+async def resume_jobs():
+    """Запускает задания, прерванные предыдущей остановкой процесса"""
+    resumable, expired = await asyncio.to_thread(journal.unfinished)
+    for job in expired:
+        # Слишком старые задания не продолжаем - пользователь их уже не ждет
+        await asyncio.to_thread(journal.finish, job['user_id'], job['message_id'], 'expired')
+        if job['job_dir']:
+            await asyncio.to_thread(storage.release_job, job['job_dir'])
+        try:
+            await bot.edit_message_text(ERROR_GENERAL, chat_id=job['user_id'], message_id=job['message_id'])
+        except Exception as e:
+            logging.warning(f"Не удалось обновить статус прерванного задания: {e}")
+
+    for job in resumable:
+        logging.info(f"Продолжаем прерванное задание ({job['state']}): {job['url']}")
+        start_job(job['user_id'], job['url'], job['message_id'])
+
+    if resumable or expired:
+        logging.info(f"Прерванных заданий: продолжено {len(resumable)}, отменено {len(expired)}")
+    await resume_batches()
+
+async def resume_batches():
+    """Продолжает обработку сообщений с несколькими ссылками, прерванную остановкой процесса"""
+    resumable, expired = await asyncio.to_thread(journal.unfinished_batches)
+    for record in expired:
+        # Слишком старые ссылки не продолжаем - отмечаем их прерванными
+        batch = restore_batch(record)
+        for index in batch.pending():
+            batch.finish(index, 'expired')
+        await update_batch_status(batch)
+
+    for record in resumable:
+        batch = restore_batch(record)
+        for index in batch.pending():
+            logging.info(f"Продолжаем прерванную ссылку из общего сообщения: {batch.urls[index]}")
+            start_batch_item(batch, index, batch.urls[index], batch.platforms[index])
+        await update_batch_status(batch)
+
+    if resumable or expired:
+        logging.info(f"Прерванных сообщений со ссылками: продолжено {len(resumable)}, отменено {len(expired)}")
+
+def restore_batch(record):
+    """Восстанавливает ссылки из одного сообщения по записи журнала"""
+    batch = LinkBatch(record['user_id'], record['urls'], edit_lock=asyncio.Lock(), results=record['results'])
+    batch.message_id = record['message_id']
+    return batch
+
+async def process_url(user_id, url, message_id):
+    """
+    Обрабатывает URL и скачивает медиафайл
+
+    Returns:
+        str: Результат обработки (success, cached, file_too_large и т.д.)
+    """
+    async with job_slots:
+        QUEUE_DEPTH.dec()
+        ACTIVE_JOBS.inc()
+        started = time.monotonic()
+        platform = get_platform(url)
+        result = 'error'
+        try:
+            await update_status(user_id, message_id, DOWNLOADING_MESSAGE)
+
+            # Короткие ссылки раскрываем, чтобы кэш и объединение запросов работали по каноническому ID
+            url = await asyncio.to_thread(downloader.resolver.resolve, url)
+            platform = get_platform(url)
+            media_id = extract_media_id(url, platform)
+
+            # Если это медиа уже отправлялось, пересылаем его по file_id
+            cached = await asyncio.to_thread(media_cache.get, platform, media_id) if media_id else None
+            if cached:
+                logging.info(f"Медиа найдено в кэше: {platform}/{media_id}")
+                if await send_cached_media(user_id, platform, cached, message_id):
+                    result = 'cached'
+                    return result
+
+            if media_id:
+                # Одновременные запросы одного и того же медиа скачиваются один раз
+                (media, error), shared = await inflight.do(
+                    (platform, media_id), fetch_and_send, user_id, url, platform, message_id
+                )
+                if shared:
+                    if media and await send_cached_media(user_id, platform, media, message_id):
+                        result = 'shared'
+                        return result
+                    if not error:
+                        media, error = await fetch_and_send(user_id, url, platform, message_id)
+            else:
+                media, error = await fetch_and_send(user_id, url, platform, message_id)
+
+            result = result_of(error)
+            if error:
+                await update_status(user_id, message_id, error)
+
+        except FileTooLargeError:
+            # Ни один формат медиа не помещается в лимит - сообщаем об этом, ничего не скачивая
+            result = 'file_too_large'
+            try:
+                await update_status(user_id, message_id, ERROR_FILE_TOO_LARGE)
+            except:
+                pass
+        except Exception as e:
+            logging.error(f"Ошибка при обработке URL {url}: {e}")
+            try:
+                await update_status(user_id, message_id, ERROR_GENERAL)
+            except:
+                pass
+        finally:
+            ACTIVE_JOBS.dec()
+            STAGE_SECONDS.observe(time.monotonic() - started, stage='total', platform=platform)
+            REQUESTS.inc(platform=platform, result=result)
+            await asyncio.to_thread(journal.finish, user_id, message_id, result)
+        return result
+
+async def update_status(user_id, message_id, text):
+    """Обновляет сообщение о статусе (у ссылок из общего сообщения его нет)"""
+    if message_id is None:
+        return
+    await bot.edit_message_text(text, chat_id=user_id, message_id=message_id)
+
+async def fetch_and_send(user_id, url, platform, message_id):
+    """
+    Скачивает медиафайл и отправляет его пользователю
+
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+    """
+    # Задание, прерванное перезапуском, продолжаем с уже скачанными файлами
+    job, media_items = await asyncio.to_thread(journal.resumable_media, user_id, message_id)
+    if media_items:
+        logging.info(f"Отправляем файлы, скачанные до перезапуска: {url}")
+        try:
+            return await resume_upload(user_id, media_items, message_id)
+        finally:
+            await asyncio.to_thread(storage.release_job, job['job_dir'])
+    if job and job['job_dir']:
+        # Недокачанные файлы прерванной попытки не пригодятся
+        await asyncio.to_thread(storage.release_job, job['job_dir'])
+    await asyncio.to_thread(journal.update, user_id, message_id, EXTRACTING)
+
+    # Сначала пробуем отправить медиа по прямой ссылке без скачивания
+    direct_info = None
+    if SEND_BY_URL:
+        try:
+            direct_info = await downloader.extract_media_url_async(url)
+        except FileTooLargeError:
+            # Без сжатия отправить такое медиа нельзя
+            if not transcoder:
+                raise
+        if direct_info:
+            result = await send_by_url(user_id, direct_info, message_id)
+            if result is not None:
+                return result
+
+    # Если места под файл нет, не тратим время на скачивание
+    size_hint = direct_info['file_size'] if direct_info else None
+    if not await asyncio.to_thread(storage.has_room, size_hint):
+        return None, ERROR_QUEUE_FULL
+    job_dir = await asyncio.to_thread(storage.job_dir, user_id, size_hint)
+    await asyncio.to_thread(journal.update, user_id, message_id, EXTRACTING, job_dir=job_dir)
+    try:
+        return await download_and_send(user_id, url, platform, job_dir, message_id, direct_info)
+    finally:
+        await asyncio.to_thread(storage.release_job, job_dir)
+
+async def download_and_send(user_id, url, platform, job_dir, message_id, direct_info=None):
+    """
+    Скачивает медиафайл в директорию задания и отправляет его пользователю
+
+    Args:
+        direct_info: Прямая ссылка на медиа, если она уже извлечена
+            (тогда информация о посте повторно не извлекается)
+
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+    """
+    logging.info(f"Начинаю загрузку медиа из {platform}: {url}")
+
+    media_items = await downloader.download_direct_async(direct_info, job_dir) if direct_info else None
+
+    # Если медиа не помещается в лимит, скачиваем исходные файлы для сжатия
+    try:
+        if not media_items:
+            media_items = await downloader.download_media_async(url, job_dir)
+    except FileTooLargeError:
+        if not transcoder:
+            raise
+        logging.info(f"Медиа больше лимита, скачиваем его для сжатия: {url}")
+        media_items = await downloader.download_media_async(url, job_dir, TRANSCODE_MAX_SOURCE_SIZE)
+    if not media_items:
+        logging.warning(f"Не удалось скачать медиа с {platform}: {url}")
+        return None, ERROR_DOWNLOAD_FAILED
+
+    # Элементы подборки, которые не удалось подготовить, пропускаем
+    ready = []
+    error = ERROR_DOWNLOAD_FAILED
+    compressing = False
+    for media_info in media_items:
+        file_path = media_info.get('file_path', '')
+        if not file_path or not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            logging.warning(f"Файл не найден или пуст: {file_path}")
+            continue
+
+        # Берем файл в аренду, чтобы его не удалили до окончания отправки
+        if not await asyncio.to_thread(storage.track, file_path):
+            error = ERROR_QUEUE_FULL
+            continue
+
+        # Слишком большой файл сжимаем до лимита Telegram
+        if transcoder and transcoder.needs_transcode(media_info):
+            if not compressing:
+                await update_status(user_id, message_id, COMPRESSING_MESSAGE)
+                compressing = True
+            with STAGE_SECONDS.time(stage='transcode', platform=platform):
+                compressed = await asyncio.to_thread(transcoder.fit, media_info)
+            await asyncio.to_thread(storage.release, file_path)
+            if not compressed:
+                error = ERROR_FILE_TOO_LARGE
+                continue
+            if not await asyncio.to_thread(storage.track, compressed['file_path']):
+                error = ERROR_QUEUE_FULL
+                continue
+            media_info = compressed
+        ready.append(media_info)
+
+    if not ready:
+        return None, error
+    # Неполную подборку отправляем, но не кэшируем под идентификатором всего поста
+    mark_partial(ready, media_items)
+    await asyncio.to_thread(journal.update, user_id, message_id, DOWNLOADED, media=ready)
+
+    return await send_media_file(user_id, ready, message_id)
+
+async def resume_upload(user_id, media_items, message_id):
+    """
+    Отправляет файлы, скачанные до перезапуска процесса
+
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+    """
+    # Берем файлы в аренду заново - после перезапуска менеджер о них не знает
+    ready = [
+        media_info for media_info in media_items
+        if await asyncio.to_thread(storage.track, media_info['file_path'])
+    ]
+    if not ready:
+        return None, ERROR_QUEUE_FULL
+    mark_partial(ready, media_items)
+    return await send_media_file(user_id, ready, message_id)
+
+async def send_by_url(user_id, media_info, message_id):
+    """
+    Отправляет медиа по прямой ссылке, чтобы Telegram скачал его сам
+
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+               или None, если медиа нужно скачать самостоятельно
+    """
+    file_type = media_info['file_type']
+    file_size = media_info['file_size']
+    max_size = URL_UPLOAD_MAX_PHOTO_SIZE if file_type == 'image' else URL_UPLOAD_MAX_SIZE
+    if not file_size or file_size > max_size:
+        return None
+
+    platform = media_info['platform']
+    caption = f"{MEDIA_CAPTION} | {platform.capitalize()}"
+    try:
+        with STAGE_SECONDS.time(stage='upload_url', platform=platform):
+            response = await send_media(user_id, file_type, media_info['media_url'], caption)
+    except asyncio_helper.ApiException as e:
+        logging.warning(f"Telegram не принял ссылку на медиа, скачиваем сами: {e}")
+        return None
+
+    await update_status(user_id, message_id, SUCCESS_MESSAGE)
+    return await remember_media([media_info], [response]), None
+
+async def send_media_file(user_id, media_items, message_id):
+    """
+    Отправляет скачанные медиафайлы пользователю
+
+    Returns:
+        tuple: (информация об отправленных медиа с file_id, текст ошибки)
+    """
+    try:
+        platform = media_items[0]['platform']
+        await asyncio.to_thread(journal.update, user_id, message_id, UPLOADING)
+        caption = f"{MEDIA_CAPTION} | {platform.capitalize()}"
+        single = len(media_items) == 1
+
+        await update_status(user_id, message_id, SUCCESS_MESSAGE if single else MULTIPLE_MEDIA_FOUND)
+
+        with ExitStack() as stack:
+            items = []
+            for media_info in media_items:
+                file_path = media_info['file_path']
+                logging.info(f"Отправляю файл пользователю {user_id}: {file_path} (тип: {media_info['file_type']})")
+                storage.touch(file_path)
+                items.append((media_info['file_type'], stack.enter_context(open(file_path, 'rb'))))
+            with STAGE_SECONDS.time(stage='upload', platform=platform):
+                responses = await send_media_items(user_id, items, caption)
+
+        if not single:
+            await update_status(user_id, message_id, SUCCESS_MESSAGE)
+
+        media = await remember_media(media_items, responses)
+        return media, None
+
+    except asyncio_helper.ApiException as e:
+        logging.error(f"Ошибка Telegram API при отправке файла: {e}")
+        if "Request Entity Too Large" in str(e):
+            return None, ERROR_FILE_TOO_LARGE
+        return None, ERROR_GENERAL
+    except Exception as e:
+        logging.error(f"Ошибка при отправке медиафайла: {e}")
+        return None, ERROR_GENERAL
+
+def mark_partial(ready, media_items):
+    """Отмечает файлы подборки, если часть ее элементов подготовить не удалось"""
+    if len(ready) < len(media_items):
+        for media_info in ready:
+            media_info['partial'] = True
+
+async def remember_media(media_items, responses):
+    """Запоминает file_id отправленных медиа, чтобы не скачивать их повторно"""
+    media = []
+    for media_info, response in zip(media_items, responses):
+        file_id = get_file_id(response)
+        if not file_id:
+            return None
+        media.append({
+            'file_type': media_info['file_type'],
+            'file_id': file_id
+        })
+    first = media_items[0]
+    if first.get('media_id') and not any(media_info.get('partial') for media_info in media_items):
+        await asyncio.to_thread(media_cache.put, first['platform'], first['media_id'], media)
+    return media
+
+async def send_media(user_id, file_type, media, caption):
+    """Отправляет медиа (файл, file_id или URL) в зависимости от типа"""
+    if file_type == 'video':
+        return await bot.send_video(user_id, media, caption=caption, supports_streaming=True)
+    elif file_type == 'image':
+        return await bot.send_photo(user_id, media, caption=caption)
+    elif file_type == 'gif':
+        return await bot.send_animation(user_id, media, caption=caption)
+    return await bot.send_document(user_id, media, caption=caption)
+
+async def send_media_items(user_id, items, caption):
+    """
+    Отправляет несколько медиа (пары тип и файл или file_id), объединяя фото и видео в альбомы
+
+    Returns:
+        list: Сообщения Telegram в порядке items
+    """
+    responses = [None] * len(items)
+    for group in plan_media_groups([file_type for file_type, _ in items]):
+        if len(group) == 1:
+            index = group[0]
+            responses[index] = await send_media(user_id, items[index][0], items[index][1], caption)
+        else:
+            # Подпись альбома - подпись его первого элемента
+            album = [
+                types.InputMediaVideo(items[index][1], supports_streaming=True)
+                if items[index][0] == 'video' else
+                types.InputMediaPhoto(items[index][1])
+                for index in group
+            ]
+            album[0].caption = caption
+            for index, response in zip(group, await bot.send_media_group(user_id, album)):
+                responses[index] = response
+        caption = None
+    return responses
+
+async def send_cached_media(user_id, platform, cached, message_id):
+    """
+    Отправляет ранее загруженное медиа по file_id
+
+    Returns:
+        bool: True, если медиа отправлено, False если нужно скачивать заново
+    """
+    caption = f"{MEDIA_CAPTION} | {platform.capitalize()}"
+    # Записи, сохраненные до поддержки подборок, содержат одно медиа
+    if isinstance(cached, dict):
+        cached = [cached]
+    try:
+        await send_media_items(user_id, [(media['file_type'], media['file_id']) for media in cached], caption)
+        await update_status(user_id, message_id, SUCCESS_MESSAGE)
+        return True
+    except asyncio_helper.ApiException as e:
+        logging.warning(f"Не удалось отправить медиа по file_id, скачиваем заново: {e}")
+        return False
+
+def collect_metrics():
+    """Обновляет метрики текущего состояния перед их чтением"""
+    storage_stats = storage.stats()
+    TEMP_BYTES.set(storage_stats['used_bytes'] - storage_stats['memory_bytes'], location='disk')
+    TEMP_BYTES.set(storage_stats['memory_bytes'], location='memory')
+    observe_stats('storage', storage_stats)
+    observe_stats('media_cache', media_cache.stats())
+    observe_stats('journal', journal.stats())
+    observe_stats('inline', inline_index.stats())
+    if transcoder:
+        observe_stats('transcoder', transcoder.stats())
+    observe_stats('aiohttp_pool', downloader.pool_stats())
+    observe_pool_stats(pool_stats())
+
+REGISTRY.add_collector(collect_metrics)
+
+async def cleanup_scheduler():
+    """Периодическая очистка временных файлов"""
+    while True:
+        await asyncio.sleep(3600)  # Очистка каждый час
+        try:
+            await asyncio.to_thread(storage.sweep)
+            await asyncio.to_thread(media_cache.purge)
+            await asyncio.to_thread(journal.purge)
+            logging.info(f"Статистика кэша медиа: {media_cache.stats()}")
+            logging.info(f"Использование временных файлов: {storage.stats()}")
+            if transcoder:
+                logging.info(f"Статистика сжатия медиа: {transcoder.stats()}")
+            logging.info(f"Статистика пулов HTTP соединений: {downloader.pool_stats()}")
+        except Exception as e:
+            logging.error(f"Ошибка при плановой очистке файлов: {e}")
+
+async def run(mode="polling"):
+    """Запускает асинхронного бота и дожидается завершения задач при остановке"""
+    cleanup_task = asyncio.create_task(cleanup_scheduler())
+    loop = asyncio.get_running_loop()
+    metrics_server = None
+    if METRICS_ENABLED:
+        metrics_server = MetricsServer()
+        metrics_server.start()
+    await resume_jobs()
+    try:
+        if mode == "webhook":
+            await run_webhook(loop)
+        else:
+            await run_polling(loop)
+    finally:
+        cleanup_task.cancel()
+        if jobs:
+            logging.info(f"Дожидаемся завершения задач: {len(jobs)}")
+            await asyncio.gather(*jobs, return_exceptions=True)
+        if metrics_server:
+            metrics_server.shutdown()
+        await bot.close_session()
+        await downloader.close()
+        downloader.engine.shutdown()
+        if transcoder:
+            transcoder.shutdown()
+
+async def run_polling(loop):
+    """Получает обновления через long polling до получения SIGTERM"""
+    await bot.remove_webhook()
+    polling = asyncio.create_task(
+        bot.polling(non_stop=True, interval=0, allowed_updates=ALLOWED_UPDATES)
+    )
+
+    # По SIGTERM прекращаем получать обновления, а задачи дорабатывает run()
+    stopped = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stopped.set)
+    stopping = asyncio.create_task(stopped.wait())
+    try:
+        await asyncio.wait((polling, stopping), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stopping.cancel()
+        polling.cancel()
+        try:
+            await polling
+        except asyncio.CancelledError:
+            pass
+
+async def run_webhook(loop):
+    """Принимает обновления через встроенный HTTP сервер до получения SIGTERM"""
+    server = WebhookServer(
+        lambda updates: asyncio.run_coroutine_threadsafe(bot.process_new_updates(updates), loop)
+    )
+    await bot.set_webhook(
+        url=WEBHOOK_URL,
+        secret_token=server.secret,
+        allowed_updates=ALLOWED_UPDATES
+    )
+    server.start()
+
+    stopped = asyncio.Event()
+    loop.add_signal_handler(signal.SIGTERM, stopped.set)
+    try:
+        await stopped.wait()
+    finally:
+        await asyncio.to_thread(server.shutdown)
@@ -0,0 +1,254 @@
+import os
+import asyncio
+import logging
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    MAX_RETRIES, RETRY_DELAY, REQUEST_TIMEOUT, MAX_FILE_SIZE, YTDLP_WORKERS, PINTEREST_CHUNK_SIZE,
+    HTTP_POOL_SIZE, HTTP_POOL_HOSTS, HTTP_KEEPALIVE_IDLE, DNS_CACHE_TTL
+)
+from utils import get_platform, extract_media_id, get_file_extension
+from downloader import MediaDownloader, FileTooLargeError, HEADERS, YTDLP_OPTIONS
+from pinterest import PinterestPageScanner
+from metrics import STAGE_SECONDS, DOWNLOAD_ERRORS
+
+# Размер части файла при асинхронном скачивании (в байтах)
+CHUNK_SIZE = 64 * 1024
+
+# Сколько байт накапливается перед записью на диск в пуле потоков
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class AsyncMediaDownloader(MediaDownloader):
+    """
+    Асинхронная версия MediaDownloader
+
+    Страницы Pinterest и прямые ссылки на файлы скачиваются через aiohttp,
+    а работа с yt-dlp выполняется в небольшом пуле потоков, которые
+    только ожидают результат от процессов YtdlpEngine.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.executor = ThreadPoolExecutor(
+            max_workers=YTDLP_WORKERS * 2,
+            thread_name_prefix="ytdlp-wait"
+        )
+        self.http = None
+
+    def _get_http(self):
+        """Возвращает HTTP сессию aiohttp, создавая ее внутри работающего цикла событий"""
+        if self.http is None or self.http.closed:
+            # Общий лимит соединений и лимит на хост, кэш DNS и keep-alive как у синхронного пула
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_SIZE * HTTP_POOL_HOSTS,
+                limit_per_host=HTTP_POOL_SIZE,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                keepalive_timeout=HTTP_KEEPALIVE_IDLE
+            )
+            self.http = aiohttp.ClientSession(
+                connector=connector,
+                headers=HEADERS,
+                timeout=aiohttp.ClientTimeout(connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT)
+            )
+        return self.http
+
+    def pool_stats(self):
+        """Возвращает состояние пула соединений aiohttp"""
+        if self.http is None or self.http.closed:
+            return {}
+        connector = self.http.connector
+        return {
+            'open': sum(len(conns) for conns in connector._conns.values()),
+            'acquired': len(connector._acquired),
+            'limit': connector.limit,
+            'limit_per_host': connector.limit_per_host
+        }
+
+    async def close(self):
+        """Закрывает HTTP сессию и пул потоков"""
+        if self.http:
+            await self.http.close()
+        self.executor.shutdown(wait=False)
+
+    async def _run_sync(self, fn, *args):
+        """Выполняет блокирующую функцию в пуле потоков"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def download_media_async(self, url, save_dir, max_size=MAX_FILE_SIZE):
+        """
+        Скачивает медиафайлы с указанного URL
+
+        Returns:
+            list: Информация о скачанных файлах или None в случае ошибки
+        """
+        url = await self._run_sync(self.resolver.resolve, url)
+        platform = get_platform(url)
+        if platform == 'pinterest':
+            try:
+                with STAGE_SECONDS.time(stage='download', platform=platform):
+                    return await self._download_pinterest_async(url, save_dir, max_size)
+            except FileTooLargeError:
+                raise
+            except Exception as e:
+                logging.error(f"Ошибка при скачивании Pinterest медиа: {e}")
+                return None
+        return await self._run_sync(self.download_media, url, save_dir, max_size)
+
+    async def extract_media_url_async(self, url):
+        """
+        Извлекает прямую ссылку на медиа без скачивания файла
+
+        Returns:
+            dict: Информация о медиа с прямой ссылкой или None
+        """
+        url = await self._run_sync(self.resolver.resolve, url)
+        platform = get_platform(url)
+        media_id = extract_media_id(url, platform) if platform else None
+        if not media_id:
+            return None
+
+        try:
+            with STAGE_SECONDS.time(stage='extract', platform=platform):
+                if platform == 'pinterest':
+                    media_url, file_type = await self._find_pinterest_media_async(url)
+                    return {
+                        'platform': platform,
+                        'media_id': media_id,
+                        'media_url': media_url,
+                        'file_type': file_type,
+                        'file_size': await self._get_remote_size_async(media_url),
+                        'http_headers': None
+                    }
+                info = await self._run_sync(
+                    self._ytdlp_extract, url, YTDLP_OPTIONS[platform], None, False
+                )
+                return self._direct_media_info(platform, media_id, info)
+        except FileTooLargeError:
+            raise
+        except Exception as e:
+            logging.warning(f"Не удалось получить прямую ссылку на медиа {url}: {e}")
+            return None
+
+    async def download_direct_async(self, media_info, save_dir, max_size=MAX_FILE_SIZE):
+        """
+        Скачивает медиа по прямой ссылке, уже полученной extract_media_url_async
+
+        Returns:
+            list: Информация о скачанном файле или None, если скачать его не удалось
+        """
+        if media_info['file_size'] and media_info['file_size'] > max_size:
+            return None
+        file_path = os.path.join(save_dir, self._direct_file_name(media_info))
+        with STAGE_SECONDS.time(stage='download', platform=media_info['platform']):
+            success, error = await self._download_file_async(
+                media_info['media_url'], file_path, max_size, media_info.get('http_headers')
+            )
+        if not success:
+            DOWNLOAD_ERRORS.inc(reason=error)
+            logging.warning(f"Не удалось скачать медиа по прямой ссылке ({error}): {media_info['media_url']}")
+            return None
+        return [self._media_item(media_info['platform'], media_info['media_id'], file_path, media_info['file_type'])]
+
+    async def _find_pinterest_media_async(self, url):
+        """Загружает страницу Pinterest и ищет на ней прямую ссылку на медиа"""
+        scanner = PinterestPageScanner(extract_media_id(url, 'pinterest'))
+        async with self._get_http().get(url) as response:
+            async for chunk in response.content.iter_chunked(PINTEREST_CHUNK_SIZE):
+                if scanner.feed(chunk):
+                    break
+        return scanner.result()
+
+    async def _get_remote_size_async(self, url):
+        """Возвращает размер файла по заголовку Content-Length или None"""
+        try:
+            async with self._get_http().head(url, allow_redirects=True) as response:
+                response.raise_for_status()
+                return response.content_length or None
+        except aiohttp.ClientError as e:
+            logging.warning(f"Не удалось определить размер файла {url}: {e}")
+            return None
+
+    async def _download_file_async(self, url, save_path, max_size=MAX_FILE_SIZE, headers=None):
+        """Скачивает файл по URL через временный .part файл и сохраняет по указанному пути"""
+        part_path = save_path + '.part'
+        for attempt in range(MAX_RETRIES):
+            try:
+                async with self._get_http().get(url, headers=headers) as response:
+                    response.raise_for_status()
+
+                    # Проверяем размер файла
+                    content_length = response.content_length or 0
+                    if content_length > max_size:
+                        logging.warning(f"Файл слишком большой: {content_length} байт")
+                        return False, "file_too_large"
+
+                    # Запись на диск блокирует, поэтому части пишутся крупными блоками вне цикла событий
+                    file_size = 0
+                    buffer = bytearray()
+                    f = await asyncio.to_thread(open, part_path, 'wb')
+                    try:
+                        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                            file_size += len(chunk)
+                            if file_size > max_size:
+                                break
+                            buffer += chunk
+                            if len(buffer) >= WRITE_BUFFER_SIZE:
+                                await asyncio.to_thread(f.write, buffer)
+                                buffer.clear()
+                        if buffer and file_size <= max_size:
+                            await asyncio.to_thread(f.write, buffer)
+                    finally:
+                        await asyncio.to_thread(f.close)
+
+                if file_size > max_size:
+                    os.remove(part_path)
+                    logging.warning(f"Скачанный файл слишком большой: {file_size} байт")
+                    return False, "file_too_large"
+
+                if file_size == 0:
+                    os.remove(part_path)
+                    logging.warning("Скачан пустой файл")
+                    return False, "empty_file"
+
+                os.replace(part_path, save_path)
+                return True, None
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.error(f"Ошибка при скачивании (попытка {attempt+1}/{MAX_RETRIES}): {e}")
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                if attempt < MAX_RETRIES - 1:
+                    await asyncio.sleep(RETRY_DELAY)
+                else:
+                    return False, "download_failed"
+
+        return False, "max_retries"
+
+    async def _download_pinterest_async(self, url, save_dir, max_size=MAX_FILE_SIZE):
+        """Скачивает медиафайл из Pinterest"""
+        media_id = extract_media_id(url, 'pinterest')
+        if not media_id:
+            logging.error(f"Не удалось извлечь ID медиа из URL: {url}")
+            return None
+
+        error = None
+        try:
+            media_url, file_type = await self._find_pinterest_media_async(url)
+            file_name = f"pinterest_{media_id}{get_file_extension(file_type)}"
+            file_path = os.path.join(save_dir, file_name)
+
+            logging.info(f"Скачиваем Pinterest медиа: {media_url}")
+            success, error = await self._download_file_async(media_url, file_path, max_size)
+            if success:
+                return [self._media_item('pinterest', media_id, file_path, file_type)]
+            DOWNLOAD_ERRORS.inc(reason=error)
+            logging.error(f"Ошибка при скачивании Pinterest медиа через API: {error}")
+        except Exception as e:
+            logging.error(f"Ошибка при использовании Pinterest API: {e}")
+
+        # Если не удалось через API, пробуем через yt-dlp (он может выбрать формат меньшего размера)
+        media_items = await self._run_sync(self._download_pinterest_ytdlp, url, media_id, save_dir, max_size)
+        if not media_items and error == 'file_too_large':
+            raise FileTooLargeError(f"Pinterest медиа больше {max_size} байт")
+        return media_items
@@ -0,0 +1,117 @@
+import logging
+import threading
+from config import MAX_LINKS_PER_MESSAGE
+from utils import extract_urls, get_platform
+from resolver import canonical_url
+from messages import (
+    BATCH_PROGRESS, BATCH_DONE, BATCH_ITEM, BATCH_LINK, BATCH_PENDING, BATCH_STATUSES, BATCH_ERROR
+)
+
+# Результаты, при которых медиа доставлено пользователю
+DELIVERED_RESULTS = ('success', 'cached', 'shared')
+
+
+def extract_links(text, entities=None, limit=MAX_LINKS_PER_MESSAGE):
+    """
+    Извлекает ссылки из сообщения без повторов
+
+    Повторы определяются по каноническому виду ссылки, поэтому одна и
+    та же публикация с разными параметрами обрабатывается один раз.
+
+    Returns:
+        list: Не больше limit ссылок в порядке появления в тексте
+    """
+    links = []
+    seen = set()
+    for url in extract_urls(text, entities):
+        key = canonical_url(url) or url
+        if key in seen:
+            continue
+        seen.add(key)
+        links.append(url)
+    if len(links) > limit:
+        logging.warning(f"В сообщении {len(links)} ссылок, обрабатываем первые {limit}")
+        links = links[:limit]
+    return links
+
+
+class LinkBatch:
+    """
+    Ссылки из одного сообщения с общим сообщением о статусе
+
+    Ссылки обрабатываются параллельно, а результат каждой отмечается в
+    общем сообщении. Изменения сообщения выполняются под edit_lock, чтобы
+    более старый текст не перезаписал более новый.
+
+    Args:
+        user_id: Пользователь
+        urls: Ссылки из сообщения
+        edit_lock: Блокировка для изменения сообщения (asyncio.Lock в режиме asyncio)
+        results: Результаты ссылок, сохраненные в журнале до перезапуска
+    """
+
+    def __init__(self, user_id, urls, edit_lock=None, results=None):
+        self.user_id = user_id
+        self.urls = urls
+        self.platforms = [get_platform(url) for url in urls]
+        self.results = list(results) if results else [None] * len(urls)
+        self.message_id = None
+        self.shown = None
+        self.lock = threading.Lock()
+        self.edit_lock = edit_lock or threading.Lock()
+
+    def finish(self, index, result):
+        """Отмечает результат обработки ссылки"""
+        with self.lock:
+            self.results[index] = result
+
+    def snapshot(self):
+        """Возвращает копию результатов для журнала"""
+        with self.lock:
+            return list(self.results)
+
+    def pending(self):
+        """Возвращает индексы ссылок, которые еще обрабатываются"""
+        with self.lock:
+            return [index for index, result in enumerate(self.results) if result is None]
+
+    def done(self):
+        """Проверяет, обработаны ли все ссылки"""
+        with self.lock:
+            return all(result is not None for result in self.results)
+
+    def render(self):
+        """Формирует текст общего сообщения о статусе"""
+        results = self.snapshot()
+        total = len(results)
+        finished = sum(1 for result in results if result is not None)
+        if finished < total:
+            header = BATCH_PROGRESS.format(done=finished, total=total)
+        else:
+            success = sum(1 for result in results if result in DELIVERED_RESULTS)
+            header = BATCH_DONE.format(success=success, total=total)
+
+        lines = [header, ""]
+        for index, (platform, result) in enumerate(zip(self.platforms, results)):
+            if result is None:
+                status = BATCH_PENDING
+            else:
+                status = BATCH_STATUSES.get(result, BATCH_ERROR)
+            lines.append(BATCH_ITEM.format(
+                index=index + 1,
+                status=status,
+                platform=platform.capitalize() if platform else BATCH_LINK
+            ))
+        return "\n".join(lines)
+
+    def changed_text(self):
+        """
+        Возвращает новый текст сообщения, если он отличается от показанного
+
+        Вызывается под edit_lock; текст считается показанным сразу.
+        """
+        text = self.render()
+        if text == self.shown:
+            return None
+        self.shown = text
+        return text
@@ -3,26 +3,58 @@ import logging
 import telebot
 import time
 import threading
+from contextlib import ExitStack
 from telebot import types
-from config import TOKEN, RATE_LIMIT
+from config import (
+    TOKEN, SEND_BY_URL, URL_UPLOAD_MAX_SIZE, URL_UPLOAD_MAX_PHOTO_SIZE,
+    STREAM_UPLOAD, TRANSCODE_MAX_SOURCE_SIZE, JOB_COSTS, INLINE_CACHE_CHAT_ID, INLINE_CACHE_TIME
+)
 from utils import (
-    is_valid_url, get_platform, rate_limit_check, 
-    get_user_download_dir, create_temp_dir, cleanup_temp_files
+    get_platform, extract_media_id,
+    get_file_extension, sanitize_filename, get_file_id, plan_media_groups,
+    guess_media_type
 )
 from messages import (
     START_MESSAGE, HELP_MESSAGE, PROCESSING_MESSAGE, DOWNLOADING_MESSAGE, 
     SUCCESS_MESSAGE, ERROR_INVALID_URL, ERROR_UNSUPPORTED_PLATFORM, 
-    ERROR_RATE_LIMIT, ERROR_DOWNLOAD_FAILED, ERROR_FILE_TOO_LARGE, 
-    ERROR_GENERAL, NO_MEDIA_FOUND, MULTIPLE_MEDIA_FOUND, MEDIA_CAPTION
+    ERROR_RATE_LIMIT, ERROR_SERVICE_BUSY, ERROR_DOWNLOAD_FAILED, ERROR_FILE_TOO_LARGE, 
+    ERROR_GENERAL, NO_MEDIA_FOUND, MULTIPLE_MEDIA_FOUND, MEDIA_CAPTION,
+    QUEUED_MESSAGE, ERROR_QUEUE_FULL, COMPRESSING_MESSAGE
+)
+from downloader import MediaDownloader, FileTooLargeError
+from cache import MediaCache
+from ratelimit import RateLimiter
+from storage import StorageManager
+from transcoder import create_transcoder
+from singleflight import SingleFlight
+from scheduler import JobScheduler
+from journal import JobJournal, EXTRACTING, DOWNLOADED, UPLOADING
+from inline import InlineIndex
+from batch import LinkBatch, extract_links
+from streaming import StreamingUploader, StreamingError
+from http_pool import create_session, pool_stats
+from metrics import (
+    REGISTRY, STAGE_SECONDS, REQUESTS, ACTIVE_JOBS, QUEUE_DEPTH, TEMP_BYTES,
+    observe_stats, observe_pool_stats, result_of
 )
-from downloader import MediaDownloader
 
 # Инициализация бота
+# Запросы к Bot API идут через общий пул соединений
+telebot.apihelper.session = create_session()
 bot = telebot.TeleBot(TOKEN)
 downloader = MediaDownloader()
-
-# Создание временной директории при запуске
-create_temp_dir()
+uploader = StreamingUploader(downloader.session)
+media_cache = MediaCache()
+rate_limiter = RateLimiter()
+storage = StorageManager()
+transcoder = create_transcoder()
+inflight = SingleFlight()
+journal = JobJournal()
+inline_index = InlineIndex(media_cache, downloader.resolver)
+scheduler = JobScheduler()
+scheduler.start()
+# Общая очередь заданий рабочих процессов (роль "ingest"), None - обработка в этом процессе
+job_queue = None
 
 # Словарь для отслеживания состояния пользователей
 user_states = {}
@@ -45,46 +77,90 @@ def send_help(message):
     except Exception as e:
         logging.error(f"Ошибка при отправке справки: {e}")
 
+@bot.inline_handler(func=lambda query: True)
+def process_inline_query(query):
+    """Отвечает на inline-запрос по кэшу загруженных медиа, не дожидаясь загрузки"""
+    started = time.monotonic()
+    platform = 'unknown'
+    try:
+        found_platform, url, cached = inline_index.lookup(query.query)
+        if not found_platform:
+            bot.answer_inline_query(query.id, [], cache_time=INLINE_CACHE_TIME, button=inline_index.start_button())
+            return
+        platform = found_platform
+        
+        if cached:
+            REQUESTS.inc(platform=platform, result='inline_cached')
+            bot.answer_inline_query(
+                query.id, inline_index.results(platform, url, cached), cache_time=INLINE_CACHE_TIME
+            )
+            return
+        
+        # Медиа еще нет в кэше - отвечаем заглушкой, а загружаем его в фоне
+        pending = prefetch_inline(query.from_user.id, platform, url)
+        REQUESTS.inc(platform=platform, result='inline_pending' if pending else 'inline_miss')
+        bot.answer_inline_query(query.id, [inline_index.placeholder(url, pending)], cache_time=0, is_personal=True)
+        
+    except Exception as e:
+        logging.error(f"Ошибка при ответе на inline-запрос: {e}")
+    finally:
+        STAGE_SECONDS.observe(time.monotonic() - started, stage='inline', platform=platform)
+
+def prefetch_inline(user_id, platform, url):
+    """
+    Ставит в очередь загрузку медиа для inline-режима
+    
+    Returns:
+        bool: True, если медиа загружается и скоро появится в кэше
+    """
+    if not INLINE_CACHE_CHAT_ID:
+        return False
+    if not inline_index.start_prefetch(url):
+        return True
+    if not rate_limiter.check(user_id, platform)[0]:
+        inline_index.finish_prefetch(url)
+        return False
+    position = scheduler.submit(
+        platform, fetch_inline, url, user=user_id, cost=estimate_cost(url, platform)
+    )
+    if position is None:
+        inline_index.finish_prefetch(url)
+        return False
+    return True
+
+def fetch_inline(url):
+    """Загружает медиа в служебный чат, чтобы следующие inline-запросы нашли его в кэше"""
+    try:
+        status_msg = bot.send_message(INLINE_CACHE_CHAT_ID, PROCESSING_MESSAGE)
+        process_url(INLINE_CACHE_CHAT_ID, url, status_msg.message_id)
+    finally:
+        inline_index.finish_prefetch(url)
+
 @bot.message_handler(func=lambda message: True)
 def process_message(message):
     """Обработчик всех текстовых сообщений"""
     try:
+        started = time.monotonic()
         user_id = message.from_user.id
         text = message.text.strip()
         
         logging.info(f"Получено новое сообщение от пользователя {user_id}: {text}")
         
-        # Проверяем, является ли сообщение URL
-        if not is_valid_url(text):
+        # Ссылки могут быть в любом месте текста, и их может быть несколько
+        urls = extract_links(message.text, message.entities)
+        if not urls:
             logging.info(f"Недействительный URL: {text}")
+            REQUESTS.inc(platform='unknown', result='invalid_url')
             bot.send_message(user_id, ERROR_INVALID_URL)
             return
         
-        # Проверяем поддерживаемую платформу
-        platform = get_platform(text)
-        logging.info(f"Определенная платформа: {platform or 'Не определена'}")
-        
-        if not platform:
-            logging.warning(f"Неподдерживаемая платформа: {text}")
-            bot.send_message(user_id, ERROR_UNSUPPORTED_PLATFORM)
-            return
-        
-        # Проверяем ограничение на количество запросов
-        if not rate_limit_check(user_id, RATE_LIMIT):
-            logging.warning(f"Превышен лимит запросов для пользователя {user_id}")
-            bot.send_message(user_id, ERROR_RATE_LIMIT)
-            return
-        
-        # Отправляем сообщение о начале обработки
-        processing_msg = bot.send_message(user_id, PROCESSING_MESSAGE)
-        logging.info(f"Начинаем обработку URL: {text} (платформа: {platform})")
-        
-        # Запускаем обработку URL в отдельном потоке
-        thread = threading.Thread(
-            target=process_url, 
-            args=(user_id, text, processing_msg.message_id)
-        )
-        thread.start()
+        # Рабочие процессы общей очереди обрабатывают каждую ссылку как отдельное задание
+        if len(urls) == 1 or job_queue:
+            for url in urls:
+                process_link(user_id, url, started)
+        else:
+            process_batch(user_id, urls)
+            STAGE_SECONDS.observe(time.monotonic() - started, stage='handle', platform='batch')
         
     except Exception as e:
         logging.error(f"Ошибка при обработке сообщения: {e}")
@@ -93,150 +169,677 @@ def process_message(message):
         except:
             pass
 
-def process_url(user_id, url, message_id):
-    """Обрабатывает URL и скачивает медиафайл"""
-    try:
-        # Обновляем сообщение о статусе
+def process_link(user_id, url, started):
+    """Ставит в очередь одну ссылку с отдельным сообщением о статусе"""
+    # Проверяем поддерживаемую платформу
+    platform = get_platform(url)
+    logging.info(f"Определенная платформа: {platform or 'Не определена'}")
+    
+    if not platform:
+        logging.warning(f"Неподдерживаемая платформа: {url}")
+        REQUESTS.inc(platform='unknown', result='unsupported')
+        bot.send_message(user_id, ERROR_UNSUPPORTED_PLATFORM)
+        return
+    
+    # Проверяем ограничение на количество запросов
+    allowed, scope = rate_limiter.check(user_id, platform)
+    if not allowed:
+        logging.warning(f"Превышен лимит запросов ({scope}) для пользователя {user_id}")
+        # Общий лимит бота или платформы исчерпан не по вине пользователя
+        if scope == 'user':
+            REQUESTS.inc(platform=platform, result='rate_limited')
+            bot.send_message(user_id, ERROR_RATE_LIMIT)
+        else:
+            REQUESTS.inc(platform=platform, result='service_busy')
+            bot.send_message(user_id, ERROR_SERVICE_BUSY)
+        return
+    
+    # Отправляем сообщение о начале обработки
+    processing_msg = bot.send_message(user_id, PROCESSING_MESSAGE)
+    logging.info(f"Начинаем обработку URL: {url} (платформа: {platform})")
+    journal.add(user_id, processing_msg.message_id, url, platform)
+    
+    # Ставим обработку URL в очередь рабочих потоков или процессов
+    position = submit_job(platform, user_id, url, processing_msg.message_id)
+    if position is None:
+        logging.warning(f"Очередь переполнена, ссылка отклонена: {url}")
+        REQUESTS.inc(platform=platform, result='queue_full')
+        journal.finish(user_id, processing_msg.message_id, 'queue_full')
         bot.edit_message_text(
             chat_id=user_id,
-            message_id=message_id,
-            text=DOWNLOADING_MESSAGE
+            message_id=processing_msg.message_id,
+            text=ERROR_QUEUE_FULL
         )
+    elif position:
+        logging.info(f"Ссылка поставлена в очередь на позицию {position}: {url}")
+        bot.edit_message_text(
+            chat_id=user_id,
+            message_id=processing_msg.message_id,
+            text=QUEUED_MESSAGE.format(position=position)
+        )
+    STAGE_SECONDS.observe(time.monotonic() - started, stage='handle', platform=platform)
+
+def process_batch(user_id, urls):
+    """
+    Обрабатывает несколько ссылок из одного сообщения
+    
+    Ссылки обрабатываются параллельно с одним общим сообщением о статусе.
+    Медиа, которые уже есть в кэше, отправляются сразу по file_id,
+    остальные - по мере загрузки.
+    """
+    batch = LinkBatch(user_id, urls)
+    batch.message_id = bot.send_message(user_id, batch.changed_text()).message_id
+    journal.add_batch(user_id, batch.message_id, urls, batch.snapshot())
+    logging.info(f"Начинаем обработку {len(urls)} ссылок от пользователя {user_id}")
+    
+    for index, (url, platform) in enumerate(zip(urls, batch.platforms)):
+        if not platform:
+            REQUESTS.inc(platform='unknown', result='unsupported')
+            batch.finish(index, 'unsupported')
+            continue
+        allowed, scope = rate_limiter.check(user_id, platform)
+        if not allowed:
+            result = 'rate_limited' if scope == 'user' else 'service_busy'
+            REQUESTS.inc(platform=platform, result=result)
+            batch.finish(index, result)
+            continue
         
-        # Создаем директорию для пользователя
-        user_dir = get_user_download_dir(user_id)
+        # Медиа из кэша отправляем сразу, не занимая рабочие потоки.
+        # Каждая ссылка отправляется отдельно, чтобы при ошибке не повторить уже доставленные
+        canonical = downloader.resolver.lookup(url)
+        media_id = extract_media_id(canonical, platform) if canonical else None
+        # Промах учтет process_url, поэтому здесь кэш проверяем без учета в статистике
+        cached = media_cache.get(platform, media_id) if media_id and media_cache.contains(platform, media_id) else None
+        if cached and send_cached_media(user_id, platform, cached, None):
+            REQUESTS.inc(platform=platform, result='cached')
+            batch.finish(index, 'cached')
+            continue
         
+        submit_batch_item(batch, index, url, platform)
+    
+    update_batch_status(batch)
+
+def submit_batch_item(batch, index, url, platform):
+    """Ставит ссылку из общего сообщения в очередь рабочих потоков"""
+    position = scheduler.submit(
+        platform, process_batch_item, batch, index, url,
+        user=batch.user_id, cost=estimate_cost(url, platform)
+    )
+    if position is None:
+        logging.warning(f"Очередь переполнена, ссылка отклонена: {url}")
+        REQUESTS.inc(platform=platform, result='queue_full')
+        batch.finish(index, 'queue_full')
+
+def process_batch_item(batch, index, url):
+    """Обрабатывает ссылку из общего сообщения и отмечает ее результат"""
+    result = 'error'
+    try:
+        result = process_url(batch.user_id, url, None)
+    finally:
+        batch.finish(index, result)
+        update_batch_status(batch)
+
+def update_batch_status(batch):
+    """Обновляет общее сообщение о статусе, если его текст изменился"""
+    with batch.edit_lock:
+        text = batch.changed_text()
+        if not text:
+            return
+        journal.update_batch(batch.user_id, batch.message_id, batch.snapshot())
+        try:
+            bot.edit_message_text(chat_id=batch.user_id, message_id=batch.message_id, text=text)
+        except telebot.apihelper.ApiException as e:
+            logging.warning(f"Не удалось обновить статус ссылок: {e}")
+
+def use_job_queue(queue):
+    """Направляет новые ссылки в общую очередь заданий рабочих процессов"""
+    global job_queue
+    job_queue = queue
+
+def submit_job(platform, user_id, url, message_id):
+    """
+    Ставит ссылку в очередь на обработку
+
+    Returns:
+        int: Позиция в очереди (0 - обработка начнется сразу) или None, если очередь переполнена
+    """
+    if job_queue:
+        return job_queue.enqueue(platform, user_id, url, message_id)
+    return scheduler.submit(
+        platform, process_url, user_id, url, message_id,
+        user=user_id, cost=estimate_cost(url, platform)
+    )
+
+def fail_job(job):
+    """Сообщает пользователю о задании общей очереди, исчерпавшем попытки"""
+    journal.finish(job['user_id'], job['message_id'], 'failed')
+    try:
+        bot.edit_message_text(chat_id=job['user_id'], message_id=job['message_id'], text=ERROR_GENERAL)
+    except telebot.apihelper.ApiException as e:
+        logging.warning(f"Не удалось обновить статус проваленного задания: {e}")
+
+def estimate_cost(url, platform):
+    """Оценивает стоимость обработки ссылки для планировщика, не обращаясь к платформе"""
+    # Короткие ссылки раскрываем только по кэшу, а кэш медиа проверяем без учета в статистике
+    canonical = downloader.resolver.lookup(url)
+    media_id = extract_media_id(canonical, platform) if canonical else None
+    if media_id and media_cache.contains(platform, media_id):
+        return JOB_COSTS['cached']
+    return JOB_COSTS[guess_media_type(url, platform) or 'unknown']
+
+def process_url(user_id, url, message_id):
+    """
+    Обрабатывает URL и скачивает медиафайл
+    
+    Returns:
+        str: Результат обработки (success, cached, file_too_large и т.д.)
+    """
+    started = time.monotonic()
+    platform = get_platform(url)
+    result = 'error'
+    try:
+        # Обновляем сообщение о статусе
+        update_status(user_id, message_id, DOWNLOADING_MESSAGE)
+        
+        # Короткие ссылки раскрываем, чтобы кэш и объединение запросов работали по каноническому ID
+        url = downloader.resolver.resolve(url)
         platform = get_platform(url)
-        logging.info(f"Начинаю загрузку медиа из {platform}: {url}")
+        media_id = extract_media_id(url, platform)
         
-        # Скачиваем медиафайл
-        media_info = downloader.download_media(url, user_dir)
+        # Если это медиа уже отправлялось, пересылаем его по file_id
+        cached = media_cache.get(platform, media_id) if media_id else None
+        if cached:
+            logging.info(f"Медиа найдено в кэше: {platform}/{media_id}")
+            if send_cached_media(user_id, platform, cached, message_id):
+                result = 'cached'
+                return result
         
-        if not media_info:
-            logging.warning(f"Не удалось скачать медиа с {platform}: {url}")
-            bot.edit_message_text(
-                chat_id=user_id,
-                message_id=message_id,
-                text=ERROR_DOWNLOAD_FAILED
+        if media_id:
+            # Одновременные запросы одного и того же медиа скачиваются один раз
+            (media, error), shared = inflight.do(
+                (platform, media_id), fetch_and_send, user_id, url, platform, message_id
             )
-            return
+            if shared:
+                logging.info(f"Получен результат параллельной загрузки: {platform}/{media_id}")
+                if media and send_cached_media(user_id, platform, media, message_id):
+                    result = 'shared'
+                    return result
+                if not error:
+                    # Загрузка прошла, но file_id получить не удалось - скачиваем сами
+                    media, error = fetch_and_send(user_id, url, platform, message_id)
+        else:
+            media, error = fetch_and_send(user_id, url, platform, message_id)
+        
+        result = result_of(error)
+        if error:
+            update_status(user_id, message_id, error)
         
+    except FileTooLargeError:
+        # Ни один формат медиа не помещается в лимит - сообщаем об этом, ничего не скачивая
+        result = 'file_too_large'
+        try:
+            update_status(user_id, message_id, ERROR_FILE_TOO_LARGE)
+        except:
+            pass
+    except Exception as e:
+        logging.error(f"Ошибка при обработке URL {url}: {e}")
+        try:
+            update_status(user_id, message_id, ERROR_GENERAL)
+        except:
+            pass
+    finally:
+        STAGE_SECONDS.observe(time.monotonic() - started, stage='total', platform=platform)
+        REQUESTS.inc(platform=platform, result=result)
+        journal.finish(user_id, message_id, result)
+    return result
+
+def update_status(user_id, message_id, text):
+    """Обновляет сообщение о статусе (у ссылок из общего сообщения его нет)"""
+    if message_id is None:
+        return
+    bot.edit_message_text(chat_id=user_id, message_id=message_id, text=text)
+
+def resume_jobs():
+    """Ставит в очередь задания, прерванные предыдущей остановкой процесса"""
+    resumable, expired = journal.unfinished()
+    for job in expired:
+        # Слишком старые задания не продолжаем - пользователь их уже не ждет
+        journal.finish(job['user_id'], job['message_id'], 'expired')
+        if job['job_dir']:
+            storage.release_job(job['job_dir'])
+        try:
+            bot.edit_message_text(chat_id=job['user_id'], message_id=job['message_id'], text=ERROR_GENERAL)
+        except Exception as e:
+            logging.warning(f"Не удалось обновить статус прерванного задания: {e}")
+    
+    for job in resumable:
+        logging.info(f"Продолжаем прерванное задание ({job['state']}): {job['url']}")
+        if submit_job(job['platform'], job['user_id'], job['url'], job['message_id']) is None:
+            journal.finish(job['user_id'], job['message_id'], 'queue_full')
+            try:
+                bot.edit_message_text(chat_id=job['user_id'], message_id=job['message_id'], text=ERROR_QUEUE_FULL)
+            except Exception as e:
+                logging.warning(f"Не удалось обновить статус прерванного задания: {e}")
+    
+    if resumable or expired:
+        logging.info(f"Прерванных заданий: продолжено {len(resumable)}, отменено {len(expired)}")
+    resume_batches()
+
+def resume_batches():
+    """Продолжает обработку сообщений с несколькими ссылками, прерванную остановкой процесса"""
+    resumable, expired = journal.unfinished_batches()
+    for record in expired:
+        # Слишком старые ссылки не продолжаем - отмечаем их прерванными
+        batch = restore_batch(record)
+        for index in batch.pending():
+            batch.finish(index, 'expired')
+        update_batch_status(batch)
+    
+    for record in resumable:
+        batch = restore_batch(record)
+        for index in batch.pending():
+            logging.info(f"Продолжаем прерванную ссылку из общего сообщения: {batch.urls[index]}")
+            submit_batch_item(batch, index, batch.urls[index], batch.platforms[index])
+        update_batch_status(batch)
+    
+    if resumable or expired:
+        logging.info(f"Прерванных сообщений со ссылками: продолжено {len(resumable)}, отменено {len(expired)}")
+
+def restore_batch(record):
+    """Восстанавливает ссылки из одного сообщения по записи журнала"""
+    batch = LinkBatch(record['user_id'], record['urls'], results=record['results'])
+    batch.message_id = record['message_id']
+    return batch
+
+def fetch_and_send(user_id, url, platform, message_id):
+    """
+    Скачивает медиафайл и отправляет его пользователю
+    
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+    """
+    # Задание, прерванное перезапуском, продолжаем с уже скачанными файлами
+    job, media_items = journal.resumable_media(user_id, message_id)
+    if media_items:
+        logging.info(f"Отправляем файлы, скачанные до перезапуска: {url}")
+        try:
+            return resume_upload(user_id, media_items, message_id)
+        finally:
+            storage.release_job(job['job_dir'])
+    if job and job['job_dir']:
+        # Недокачанные файлы прерванной попытки не пригодятся
+        storage.release_job(job['job_dir'])
+    journal.update(user_id, message_id, EXTRACTING)
+    
+    # Сначала пробуем обойтись без сохранения файла на диск
+    direct_info = None
+    if SEND_BY_URL or STREAM_UPLOAD:
+        try:
+            direct_info = downloader.extract_media_url(url)
+        except FileTooLargeError:
+            # Без сжатия отправить такое медиа нельзя
+            if not transcoder:
+                raise
+        if direct_info:
+            result = None
+            if SEND_BY_URL:
+                result = send_by_url(user_id, direct_info, message_id)
+            if result is None and STREAM_UPLOAD:
+                result = send_streamed(user_id, direct_info, message_id)
+            if result is not None:
+                return result
+    
+    # Если места под файл нет, не тратим время на скачивание
+    size_hint = direct_info['file_size'] if direct_info else None
+    if not storage.has_room(size_hint):
+        return None, ERROR_QUEUE_FULL
+    
+    # Для каждого задания создается отдельная директория (небольшие файлы размещаются в памяти)
+    job_dir = storage.job_dir(user_id, size_hint)
+    journal.update(user_id, message_id, EXTRACTING, job_dir=job_dir)
+    try:
+        return download_and_send(user_id, url, platform, job_dir, message_id, direct_info)
+    finally:
+        # Удаляем директорию задания вместе со всеми файлами
+        storage.release_job(job_dir)
+
+def download_and_send(user_id, url, platform, job_dir, message_id, direct_info=None):
+    """
+    Скачивает медиафайл в директорию задания и отправляет его пользователю
+    
+    Args:
+        direct_info: Прямая ссылка на медиа, если она уже извлечена
+            (тогда информация о посте повторно не извлекается)
+    
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+    """
+    logging.info(f"Начинаю загрузку медиа из {platform}: {url}")
+    
+    media_items = downloader.download_direct(direct_info, job_dir) if direct_info else None
+    
+    # Скачиваем медиафайлы, а если они не помещаются в лимит - исходные файлы для сжатия
+    try:
+        if not media_items:
+            media_items = downloader.download_media(url, job_dir)
+    except FileTooLargeError:
+        if not transcoder:
+            raise
+        logging.info(f"Медиа больше лимита, скачиваем его для сжатия: {url}")
+        media_items = downloader.download_media(url, job_dir, TRANSCODE_MAX_SOURCE_SIZE)
+    
+    if not media_items:
+        logging.warning(f"Не удалось скачать медиа с {platform}: {url}")
+        return None, ERROR_DOWNLOAD_FAILED
+    
+    # Элементы подборки, которые не удалось подготовить, пропускаем
+    ready = []
+    error = ERROR_DOWNLOAD_FAILED
+    compressing = False
+    for media_info in media_items:
         # Проверяем наличие файла
         file_path = media_info.get('file_path', '')
         if not file_path or not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
             logging.warning(f"Файл не найден или пуст: {file_path}")
-            bot.edit_message_text(
-                chat_id=user_id,
-                message_id=message_id,
-                text=ERROR_DOWNLOAD_FAILED
-            )
-            return
+            continue
         
-        logging.info(f"Успешно скачан файл: {file_path} (тип: {media_info.get('file_type', 'unknown')})")
+        # Берем файл в аренду, чтобы его не удалили до окончания отправки
+        if not storage.track(file_path):
+            error = ERROR_QUEUE_FULL
+            continue
         
-        # Отправляем скачанный файл
-        send_media_file(user_id, media_info, message_id)
+        logging.info(f"Успешно скачан файл: {file_path} (тип: {media_info.get('file_type', 'unknown')})")
         
-    except Exception as e:
-        logging.error(f"Ошибка при обработке URL {url}: {e}")
-        try:
-            bot.edit_message_text(
-                chat_id=user_id,
-                message_id=message_id,
-                text=ERROR_GENERAL
+        # Слишком большой файл сжимаем до лимита Telegram
+        if transcoder and transcoder.needs_transcode(media_info):
+            if not compressing:
+                update_status(user_id, message_id, COMPRESSING_MESSAGE)
+                compressing = True
+            with STAGE_SECONDS.time(stage='transcode', platform=platform):
+                compressed = transcoder.fit(media_info)
+            storage.release(file_path)
+            if not compressed:
+                error = ERROR_FILE_TOO_LARGE
+                continue
+            if not storage.track(compressed['file_path']):
+                error = ERROR_QUEUE_FULL
+                continue
+            media_info = compressed
+        ready.append(media_info)
+    
+    if not ready:
+        return None, error
+    # Неполную подборку отправляем, но не кэшируем под идентификатором всего поста
+    mark_partial(ready, media_items)
+    journal.update(user_id, message_id, DOWNLOADED, media=ready)
+    
+    # Отправляем скачанные файлы
+    return send_media_file(user_id, ready, message_id)
+
+def resume_upload(user_id, media_items, message_id):
+    """
+    Отправляет файлы, скачанные до перезапуска процесса
+    
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+    """
+    # Берем файлы в аренду заново - после перезапуска менеджер о них не знает
+    ready = [media_info for media_info in media_items if storage.track(media_info['file_path'])]
+    if not ready:
+        return None, ERROR_QUEUE_FULL
+    mark_partial(ready, media_items)
+    return send_media_file(user_id, ready, message_id)
+
+def send_by_url(user_id, media_info, message_id):
+    """
+    Отправляет медиа по прямой ссылке, чтобы Telegram скачал его сам
+    
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+               или None, если медиа нужно передать самостоятельно
+    """
+    file_type = media_info['file_type']
+    file_size = media_info['file_size']
+    max_size = URL_UPLOAD_MAX_PHOTO_SIZE if file_type == 'image' else URL_UPLOAD_MAX_SIZE
+    if not file_size or file_size > max_size:
+        logging.info(f"Размер файла неизвестен или слишком велик для отправки по ссылке: {file_size}")
+        return None
+    
+    platform = media_info['platform']
+    caption = f"{MEDIA_CAPTION} | {platform.capitalize()}"
+    try:
+        with STAGE_SECONDS.time(stage='upload_url', platform=platform):
+            response = send_media(user_id, file_type, media_info['media_url'], caption)
+    except telebot.apihelper.ApiException as e:
+        logging.warning(f"Telegram не принял ссылку на медиа, передаем сами: {e}")
+        return None
+    logging.info(f"Медиа отправлено по прямой ссылке пользователю {user_id}")
+    
+    update_status(user_id, message_id, SUCCESS_MESSAGE)
+    return remember_media([media_info], [response]), None
+
+def send_streamed(user_id, media_info, message_id):
+    """
+    Передает медиа из CDN в Telegram потоком, не сохраняя файл на диск
+    
+    Returns:
+        tuple: (информация об отправленном медиа с file_id, текст ошибки)
+               или None, если медиа нужно скачать на диск и отправить заново
+    """
+    platform = media_info['platform']
+    file_type = media_info['file_type']
+    file_name = f"{platform}_{media_info['media_id']}{get_file_extension(file_type)}"
+    caption = f"{MEDIA_CAPTION} | {platform.capitalize()}"
+    try:
+        with STAGE_SECONDS.time(stage='stream', platform=platform):
+            response = uploader.upload(
+                user_id,
+                media_info['media_url'],
+                file_type,
+                sanitize_filename(file_name),
+                caption,
+                headers=media_info.get('http_headers')
             )
-        except:
-            pass
+    except StreamingError as e:
+        # Если файл можно сжать, скачиваем его на диск
+        if e.reason == 'file_too_large' and not transcoder:
+            logging.warning(f"Файл слишком большой для отправки: {media_info['media_url']}")
+            return None, ERROR_FILE_TOO_LARGE
+        logging.warning(f"Потоковая передача не удалась ({e.reason}), скачиваем файл на диск")
+        return None
+    except Exception as e:
+        logging.warning(f"Потоковая передача не удалась, скачиваем файл на диск: {e}")
+        return None
+    logging.info(f"Медиа передано потоком пользователю {user_id}")
+    
+    update_status(user_id, message_id, SUCCESS_MESSAGE)
+    return remember_media([media_info], [response]), None
 
-def send_media_file(user_id, media_info, message_id):
-    """Отправляет медиафайл пользователю"""
+def mark_partial(ready, media_items):
+    """Отмечает файлы подборки, если часть ее элементов подготовить не удалось"""
+    if len(ready) < len(media_items):
+        for media_info in ready:
+            media_info['partial'] = True
+
+def remember_media(media_items, responses):
+    """
+    Запоминает file_id отправленных медиа, чтобы не скачивать их повторно
+    
+    Неполные подборки (отмеченные partial) в кэш не попадают.
+    
+    Args:
+        media_items: Информация об отправленных медиа
+        responses: Ответы Telegram в том же порядке
+    
+    Returns:
+        list: Типы и file_id отправленных медиа или None
+    """
+    media = []
+    for media_info, response in zip(media_items, responses):
+        file_id = get_file_id(response)
+        if not file_id:
+            return None
+        media.append({
+            'file_type': media_info['file_type'],
+            'file_id': file_id
+        })
+    first = media_items[0]
+    if first.get('media_id') and not any(media_info.get('partial') for media_info in media_items):
+        media_cache.put(first['platform'], first['media_id'], media)
+    return media
+
+def send_media_file(user_id, media_items, message_id):
+    """
+    Отправляет скачанные медиафайлы пользователю
+    
+    Returns:
+        tuple: (информация об отправленных медиа с file_id, текст ошибки)
+    """
     try:
-        file_path = media_info['file_path']
-        file_type = media_info['file_type']
-        platform = media_info['platform']
+        platform = media_items[0]['platform']
+        journal.update(user_id, message_id, UPLOADING)
         
-        # К этому моменту мы уже проверили существование файла в process_url
+        # К этому моменту мы уже проверили существование файлов в download_and_send
         # Формируем подпись для медиафайла
         caption = f"{MEDIA_CAPTION} | {platform.capitalize()}"
         
         # Обновляем сообщение о статусе
-        bot.edit_message_text(
-            chat_id=user_id,
-            message_id=message_id,
-            text=SUCCESS_MESSAGE
-        )
+        update_status(user_id, message_id, SUCCESS_MESSAGE if len(media_items) == 1 else MULTIPLE_MEDIA_FOUND)
         
-        file_size_kb = os.path.getsize(file_path) / 1024
-        logging.info(f"Отправляю файл пользователю {user_id}: {file_path} (размер: {file_size_kb:.2f} КБ, тип: {file_type})")
-        
-        # Отправляем медиафайл в зависимости от типа
-        with open(file_path, 'rb') as file:
-            if file_type == 'video':
-                response = bot.send_video(
-                    user_id,
-                    file,
-                    caption=caption,
-                    supports_streaming=True
-                )
-                logging.info(f"Видео успешно отправлено")
-            elif file_type == 'image':
-                response = bot.send_photo(
-                    user_id,
-                    file,
-                    caption=caption
-                )
-                logging.info(f"Изображение успешно отправлено")
-            elif file_type == 'gif':
-                response = bot.send_animation(
-                    user_id,
-                    file,
-                    caption=caption
-                )
-                logging.info(f"GIF успешно отправлен")
-            else:
-                # Если неизвестный тип, пробуем отправить как документ
-                response = bot.send_document(
-                    user_id,
-                    file,
-                    caption=caption
-                )
-                logging.info(f"Документ успешно отправлен")
-        
-        # Удаляем файл после отправки
-        try:
-            os.remove(file_path)
-            logging.info(f"Файл удален: {file_path}")
-        except Exception as e:
-            logging.warning(f"Не удалось удалить файл: {file_path} ({e})")
+        with ExitStack() as stack:
+            items = []
+            for media_info in media_items:
+                file_path = media_info['file_path']
+                file_type = media_info['file_type']
+                file_size_kb = os.path.getsize(file_path) / 1024
+                logging.info(f"Отправляю файл пользователю {user_id}: {file_path} (размер: {file_size_kb:.2f} КБ, тип: {file_type})")
+                storage.touch(file_path)
+                items.append((file_type, stack.enter_context(open(file_path, 'rb'))))
+            
+            # Отправляем медиафайлы в зависимости от типа (несколько - альбомами)
+            with STAGE_SECONDS.time(stage='upload', platform=platform):
+                responses = send_media_items(user_id, items, caption)
+        logging.info(f"Медиафайлы успешно отправлены ({len(media_items)} шт.)")
+        
+        if len(media_items) > 1:
+            update_status(user_id, message_id, SUCCESS_MESSAGE)
+        
+        # Запоминаем file_id, чтобы не скачивать это медиа повторно
+        media = remember_media(media_items, responses)
+        return media, None
         
     except telebot.apihelper.ApiException as e:
         logging.error(f"Ошибка Telegram API при отправке файла: {e}")
         if "Request Entity Too Large" in str(e):
-            bot.edit_message_text(
-                chat_id=user_id,
-                message_id=message_id,
-                text=ERROR_FILE_TOO_LARGE
-            )
-        else:
-            bot.edit_message_text(
-                chat_id=user_id,
-                message_id=message_id,
-                text=ERROR_GENERAL
-            )
+            return None, ERROR_FILE_TOO_LARGE
+        return None, ERROR_GENERAL
     except Exception as e:
         logging.error(f"Ошибка при отправке медиафайла: {e}")
-        bot.edit_message_text(
-            chat_id=user_id,
-            message_id=message_id,
-            text=ERROR_GENERAL
-        )
+        return None, ERROR_GENERAL
+
+def send_media(user_id, file_type, media, caption):
+    """
+    Отправляет медиа в зависимости от типа
+    
+    Args:
+        user_id: Идентификатор пользователя
+        file_type: Тип медиа (video, image, gif)
+        media: Открытый файл, file_id или URL
+        caption: Подпись
+        
+    Returns:
+        Message: Ответ Telegram на отправку
+    """
+    if file_type == 'video':
+        return bot.send_video(user_id, media, caption=caption, supports_streaming=True)
+    elif file_type == 'image':
+        return bot.send_photo(user_id, media, caption=caption)
+    elif file_type == 'gif':
+        return bot.send_animation(user_id, media, caption=caption)
+    # Если неизвестный тип, пробуем отправить как документ
+    return bot.send_document(user_id, media, caption=caption)
+
+def send_media_items(user_id, items, caption):
+    """
+    Отправляет несколько медиа, объединяя фото и видео в альбомы
+    
+    Args:
+        user_id: Идентификатор пользователя
+        items: Список пар (тип медиа, открытый файл или file_id)
+        caption: Подпись (добавляется к первому сообщению)
+        
+    Returns:
+        list: Сообщения Telegram в порядке items
+    """
+    responses = [None] * len(items)
+    for group in plan_media_groups([file_type for file_type, _ in items]):
+        if len(group) == 1:
+            index = group[0]
+            responses[index] = send_media(user_id, items[index][0], items[index][1], caption)
+        else:
+            # Подпись альбома - подпись его первого элемента
+            album = [
+                types.InputMediaVideo(items[index][1], supports_streaming=True)
+                if items[index][0] == 'video' else
+                types.InputMediaPhoto(items[index][1])
+                for index in group
+            ]
+            album[0].caption = caption
+            for index, response in zip(group, bot.send_media_group(user_id, album)):
+                responses[index] = response
+        caption = None
+    return responses
+
+def send_cached_media(user_id, platform, cached, message_id):
+    """
+    Отправляет ранее загруженное медиа по file_id
+    
+    Returns:
+        bool: True, если медиа отправлено, False если нужно скачивать заново
+    """
+    caption = f"{MEDIA_CAPTION} | {platform.capitalize()}"
+    # Записи, сохраненные до поддержки подборок, содержат одно медиа
+    if isinstance(cached, dict):
+        cached = [cached]
+    try:
+        send_media_items(user_id, [(media['file_type'], media['file_id']) for media in cached], caption)
+        logging.info(f"Медиа отправлено из кэша пользователю {user_id}")
+        update_status(user_id, message_id, SUCCESS_MESSAGE)
+        return True
+    except telebot.apihelper.ApiException as e:
+        logging.warning(f"Не удалось отправить медиа по file_id, скачиваем заново: {e}")
+        return False
+
+def collect_metrics():
+    """Обновляет метрики текущего состояния перед их чтением"""
+    ACTIVE_JOBS.set(scheduler.active_jobs())
+    QUEUE_DEPTH.set(job_queue.pending() if job_queue else scheduler.queue_size())
+    storage_stats = storage.stats()
+    TEMP_BYTES.set(storage_stats['used_bytes'] - storage_stats['memory_bytes'], location='disk')
+    TEMP_BYTES.set(storage_stats['memory_bytes'], location='memory')
+    observe_stats('storage', storage_stats)
+    observe_stats('media_cache', media_cache.stats())
+    observe_stats('journal', journal.stats())
+    observe_stats('inline', inline_index.stats())
+    if transcoder:
+        observe_stats('transcoder', transcoder.stats())
+    observe_pool_stats(pool_stats())
+
+REGISTRY.add_collector(collect_metrics)
 
 # Запускаем периодическую очистку временных файлов
 def cleanup_scheduler():
     while True:
         try:
             time.sleep(3600)  # Очистка каждый час
-            cleanup_temp_files()
+            storage.sweep()
+            media_cache.purge()
+            journal.purge()
+            logging.info(f"Статистика кэша медиа: {media_cache.stats()}")
+            logging.info(f"Использование временных файлов: {storage.stats()}")
+            if transcoder:
+                logging.info(f"Статистика сжатия медиа: {transcoder.stats()}")
+            logging.info(f"Статистика пулов HTTP соединений: {pool_stats()}")
         except Exception as e:
             logging.error(f"Ошибка при плановой очистке файлов: {e}")
 
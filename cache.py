@@ -0,0 +1,180 @@
+import json
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import CACHE_DB_PATH, CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_MEMORY_ENTRIES
+
+
+class MediaCache:
+    """
+    Кэш file_id уже отправленных медиафайлов
+
+    Записи хранятся в SQLite, а самые популярные дополнительно держатся
+    в памяти (LRU). Ключ записи - пара (платформа, ID медиа).
+    """
+
+    def __init__(self, db_path=CACHE_DB_PATH, ttl=CACHE_TTL,
+                 max_entries=CACHE_MAX_ENTRIES, memory_entries=CACHE_MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS media_cache ("
+            "platform TEXT NOT NULL, "
+            "media_id TEXT NOT NULL, "
+            "media TEXT NOT NULL, "
+            "created_at REAL NOT NULL, "
+            "accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (platform, media_id))"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS media_cache_accessed ON media_cache (accessed_at)"
+        )
+        self.conn.commit()
+
+    def get(self, platform, media_id):
+        """
+        Возвращает сохраненную информацию о медиа
+
+        Args:
+            platform: Платформа
+            media_id: Идентификатор медиа
+
+        Returns:
+            dict: Информация с file_id или None, если записи нет или она устарела
+        """
+        key = (platform, media_id)
+        now = time.time()
+
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry:
+                created_at, media = entry
+                if now - created_at < self.ttl:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                    return media
+                del self.memory[key]
+
+            try:
+                row = self.conn.execute(
+                    "SELECT media, created_at FROM media_cache WHERE platform = ? AND media_id = ?",
+                    key
+                ).fetchone()
+                if row and now - row[1] >= self.ttl:
+                    self.conn.execute(
+                        "DELETE FROM media_cache WHERE platform = ? AND media_id = ?", key
+                    )
+                    self.conn.commit()
+                    row = None
+                if row:
+                    self.conn.execute(
+                        "UPDATE media_cache SET accessed_at = ? WHERE platform = ? AND media_id = ?",
+                        (now, platform, media_id)
+                    )
+                    self.conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка чтения кэша медиа: {e}")
+                row = None
+
+            if not row:
+                self.misses += 1
+                return None
+
+            media = json.loads(row[0])
+            self._remember(key, row[1], media)
+            self.hits += 1
+            return media
+
+    def contains(self, platform, media_id):
+        """
+        Проверяет наличие актуальной записи, не меняя счетчики и порядок LRU
+
+        Используется для оценок (например, стоимости задачи в планировщике),
+        чтобы не учитывать один запрос в статистике дважды.
+        """
+        key = (platform, media_id)
+        now = time.time()
+
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                return True
+            try:
+                row = self.conn.execute(
+                    "SELECT 1 FROM media_cache WHERE platform = ? AND media_id = ? AND created_at > ?",
+                    (platform, media_id, now - self.ttl)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка чтения кэша медиа: {e}")
+                return False
+            return row is not None
+
+    def put(self, platform, media_id, media):
+        """Сохраняет информацию об отправленном медиа (file_id и тип)"""
+        key = (platform, media_id)
+        now = time.time()
+
+        with self.lock:
+            self._remember(key, now, media)
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO media_cache "
+                    "(platform, media_id, media, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (platform, media_id, json.dumps(media), now, now)
+                )
+                self.conn.commit()
+                self.puts += 1
+                # Проверка размера не нужна на каждую запись
+                if self.puts % 100 == 0:
+                    self._evict(now)
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка записи в кэш медиа: {e}")
+
+    def purge(self):
+        """Удаляет устаревшие записи и лишние записи сверх лимита"""
+        with self.lock:
+            try:
+                self._evict(time.time())
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка при очистке кэша медиа: {e}")
+
+    def stats(self):
+        """Возвращает счетчики попаданий и промахов кэша"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'memory_entries': len(self.memory),
+            }
+
+    def _remember(self, key, created_at, media):
+        """Помещает запись в LRU в памяти"""
+        self.memory[key] = (created_at, media)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict(self, now):
+        """Удаляет устаревшие записи и самые давно использованные сверх лимита"""
+        self.conn.execute("DELETE FROM media_cache WHERE created_at < ?", (now - self.ttl,))
+        count = self.conn.execute("SELECT COUNT(*) FROM media_cache").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM media_cache WHERE rowid IN ("
+                "SELECT rowid FROM media_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+        self.conn.commit()
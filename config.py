@@ -6,6 +6,28 @@ TOKEN = '7941732919:AAHtDbkfbcsat4q2Kgum2KeZVFRbSYNxXes'
 # Максимальное количество скачиваний в минуту для одного пользователя
 RATE_LIMIT = 5
 
+# Период, к которому относятся лимиты запросов (в секундах)
+RATE_LIMIT_PERIOD = 60
+
+# Максимальное количество скачиваний в минуту с каждой платформы для всего бота
+PLATFORM_RATE_LIMITS = {
+    "instagram": 300,
+    "tiktok": 300,
+    "pinterest": 300,
+}
+
+# Максимальное количество скачиваний в минуту для всего бота (None - без ограничения)
+GLOBAL_RATE_LIMIT = 600
+
+# Где хранятся лимиты: "memory" - в процессе, "sqlite" - общие для нескольких процессов
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+# Файл базы данных лимитов для хранилища "sqlite"
+RATE_LIMIT_DB_PATH = "rate_limits.db"
+
+# Максимальное количество отслеживаемых ключей в памяти
+RATE_LIMIT_MAX_KEYS = 2000000
+
 # Максимальный размер файла для отправки (в байтах)
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 
@@ -15,10 +37,26 @@ TEMP_DIR = "downloads"
 # Время жизни временных файлов (в секундах)
 TEMP_FILE_TTL = 3600  # 1 час
 
+# Максимальный общий объем временных файлов (в байтах)
+STORAGE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 ГБ
+
+# Сколько секунд после последнего использования файл нельзя вытеснить
+STORAGE_MIN_LEASE = 300  # 5 минут
+
+# Директория в памяти (tmpfs) для небольших файлов, None - не использовать
+STORAGE_MEMORY_DIR = "/dev/shm/media_bot"
+
+# Максимальный размер файла, который размещается в памяти (в байтах)
+STORAGE_MEMORY_MAX_FILE = 5 * 1024 * 1024  # 5 МБ
+
+# Максимальный общий объем файлов в памяти (в байтах)
+STORAGE_MEMORY_MAX_BYTES = 256 * 1024 * 1024  # 256 МБ
+
 # Поддерживаемые платформы и их домены
 SUPPORTED_PLATFORMS = {
     "instagram": ["instagram.com", "www.instagram.com", "instagr.am"],
-    "tiktok": ["tiktok.com", "www.tiktok.com", "vm.tiktok.com", "vt.tiktok.com", "m.tiktok.com"]
+    "tiktok": ["tiktok.com", "www.tiktok.com", "vm.tiktok.com", "vt.tiktok.com", "m.tiktok.com"],
+    "pinterest": ["pinterest.com", "www.pinterest.com", "pin.it"]
 }
 
 # Таймаут для HTTP запросов (в секундах)
@@ -29,3 +67,247 @@ MAX_RETRIES = 3
 
 # Задержка между попытками (в секундах)
 RETRY_DELAY = 2
+
+# Максимальная задержка между повторными попытками (в секундах)
+RETRY_MAX_DELAY = 30
+
+# Количество параллельных сегментов при скачивании большого файла
+DOWNLOAD_SEGMENTS = 4
+
+# Минимальный размер одного сегмента (в байтах)
+DOWNLOAD_SEGMENT_MIN_SIZE = 2 * 1024 * 1024  # 2 МБ
+
+# Общее количество потоков, скачивающих сегменты
+DOWNLOAD_WORKERS = 16
+
+# Минимальный и максимальный размер части при чтении ответа (в байтах)
+DOWNLOAD_CHUNK_MIN = 64 * 1024
+DOWNLOAD_CHUNK_MAX = 1024 * 1024
+
+# Максимальное количество соединений с одним хостом в общем пуле HTTP
+HTTP_POOL_SIZE = 32
+
+# Размер пула для отдельных хостов (с поддоменами)
+HTTP_POOL_HOST_SIZES = {
+    "api.telegram.org": 64,
+}
+
+# Максимальное количество хостов, для которых хранятся пулы соединений
+HTTP_POOL_HOSTS = 64
+
+# Максимальное время ожидания свободного соединения в пуле (в секундах)
+HTTP_POOL_TIMEOUT = 30
+
+# Через сколько секунд простоя соединения отправляются TCP keep-alive пакеты
+HTTP_KEEPALIVE_IDLE = 60
+
+# Время хранения результатов DNS запросов (в секундах)
+DNS_CACHE_TTL = 300
+
+# Максимальное количество записей в кэше DNS
+DNS_CACHE_SIZE = 1024
+
+# Файл базы данных кэша file_id отправленных медиафайлов
+CACHE_DB_PATH = "media_cache.db"
+
+# Время жизни записи в кэше file_id (в секундах)
+CACHE_TTL = 30 * 24 * 3600  # 30 дней
+
+# Максимальное количество записей в кэше file_id
+CACHE_MAX_ENTRIES = 100000
+
+# Количество записей кэша, которые держатся в памяти
+CACHE_MEMORY_ENTRIES = 5000
+
+# Количество рабочих потоков, обрабатывающих ссылки
+WORKER_COUNT = 8
+
+# Максимальное количество ссылок, ожидающих обработки в очереди
+QUEUE_MAX_SIZE = 200
+
+# Максимальное количество одновременных загрузок для каждой платформы
+PLATFORM_CONCURRENCY = {
+    "instagram": 4,
+    "tiktok": 4,
+    "pinterest": 4
+}
+
+# Максимальное количество ссылок, которые обрабатываются из одного сообщения
+MAX_LINKS_PER_MESSAGE = 10
+
+# Оценка стоимости обработки ссылки для планировщика (условные единицы):
+# медиа из кэша file_id, изображение, неизвестный тип, видео
+JOB_COSTS = {
+    "cached": 1,
+    "image": 2,
+    "unknown": 5,
+    "video": 10
+}
+
+# Задания не дороже этой оценки (кэш, изображения) выполняются раньше остальных
+SCHEDULER_CHEAP_COST = 2
+
+# Квант справедливой очереди: сколько единиц стоимости получает пользователь за круг
+SCHEDULER_QUANTUM = 10
+
+# Telegram ID администраторов, ссылки которых обрабатываются в первую очередь
+ADMIN_IDS = {int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id.strip()}
+
+# Роль процесса: "all" - прием обновлений и обработка ссылок в одном процессе,
+# "ingest" - только прием обновлений в общую очередь заданий, "worker" - только обработка
+BOT_ROLE = os.getenv("BOT_ROLE", "all")
+
+# Файл базы данных общей очереди заданий (для нескольких узлов - на общем диске)
+JOB_QUEUE_DB_PATH = os.getenv("JOB_QUEUE_DB_PATH", "jobs.db")
+
+# Максимальное количество заданий, ожидающих обработки в общей очереди
+JOB_QUEUE_MAX_PENDING = 5000
+
+# Время аренды задания рабочим процессом (в секундах), продлевается пока задание выполняется
+JOB_LEASE_SECONDS = 120
+
+# Максимальное количество попыток выполнения задания (после аварийных остановок процессов)
+JOB_MAX_ATTEMPTS = 3
+
+# Интервал опроса общей очереди, когда в ней нет заданий (в секундах)
+JOB_POLL_INTERVAL = 0.25
+
+# Время хранения выполненных заданий в базе (в секундах)
+JOB_RETENTION = 24 * 3600
+
+# Количество рабочих процессов, которые процесс с ролью "ingest" запускает на своем узле
+QUEUE_LOCAL_WORKERS = int(os.getenv("QUEUE_LOCAL_WORKERS", "0"))
+
+# Файл базы данных журнала заданий (этапы обработки ссылок, чтобы продолжить их после перезапуска)
+JOURNAL_DB_PATH = os.getenv("JOURNAL_DB_PATH", "journal.db")
+
+# Максимальный возраст прерванного задания, которое продолжается после перезапуска (в секундах)
+JOURNAL_RESUME_MAX_AGE = TEMP_FILE_TTL
+
+# Время хранения завершенных заданий в журнале (в секундах)
+JOURNAL_RETENTION = 24 * 3600
+
+# Количество процессов, выполняющих загрузки через yt-dlp
+YTDLP_WORKERS = 4
+
+# Максимальное время одной загрузки через yt-dlp (в секундах)
+YTDLP_TIMEOUT = 300
+
+# Политика выбора формата yt-dlp: "quality" - лучшее качество в пределах
+# MAX_FILE_SIZE, "size" - самый маленький файл
+FORMAT_POLICY = os.getenv("FORMAT_POLICY", "quality")
+
+# Запас для приблизительного размера формата (оценка делится на это значение)
+FORMAT_SIZE_MARGIN = 0.9
+
+# Сжимать медиа, которое не помещается в лимит (нужен ffmpeg)
+TRANSCODE_ENABLED = os.getenv("TRANSCODE_ENABLED", "1") == "1"
+
+# Количество одновременно работающих процессов ffmpeg
+TRANSCODE_WORKERS = 2
+
+# Максимальное количество файлов, ожидающих сжатия
+TRANSCODE_QUEUE_SIZE = 10
+
+# Максимальное время сжатия одного файла с учетом очереди (в секундах)
+TRANSCODE_TIMEOUT = 600
+
+# Максимальный размер исходного файла, который скачивается для сжатия (в байтах)
+TRANSCODE_MAX_SOURCE_SIZE = 300 * 1024 * 1024  # 300 МБ
+
+# Битрейт звука в сжатом видео (кбит/с)
+TRANSCODE_AUDIO_BITRATE = 96
+
+# Минимальный битрейт видео (кбит/с), ниже которого сжимать нет смысла
+TRANSCODE_MIN_VIDEO_BITRATE = 150
+
+# Изображения больше этого размера пересжимаются (лимит Telegram для фото)
+TRANSCODE_IMAGE_MAX_SIZE = 10 * 1024 * 1024  # 10 МБ
+
+# Количество потоков одного процесса ffmpeg
+TRANSCODE_FFMPEG_THREADS = 2
+
+# Отправлять медиа по прямой ссылке, чтобы Telegram скачал его сам
+SEND_BY_URL = True
+
+# Ограничения Telegram на размер файлов, отправляемых по ссылке (в байтах)
+URL_UPLOAD_MAX_SIZE = 20 * 1024 * 1024  # 20 MB
+URL_UPLOAD_MAX_PHOTO_SIZE = 5 * 1024 * 1024  # 5 MB
+
+# Передавать файлы из CDN в Telegram потоком, не сохраняя их на диск
+STREAM_UPLOAD = True
+
+# Размер части файла при потоковой передаче (в байтах)
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Таймаут ожидания ответа Telegram на загрузку файла (в секундах)
+UPLOAD_TIMEOUT = 300
+
+# Максимальное количество медиа в одном альбоме (ограничение send_media_group)
+MEDIA_GROUP_SIZE = 10
+
+# Количество потоков для параллельного скачивания элементов подборок (карусели, слайдшоу)
+DOWNLOAD_ITEM_WORKERS = 8
+
+# Включить HTTP сервер с метриками в формате Prometheus
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Адрес и порт сервера метрик (по умолчанию доступен только локально)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# Границы корзин гистограмм длительности этапов (в секундах)
+METRICS_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+# Режим работы бота: "sync" (потоки) или "async" (asyncio)
+BOT_RUNTIME = os.getenv("BOT_RUNTIME", "sync")
+
+# Максимальное количество одновременно выполняемых задач в режиме asyncio
+ASYNC_MAX_JOBS = 500
+
+# Максимальное количество задач в обработке (включая ожидающие) в режиме asyncio
+ASYNC_MAX_PENDING = 5000
+
+# Способ получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Адрес и порт встроенного HTTP сервера для вебхука
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+
+# Путь, на который Telegram отправляет обновления
+WEBHOOK_PATH = "/webhook"
+
+# Публичный адрес вебхука (например, https://example.com/webhook)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+
+# Секретный токен для проверки запросов от Telegram
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Максимальный размер тела запроса к вебхуку (в байтах)
+WEBHOOK_MAX_BODY = 1024 * 1024
+
+# Типы обновлений, которые обрабатывает бот
+ALLOWED_UPDATES = ["message", "inline_query"]
+
+# Чат (например, закрытый канал с ботом), в который загружаются медиа для
+# inline-режима, чтобы получить их file_id; None - без фоновой загрузки
+INLINE_CACHE_CHAT_ID = int(os.getenv("INLINE_CACHE_CHAT_ID", "0")) or None
+
+# Время, на которое Telegram запоминает ответ на inline-запрос с медиа (в секундах)
+INLINE_CACHE_TIME = 3600
+
+# Сколько секунд фоновая загрузка медиа для inline-запроса не запускается повторно
+INLINE_PREFETCH_TTL = 300
+
+# Время хранения раскрытых коротких ссылок (в секундах)
+SHORT_LINK_CACHE_TTL = 24 * 3600  # 1 день
+
+# Максимальное количество раскрытых коротких ссылок в кэше
+SHORT_LINK_CACHE_SIZE = 10000
+
+# Размер части страницы Pinterest при потоковом чтении (в байтах)
+PINTEREST_CHUNK_SIZE = 16 * 1024
+
+# Максимальный объем страницы Pinterest, который просматривается при поиске медиа (в байтах)
+PINTEREST_MAX_PAGE_BYTES = 2 * 1024 * 1024  # 2 МБ
@@ -6,10 +6,16 @@ import requests
 import random
 import string
 from urllib.parse import urlparse
-import subprocess
 import json
-from config import MAX_RETRIES, RETRY_DELAY, REQUEST_TIMEOUT, MAX_FILE_SIZE
+from concurrent.futures import ThreadPoolExecutor
+from config import REQUEST_TIMEOUT, MAX_FILE_SIZE, PINTEREST_CHUNK_SIZE, DOWNLOAD_ITEM_WORKERS
 from utils import get_platform, extract_media_id, get_file_extension, sanitize_filename
+from ytdlp_engine import YtdlpEngine, YtdlpError
+from resolver import ShortLinkResolver
+from segmented import SegmentedDownloader, DownloadError
+from pinterest import PinterestPageScanner
+from http_pool import create_session
+from metrics import STAGE_SECONDS, DOWNLOAD_ERRORS
 
 # Заголовки для имитации браузера
 HEADERS = {
@@ -22,37 +28,82 @@ HEADERS = {
     'sec-ch-ua-platform': '"Windows"',
 }
 
+# Опции yt-dlp для Instagram (поддерживает Instagram без авторизации)
+INSTAGRAM_OPTIONS = {}
+
+# Опции yt-dlp для TikTok
+TIKTOK_OPTIONS = {
+    'http_headers': {
+        'User-Agent': HEADERS['User-Agent'],
+        'Referer': 'https://www.tiktok.com/',
+        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+    }
+}
+
+# Альтернативные опции yt-dlp для TikTok, если основные не сработали
+TIKTOK_FALLBACK_OPTIONS = {
+    'format': 'best',
+    'nocheckcertificate': True,
+}
+
+# Опции yt-dlp для Pinterest
+PINTEREST_OPTIONS = {}
+
+# Основные опции yt-dlp для каждой платформы
+YTDLP_OPTIONS = {
+    'instagram': INSTAGRAM_OPTIONS,
+    'tiktok': TIKTOK_OPTIONS,
+    'pinterest': PINTEREST_OPTIONS,
+}
+
+class FileTooLargeError(Exception):
+    """Медиа не помещается в допустимый размер ни в одном из доступных форматов"""
+
+
 class MediaDownloader:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update(HEADERS)
+        self.session = create_session(HEADERS)
+        self.engine = YtdlpEngine()
+        self.resolver = ShortLinkResolver(self.session)
+        self.fetcher = SegmentedDownloader(self.session)
+        self.item_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_ITEM_WORKERS, thread_name_prefix="item")
     
-    def download_media(self, url, save_dir):
+    def download_media(self, url, save_dir, max_size=MAX_FILE_SIZE):
         """
-        Скачивает медиафайл с указанного URL
+        Скачивает медиафайлы с указанного URL
         
         Args:
             url: URL медиафайла
             save_dir: Директория для сохранения
+            max_size: Максимальный размер файла (больше MAX_FILE_SIZE - для последующего сжатия)
             
         Returns:
-            dict: Информация о скачанном файле или None в случае ошибки
+            list: Информация о скачанных файлах (для подборок - о каждом элементе)
+                  или None в случае ошибки
+            
+        Raises:
+            FileTooLargeError: Если медиа больше max_size
         """
+        # Короткие ссылки раскрываем, чтобы работать с каноническим URL и ID
+        url = self.resolver.resolve(url)
         platform = get_platform(url)
         if not platform:
             logging.error(f"Неподдерживаемая платформа: {url}")
             return None
         
         try:
-            if platform == 'instagram':
-                return self._download_instagram(url, save_dir)
-            elif platform == 'tiktok':
-                return self._download_tiktok(url, save_dir)
-            elif platform == 'pinterest':
-                return self._download_pinterest(url, save_dir)
-            else:
-                logging.error(f"Неподдерживаемая платформа: {platform}")
-                return None
+            with STAGE_SECONDS.time(stage='download', platform=platform):
+                if platform == 'instagram':
+                    return self._download_instagram(url, save_dir, max_size)
+                elif platform == 'tiktok':
+                    return self._download_tiktok(url, save_dir, max_size)
+                elif platform == 'pinterest':
+                    return self._download_pinterest(url, save_dir, max_size)
+                else:
+                    logging.error(f"Неподдерживаемая платформа: {platform}")
+                    return None
+        except FileTooLargeError:
+            raise
         except Exception as e:
             logging.error(f"Ошибка при скачивании медиа: {e}")
             return None
@@ -65,102 +116,281 @@ class MediaDownloader:
         filename = f"{platform}_{media_id}_{timestamp}_{random_string}{extension}"
         return sanitize_filename(filename)
     
-    def _download_file(self, url, save_path):
-        """Скачивает файл по URL и сохраняет по указанному пути"""
-        for attempt in range(MAX_RETRIES):
-            try:
-                response = self.session.get(url, stream=True, timeout=REQUEST_TIMEOUT)
-                response.raise_for_status()
-                
-                # Проверяем размер файла
-                content_length = int(response.headers.get('Content-Length', 0))
-                if content_length > MAX_FILE_SIZE:
-                    logging.warning(f"Файл слишком большой: {content_length} байт")
-                    return False, "file_too_large"
-                
-                with open(save_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                
-                # Проверяем размер скачанного файла
-                file_size = os.path.getsize(save_path)
-                if file_size > MAX_FILE_SIZE:
-                    os.remove(save_path)
-                    logging.warning(f"Скачанный файл слишком большой: {file_size} байт")
-                    return False, "file_too_large"
-                
-                if file_size == 0:
-                    os.remove(save_path)
-                    logging.warning("Скачан пустой файл")
-                    return False, "empty_file"
-                
-                return True, None
+    def extract_media_url(self, url):
+        """
+        Извлекает прямую ссылку на медиа без скачивания файла
+        
+        Args:
+            url: URL поста
+            
+        Returns:
+            dict: Информация о медиа с прямой ссылкой (media_url), размером
+                  (file_size, None если неизвестен) и заголовками для запроса
+                  к CDN (http_headers) или None
             
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Ошибка при скачивании (попытка {attempt+1}/{MAX_RETRIES}): {e}")
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_DELAY)
+        Raises:
+            FileTooLargeError: Если медиа больше MAX_FILE_SIZE
+        """
+        url = self.resolver.resolve(url)
+        platform = get_platform(url)
+        media_id = extract_media_id(url, platform) if platform else None
+        if not media_id:
+            return None
+        
+        try:
+            with STAGE_SECONDS.time(stage='extract', platform=platform):
+                if platform == 'pinterest':
+                    media_url, file_type = self._find_pinterest_media(url)
+                    file_size = self._get_remote_size(media_url)
+                    http_headers = None
                 else:
-                    return False, "download_failed"
+                    info = self._ytdlp_extract(url, YTDLP_OPTIONS[platform], download=False)
+                    return self._direct_media_info(platform, media_id, info)
+        except FileTooLargeError:
+            raise
+        except Exception as e:
+            logging.warning(f"Не удалось получить прямую ссылку на медиа {url}: {e}")
+            return None
+        
+        return {
+            'platform': platform,
+            'media_id': media_id,
+            'media_url': media_url,
+            'file_type': file_type,
+            'file_size': file_size,
+            'http_headers': http_headers
+        }
+    
+    def download_direct(self, media_info, save_dir, max_size=MAX_FILE_SIZE):
+        """
+        Скачивает медиа по прямой ссылке, уже полученной extract_media_url
+        
+        Позволяет не извлекать информацию о посте повторно, если отправить
+        медиа по ссылке или потоком не удалось.
+        
+        Returns:
+            list: Информация о скачанном файле или None, если скачать его не удалось
+                  (тогда медиа скачивается обычным способом через download_media)
+        """
+        if media_info['file_size'] and media_info['file_size'] > max_size:
+            return None
+        file_path = os.path.join(save_dir, self._direct_file_name(media_info))
+        with STAGE_SECONDS.time(stage='download', platform=media_info['platform']):
+            success, error = self._download_file(
+                media_info['media_url'], file_path, max_size, media_info.get('http_headers')
+            )
+        if not success:
+            logging.warning(f"Не удалось скачать медиа по прямой ссылке ({error}): {media_info['media_url']}")
+            return None
+        return [self._media_item(media_info['platform'], media_info['media_id'], file_path, media_info['file_type'])]
+    
+    def _direct_file_name(self, media_info):
+        """Имя файла для медиа, скачанного по прямой ссылке"""
+        return sanitize_filename(
+            f"{media_info['platform']}_{media_info['media_id']}{get_file_extension(media_info['file_type'])}"
+        )
+    
+    def _ytdlp_extract(self, url, options, save_dir=None, download=True, max_size=MAX_FILE_SIZE,
+                       download_entries=True):
+        """
+        Вызывает yt-dlp с выбором формата, который помещается в max_size
+        
+        Raises:
+            FileTooLargeError: Если все доступные форматы больше max_size
+            YtdlpError: При остальных ошибках yt-dlp
+        """
+        # Файл, который все равно будет сжиматься, берем в самом маленьком формате
+        policy = 'size' if max_size > MAX_FILE_SIZE else None
+        try:
+            return self.engine.extract(
+                url, options, save_dir, download, max_size=max_size, policy=policy,
+                download_entries=download_entries
+            )
+        except YtdlpError as e:
+            DOWNLOAD_ERRORS.inc(reason=e.reason or 'ytdlp_error')
+            if e.reason == 'file_too_large':
+                logging.warning(f"Медиа больше допустимого размера: {url} ({e})")
+                raise FileTooLargeError(str(e))
+            raise
+    
+    def _direct_media_info(self, platform, media_id, info):
+        """Формирует информацию о прямой ссылке на медиа из ответа yt-dlp"""
+        # Подборки и форматы, требующие объединения, отправляем обычным способом
+        media_url = info.get('url')
+        if info.get('entries') or not media_url:
+            return None
+        return {
+            'platform': platform,
+            'media_id': media_id,
+            'media_url': media_url,
+            'file_type': self._get_file_type(info.get('ext')),
+            'file_size': info.get('filesize') or info.get('filesize_approx'),
+            'http_headers': info.get('http_headers')
+        }
+    
+    def _get_file_type(self, ext):
+        """Определяет тип медиа по расширению файла"""
+        ext = (ext or '').lower().lstrip('.')
+        if ext in ('mp4', 'mov', 'webm'):
+            return 'video'
+        if ext == 'gif':
+            return 'gif'
+        return 'image'
+    
+    def _get_remote_size(self, url):
+        """Возвращает размер файла по заголовку Content-Length или None"""
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            content_length = int(response.headers.get('Content-Length', 0))
+            return content_length or None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.warning(f"Не удалось определить размер файла {url}: {e}")
+            return None
+    
+    def _find_pinterest_media(self, url):
+        """
+        Ищет прямую ссылку на видео или изображение в HTML странице Pinterest
+        
+        Страница читается частями, и загрузка прекращается, как только
+        найдена ссылка на медиа максимального качества.
+        
+        Returns:
+            tuple: (URL медиа, тип файла)
+        """
+        scanner = PinterestPageScanner(extract_media_id(url, 'pinterest'))
+        with self.session.get(url, headers=HEADERS, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            for chunk in response.iter_content(chunk_size=PINTEREST_CHUNK_SIZE):
+                if scanner.feed(chunk):
+                    break
+        return scanner.result()
+    
+    def _get_downloaded_files(self, info):
+        """Возвращает пути к файлам, скачанным yt-dlp (для подборок - ко всем элементам)"""
+        if info.get('filepath') and os.path.exists(info['filepath']):
+            return [info['filepath']]
+        file_paths = []
+        for entry in info.get('entries') or []:
+            file_paths.extend(self._get_downloaded_files(entry))
+        return file_paths
+    
+    def _ytdlp_download(self, url, options, save_dir, max_size=MAX_FILE_SIZE):
+        """
+        Скачивает медиа через yt-dlp
+        
+        Элементы подборки (карусели, слайдшоу) скачиваются параллельно
+        по прямым ссылкам, которые выбрал yt-dlp.
         
-        return False, "max_retries"
+        Returns:
+            list: Пути к скачанным файлам
+        """
+        info = self._ytdlp_extract(url, options, save_dir, max_size=max_size, download_entries=False)
+        entries = info.get('entries')
+        if entries is None:
+            return self._get_downloaded_files(info)
+        if all(entry.get('url') for entry in entries):
+            return self._download_entries(url, entries, save_dir, max_size)
+        
+        # Элементы, для которых нужно объединять форматы, скачивает сам yt-dlp
+        info = self._ytdlp_extract(url, options, save_dir, max_size=max_size)
+        return self._get_downloaded_files(info)
+    
+    def _download_entries(self, url, entries, save_dir, max_size=MAX_FILE_SIZE):
+        """
+        Параллельно скачивает элементы подборки
+        
+        Элементы, которые скачать не удалось, пропускаются.
+        
+        Returns:
+            list: Пути к скачанным файлам в порядке элементов подборки
+            
+        Raises:
+            FileTooLargeError: Если ни один элемент не поместился в max_size
+        """
+        futures = []
+        for index, entry in enumerate(entries):
+            file_name = sanitize_filename(
+                f"{entry.get('extractor') or 'media'}_{entry.get('id') or index}_{index}.{entry.get('ext') or 'mp4'}"
+            )
+            file_path = os.path.join(save_dir, file_name)
+            future = self.item_executor.submit(
+                self._download_file, entry['url'], file_path, max_size, entry.get('http_headers')
+            )
+            futures.append((file_path, future))
+        
+        file_paths = []
+        errors = set()
+        for file_path, future in futures:
+            success, error = future.result()
+            if success:
+                file_paths.append(file_path)
+            else:
+                logging.warning(f"Не удалось скачать элемент подборки {file_path}: {error}")
+                errors.add(error)
+        
+        logging.info(f"Скачано {len(file_paths)} из {len(entries)} элементов подборки: {url}")
+        if not file_paths and 'file_too_large' in errors:
+            raise FileTooLargeError(f"Элементы подборки больше {max_size} байт")
+        return file_paths
+    
+    def _media_item(self, platform, media_id, file_path, file_type):
+        """Формирует информацию о скачанном файле"""
+        return {
+            'platform': platform,
+            'media_id': media_id,
+            'file_path': file_path,
+            'file_type': file_type,
+            'file_name': os.path.basename(file_path)
+        }
+    
+    def _download_file(self, url, save_path, max_size=MAX_FILE_SIZE, headers=None):
+        """
+        Скачивает файл по URL и сохраняет по указанному пути
+        
+        Файл сначала пишется во временный .part файл и переименовывается
+        только после успешного скачивания, поэтому по пути save_path
+        никогда не оказывается недокачанный файл.
+        """
+        part_path = save_path + '.part'
+        try:
+            self.fetcher.download(url, part_path, max_size, headers)
+        except DownloadError as e:
+            DOWNLOAD_ERRORS.inc(reason=e.reason)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return False, e.reason
+        
+        os.replace(part_path, save_path)
+        return True, None
     
-    def _download_instagram(self, url, save_dir):
+    def _download_instagram(self, url, save_dir, max_size=MAX_FILE_SIZE):
         """Скачивает медиафайл из Instagram"""
         media_id = extract_media_id(url, 'instagram')
         if not media_id:
             logging.error(f"Не удалось извлечь ID медиа из URL: {url}")
             return None
         
-        # Используем instaloader через subprocess для скачивания
         try:
-            # Генерируем временное имя для выходного файла
-            output_prefix = f"instagram_{media_id}"
-            output_path = os.path.join(save_dir, output_prefix)
-            
-            # Используем yt-dlp для скачивания (поддерживает Instagram без авторизации)
-            command = [
-                "yt-dlp", 
-                "--no-warnings",
-                "--quiet",
-                "-o", f"{output_path}.%(ext)s",
-                url
-            ]
-            
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            _, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                logging.error(f"Ошибка при скачивании Instagram медиа: {stderr.decode()}")
-                return None
-            
-            # Ищем скачанный файл
-            downloads = [f for f in os.listdir(save_dir) if f.startswith(output_prefix)]
-            if not downloads:
-                logging.error(f"Файл не найден после скачивания: {output_prefix}")
+            file_paths = self._ytdlp_download(url, INSTAGRAM_OPTIONS, save_dir, max_size)
+            if not file_paths:
+                logging.error(f"Файл не найден после скачивания: {url}")
                 return None
             
-            file_path = os.path.join(save_dir, downloads[0])
-            file_type = 'video' if file_path.endswith(('.mp4', '.mov')) else 'image'
-            
-            return {
-                'platform': 'instagram',
-                'media_id': media_id,
-                'file_path': file_path,
-                'file_type': file_type,
-                'file_name': downloads[0]
-            }
+            return [
+                self._media_item(
+                    'instagram', media_id, file_path,
+                    'video' if file_path.endswith(('.mp4', '.mov')) else 'image'
+                )
+                for file_path in file_paths
+            ]
             
+        except FileTooLargeError:
+            raise
         except Exception as e:
             logging.error(f"Ошибка при скачивании Instagram медиа: {e}")
             return None
     
-    def _download_tiktok(self, url, save_dir):
+    def _download_tiktok(self, url, save_dir, max_size=MAX_FILE_SIZE):
         """Скачивает медиафайл из TikTok"""
         media_id = extract_media_id(url, 'tiktok')
         if not media_id:
@@ -168,98 +398,47 @@ class MediaDownloader:
             return None
         
         try:
-            # Генерируем временное имя для выходного файла
-            output_prefix = f"tiktok_{media_id}"
-            output_path = os.path.join(save_dir, output_prefix)
-            
-            # Преобразуем короткие ссылки в полные
-            if any(domain in url for domain in ['vm.tiktok.com', 'vt.tiktok.com', 'm.tiktok.com']):
-                # Для коротких ссылок не нужны дополнительные параметры
-                pass
-            elif '/t/' in url:
-                # Если это ссылка с /t/, не меняем
-                pass
-            else:
-                # Для профильных ссылок добавляем некоторые параметры
-                logging.info(f"Преобразуем URL TikTok: {url}")
-            
-            # Используем yt-dlp для скачивания с более подробными настройками
-            command = [
-                "yt-dlp", 
-                "--no-warnings",
-                "--user-agent", HEADERS['User-Agent'],
-                "--add-header", f"Referer: {url}",
-                "--add-header", "Accept-Language: ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-                "-o", f"{output_path}.%(ext)s",
-                url
-            ]
-            
             logging.info(f"Скачиваем TikTok медиа: {url}")
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                # Выводим ошибку с большим количеством деталей
-                error_msg = stderr.decode() if stderr else 'Неизвестная ошибка'
-                logging.error(f"Ошибка при скачивании TikTok медиа: {error_msg}")
+            try:
+                file_paths = self._ytdlp_download(url, TIKTOK_OPTIONS, save_dir, max_size)
+            except YtdlpError as e:
+                logging.error(f"Ошибка при скачивании TikTok медиа: {e}")
                 
                 # Пробуем альтернативный метод скачивания
-                command = [
-                    "yt-dlp", 
-                    "--format", "best",
-                    "--no-check-certificate",
-                    "-o", f"{output_path}.%(ext)s",
-                    url
-                ]
-                
                 logging.info("Пробуем альтернативный метод скачивания TikTok...")
-                process = subprocess.Popen(
-                    command,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-                stdout, stderr = process.communicate()
-                
-                if process.returncode != 0:
+                try:
+                    file_paths = self._ytdlp_download(url, TIKTOK_FALLBACK_OPTIONS, save_dir, max_size)
+                except YtdlpError as e:
                     # Если и этот метод не сработал, возвращаем ошибку
-                    logging.error(f"Альтернативный метод скачивания TikTok также не удался")
+                    logging.error(f"Альтернативный метод скачивания TikTok также не удался: {e}")
                     return None
             
-            # Ищем скачанный файл
-            downloads = [f for f in os.listdir(save_dir) if f.startswith(output_prefix)]
-            if not downloads:
-                logging.error(f"Файл не найден после скачивания: {output_prefix}")
+            if not file_paths:
+                logging.error(f"Файл не найден после скачивания: {url}")
                 return None
             
-            file_path = os.path.join(save_dir, downloads[0])
-            
-            # Проверяем тип файла, но для TikTok в основном это видео
-            file_type = 'video'
-            # Если это изображение, меняем тип
-            if file_path.endswith(('.jpg', '.jpeg', '.png', '.webp')):
-                file_type = 'image'
-            elif file_path.endswith('.gif'):
-                file_type = 'gif'
-            
-            logging.info(f"Успешно скачан файл TikTok: {file_path} (тип: {file_type})")
+            media_items = []
+            for file_path in file_paths:
+                # Проверяем тип файла, но для TikTok в основном это видео
+                file_type = 'video'
+                # Если это изображение (например, кадр слайдшоу), меняем тип
+                if file_path.endswith(('.jpg', '.jpeg', '.png', '.webp')):
+                    file_type = 'image'
+                elif file_path.endswith('.gif'):
+                    file_type = 'gif'
+                
+                logging.info(f"Успешно скачан файл TikTok: {file_path} (тип: {file_type})")
+                media_items.append(self._media_item('tiktok', media_id, file_path, file_type))
             
-            return {
-                'platform': 'tiktok',
-                'media_id': media_id,
-                'file_path': file_path,
-                'file_type': file_type,
-                'file_name': downloads[0]
-            }
+            return media_items
             
+        except FileTooLargeError:
+            raise
         except Exception as e:
             logging.error(f"Ошибка при скачивании TikTok медиа: {e}")
             return None
     
-    def _download_pinterest(self, url, save_dir):
+    def _download_pinterest(self, url, save_dir, max_size=MAX_FILE_SIZE):
         """Скачивает медиафайл из Pinterest"""
         media_id = extract_media_id(url, 'pinterest')
         if not media_id:
@@ -269,110 +448,57 @@ class MediaDownloader:
         try:
             # Генерируем временное имя для выходного файла
             output_prefix = f"pinterest_{media_id}"
-            output_path = os.path.join(save_dir, output_prefix)
             
             # Сначала пробуем напрямую через Pinterest API
+            error = None
             try:
-                # Преобразуем короткие ссылки pin.it в полные
-                if 'pin.it' in url:
-                    # Заменяем URL на полный формат
-                    url = f"https://www.pinterest.com/pin/{media_id}/"
-                
-                # Получаем HTML страницы
-                response = self.session.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
-                html_content = response.text
-                
-                # Ищем URL изображения или видео в HTML
-                # Расширенные регулярные выражения для разных форматов данных в Pinterest
-                image_patterns = [
-                    r'"image_url":"([^"]+)"',
-                    r'"images":\{[^\}]*"orig":\{"url":"([^"]+)"',
-                    r'<meta property="og:image" content="([^"]+)"',
-                    r'<img[^>]*src="([^"]+)"[^>]*class="[^"]*mainImage[^"]*"',
-                    r'data-test-id="pin-image"[^>]*src="([^"]+)"'
-                ]
-                video_patterns = [
-                    r'"video_url":"([^"]+)"',
-                    r'"videos":\{[^\}]*"video_list":\{[^\}]*"url":"([^"]+)"',
-                    r'<meta property="og:video" content="([^"]+)"',
-                    r'<meta property="og:video:url" content="([^"]+)"'
-                ]
-                
-                # Пробуем найти видео сначала
-                for pattern in video_patterns:
-                    video_match = re.search(pattern, html_content)
-                    if video_match:
-                        media_url = video_match.group(1).replace('\\/', '/')
-                        file_type = 'video'
-                        file_extension = '.mp4'
-                        break
-                else:
-                    # Если видео не найдено, ищем изображение
-                    for pattern in image_patterns:
-                        image_match = re.search(pattern, html_content)
-                        if image_match:
-                            media_url = image_match.group(1).replace('\\/', '/')
-                            file_type = 'image'
-                            file_extension = '.jpg'
-                            break
-                    else:
-                        # Если изображение не найдено, вызываем исключение
-                        raise Exception("Не удалось найти URL медиа в Pinterest HTML")
+                media_url, file_type = self._find_pinterest_media(url)
+                file_extension = get_file_extension(file_type)
                 
                 # Скачиваем файл
                 file_name = f"{output_prefix}{file_extension}"
                 file_path = os.path.join(save_dir, file_name)
                 
                 logging.info(f"Скачиваем Pinterest медиа: {media_url}")
-                success, error = self._download_file(media_url, file_path)
+                success, error = self._download_file(media_url, file_path, max_size)
                 if success:
-                    return {
-                        'platform': 'pinterest',
-                        'media_id': media_id,
-                        'file_path': file_path,
-                        'file_type': file_type,
-                        'file_name': file_name
-                    }
+                    return [self._media_item('pinterest', media_id, file_path, file_type)]
                 logging.error(f"Ошибка при скачивании Pinterest медиа через API: {error}")
             except Exception as e:
                 logging.error(f"Ошибка при использовании Pinterest API: {e}")
                 # Продолжаем и пробуем через yt-dlp
             
             # Если не удалось через API, пробуем через yt-dlp
-            logging.info(f"Пробуем скачать Pinterest медиа через yt-dlp: {url}")
-            command = [
-                "yt-dlp", 
-                "--no-warnings",
-                "-o", f"{output_path}.%(ext)s",
-                url
-            ]
-            
-            process = subprocess.Popen(
-                command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
-            stdout, stderr = process.communicate()
-            
-            if process.returncode == 0:
-                # Если yt-dlp успешно скачал файл
-                downloads = [f for f in os.listdir(save_dir) if f.startswith(output_prefix)]
-                if downloads:
-                    file_path = os.path.join(save_dir, downloads[0])
-                    file_type = 'video' if file_path.endswith(('.mp4', '.mov')) else 'image'
-                    
-                    return {
-                        'platform': 'pinterest',
-                        'media_id': media_id,
-                        'file_path': file_path,
-                        'file_type': file_type,
-                        'file_name': downloads[0]
-                    }
-            
-            # Если все методы не сработали, возвращаем ошибку
-            logging.error(f"Не удалось скачать Pinterest медиа: {stderr.decode() if stderr else 'Неизвестная ошибка'}")
-            return None
+            # (он может выбрать формат меньшего размера)
+            media_items = self._download_pinterest_ytdlp(url, media_id, save_dir, max_size)
+            if not media_items and error == 'file_too_large':
+                raise FileTooLargeError(f"Pinterest медиа больше {max_size} байт")
+            return media_items
             
+        except FileTooLargeError:
+            raise
         except Exception as e:
             logging.error(f"Ошибка при скачивании Pinterest медиа: {e}")
             return None
+    
+    def _download_pinterest_ytdlp(self, url, media_id, save_dir, max_size=MAX_FILE_SIZE):
+        """Скачивает медиафайл из Pinterest через yt-dlp"""
+        logging.info(f"Пробуем скачать Pinterest медиа через yt-dlp: {url}")
+        try:
+            file_paths = self._ytdlp_download(url, PINTEREST_OPTIONS, save_dir, max_size)
+        except YtdlpError as e:
+            # Если все методы не сработали, возвращаем ошибку
+            logging.error(f"Не удалось скачать Pinterest медиа: {e}")
+            return None
+        
+        if not file_paths:
+            logging.error(f"Файл не найден после скачивания: {url}")
+            return None
+        
+        return [
+            self._media_item(
+                'pinterest', media_id, file_path,
+                'video' if file_path.endswith(('.mp4', '.mov')) else 'image'
+            )
+            for file_path in file_paths
+        ]
@@ -0,0 +1,224 @@
+import time
+import socket
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+from config import (
+    HTTP_POOL_SIZE, HTTP_POOL_HOST_SIZES, HTTP_POOL_HOSTS, HTTP_POOL_TIMEOUT,
+    HTTP_KEEPALIVE_IDLE, DNS_CACHE_TTL, DNS_CACHE_SIZE
+)
+
+# Опции сокета: TCP keep-alive, чтобы простаивающие соединения не закрывались посредниками
+SOCKET_OPTIONS = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+for _name, _value in (("TCP_KEEPIDLE", HTTP_KEEPALIVE_IDLE), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 3)):
+    if hasattr(socket, _name):
+        SOCKET_OPTIONS.append((socket.IPPROTO_TCP, getattr(socket, _name), _value))
+
+
+class DNSCache:
+    """
+    Кэш результатов socket.getaddrinfo
+
+    Устанавливается на весь процесс, поэтому новые соединения к CDN
+    и Telegram не ждут DNS при каждом открытии.
+    """
+
+    def __init__(self, ttl=DNS_CACHE_TTL, max_entries=DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.resolve = socket.getaddrinfo
+
+    def install(self):
+        """Подменяет socket.getaddrinfo кэширующей версией"""
+        socket.getaddrinfo = self.getaddrinfo
+
+    def getaddrinfo(self, *args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Ошибки разрешения имен не кэшируются
+        result = self.resolve(*args, **kwargs)
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries = {k: v for k, v in self.entries.items() if v[0] > now}
+                if len(self.entries) >= self.max_entries:
+                    self.entries.clear()
+            self.entries[key] = (now + self.ttl, result)
+        return result
+
+    def stats(self):
+        """Возвращает статистику кэша"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0,
+                'entries': len(self.entries)
+            }
+
+
+class TimedPoolMixin:
+    """Учитывает время ожидания свободного соединения и количество новых подключений"""
+
+    wait_seconds = 0.0
+    connects = 0
+
+    def _get_conn(self, timeout=None):
+        started = time.monotonic()
+        try:
+            conn = super()._get_conn(timeout if timeout is not None else HTTP_POOL_TIMEOUT)
+        finally:
+            self.wait_seconds += time.monotonic() - started
+        # Соединение без сокета будет открыто заново (в том числе закрытое сервером)
+        if getattr(conn, 'sock', None) is None:
+            self.connects += 1
+        return conn
+
+
+class TimedHTTPConnectionPool(TimedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class TimedHTTPSConnectionPool(TimedPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class HostSizedPoolManager(PoolManager):
+    """PoolManager, в котором размер пула задается отдельно для каждого хоста"""
+
+    def __init__(self, host_sizes, **kwargs):
+        super().__init__(**kwargs)
+        self.host_sizes = host_sizes
+        self.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool
+        }
+
+    def _pool_size(self, host):
+        """Размер пула для хоста (совпадение по суффиксу домена)"""
+        for suffix, size in self.host_sizes.items():
+            if host == suffix or host.endswith('.' + suffix):
+                return size
+        return None
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        request_context = dict(request_context or self.connection_pool_kw)
+        size = self._pool_size(host)
+        if size:
+            request_context['maxsize'] = size
+        return super()._new_pool(scheme, host, port, request_context)
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    HTTP адаптер с общими пулами соединений
+
+    Соединения с каждым хостом переиспользуются всеми потоками. Если все
+    соединения пула заняты, запрос ждет освобождения соединения (не дольше
+    HTTP_POOL_TIMEOUT), а не открывает лишнее, которое потом будет закрыто.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, host_sizes=HTTP_POOL_HOST_SIZES, hosts=HTTP_POOL_HOSTS):
+        self.host_sizes = host_sizes
+        super().__init__(pool_connections=hosts, pool_maxsize=pool_size, pool_block=True)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = HostSizedPoolManager(
+            self.host_sizes,
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            socket_options=SOCKET_OPTIONS,
+            **pool_kwargs
+        )
+
+    def send(self, request, **kwargs):
+        try:
+            return super().send(request, **kwargs)
+        except EmptyPoolError as e:
+            # Для вызывающего кода это обычная сетевая ошибка
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+    def stats(self):
+        """
+        Возвращает статистику пулов по хостам
+
+        Returns:
+            dict: Для каждого хоста количество запросов, новых подключений,
+                  доля запросов по уже открытым соединениям и время ожидания пула
+        """
+        pools = self.poolmanager.pools
+        result = {}
+        with pools.lock:
+            items = list(pools._container.values())
+        for pool in items:
+            host = pool.host
+            entry = result.setdefault(host, {'requests': 0, 'connections': 0, 'wait_seconds': 0.0})
+            entry['requests'] += pool.num_requests
+            entry['connections'] += pool.connects
+            entry['wait_seconds'] += pool.wait_seconds
+        for entry in result.values():
+            requests_count = entry['requests']
+            entry['reuse_ratio'] = round(1 - entry['connections'] / requests_count, 3) if requests_count else 0
+            entry['wait_seconds'] = round(entry['wait_seconds'], 3)
+        return result
+
+
+_adapter = None
+_dns_cache = None
+_lock = threading.Lock()
+
+
+def _get_adapter():
+    """Возвращает общий адаптер, при первом вызове включая кэш DNS"""
+    global _adapter, _dns_cache
+    with _lock:
+        if _adapter is None:
+            _dns_cache = DNSCache()
+            _dns_cache.install()
+            _adapter = PooledAdapter()
+        return _adapter
+
+
+def create_session(headers=None):
+    """
+    Создает HTTP сессию, которая использует общие пулы соединений
+
+    Args:
+        headers: Заголовки по умолчанию для запросов этой сессии
+
+    Returns:
+        requests.Session: Сессия с общим адаптером
+    """
+    session = requests.Session()
+    adapter = _get_adapter()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def pool_stats():
+    """Возвращает статистику пулов соединений и кэша DNS"""
+    if _adapter is None:
+        return {}
+    return {'pools': _adapter.stats(), 'dns': _dns_cache.stats()}
@@ -0,0 +1,139 @@
+import time
+import hashlib
+import threading
+from telebot import types
+from config import INLINE_PREFETCH_TTL
+from utils import is_valid_url, get_platform, extract_media_id
+from messages import (
+    MEDIA_CAPTION, INLINE_MEDIA_TITLE, INLINE_PENDING_TITLE, INLINE_PENDING_DESCRIPTION,
+    INLINE_UNAVAILABLE_DESCRIPTION, INLINE_INVALID_BUTTON
+)
+
+# Количество отметок о фоновых загрузках, после которого устаревшие удаляются
+PREFETCH_MAX_ENTRIES = 1000
+
+
+def result_id(*parts):
+    """Идентификатор результата inline-запроса (не длиннее 64 байт)"""
+    return hashlib.md5(":".join(str(part) for part in parts).encode()).hexdigest()
+
+
+class InlineIndex:
+    """
+    Ответы на inline-запросы по кэшу уже загруженных медиа
+
+    Ссылка приводится к каноническому виду без обращений к сети (короткие
+    ссылки - только по кэшу раскрытых), после чего результаты строятся
+    из file_id в MediaCache. Для медиа, которого нет в кэше, отвечаем
+    заглушкой, а загрузку выполняет фоновая задача; повторные запросы той
+    же ссылки не запускают ее заново, пока она выполняется.
+    """
+
+    def __init__(self, media_cache, resolver, prefetch_ttl=INLINE_PREFETCH_TTL):
+        self.media_cache = media_cache
+        self.resolver = resolver
+        self.prefetch_ttl = prefetch_ttl
+        self.prefetching = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, text):
+        """
+        Ищет медиа по ссылке из inline-запроса
+
+        Returns:
+            tuple: (платформа, канонический URL, file_id из кэша или None);
+                   платформа None, если ссылка не поддерживается
+        """
+        url = text.strip()
+        platform = get_platform(url) if is_valid_url(url) else None
+        if not platform:
+            return None, url, None
+
+        canonical = self.resolver.lookup(url)
+        media_id = extract_media_id(canonical, platform) if canonical else None
+        cached = self.media_cache.get(platform, media_id) if media_id else None
+        with self.lock:
+            if cached:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return platform, canonical or url, cached
+
+    def results(self, platform, url, cached):
+        """Формирует результаты inline-запроса из file_id медиа"""
+        # Записи, сохраненные до поддержки подборок, содержат одно медиа
+        if isinstance(cached, dict):
+            cached = [cached]
+        caption = f"{MEDIA_CAPTION} | {platform.capitalize()}"
+        title = INLINE_MEDIA_TITLE.format(platform=platform.capitalize())
+        results = []
+        for index, media in enumerate(cached):
+            item_id = result_id(url, index)
+            file_type, file_id = media['file_type'], media['file_id']
+            if file_type == 'video':
+                result = types.InlineQueryResultCachedVideo(item_id, file_id, title, caption=caption)
+            elif file_type == 'image':
+                result = types.InlineQueryResultCachedPhoto(item_id, file_id, title=title, caption=caption)
+            elif file_type == 'gif':
+                result = types.InlineQueryResultCachedMpeg4Gif(item_id, file_id, title=title, caption=caption)
+            else:
+                result = types.InlineQueryResultCachedDocument(item_id, file_id, title, caption=caption)
+            results.append(result)
+        return results
+
+    def placeholder(self, url, pending):
+        """
+        Результат-заглушка для медиа, которого еще нет в кэше
+
+        Args:
+            pending: Медиа загружается в фоне (иначе загрузить его в inline-режиме нельзя)
+        """
+        description = INLINE_PENDING_DESCRIPTION if pending else INLINE_UNAVAILABLE_DESCRIPTION
+        return types.InlineQueryResultArticle(
+            result_id("pending", url),
+            INLINE_PENDING_TITLE,
+            types.InputTextMessageContent(url),
+            description=description
+        )
+
+    def start_button(self):
+        """Кнопка перехода в чат с ботом для запроса без поддерживаемой ссылки"""
+        return types.InlineQueryResultsButton(text=INLINE_INVALID_BUTTON, start_parameter="inline")
+
+    def start_prefetch(self, url):
+        """
+        Отмечает начало фоновой загрузки
+
+        Returns:
+            bool: True, если загрузку нужно запустить (она еще не выполняется)
+        """
+        now = time.monotonic()
+        with self.lock:
+            started = self.prefetching.get(url)
+            if started and now - started < self.prefetch_ttl:
+                return False
+            # Записи о давно начатых загрузках больше не нужны
+            if len(self.prefetching) > PREFETCH_MAX_ENTRIES:
+                self.prefetching = {
+                    key: value for key, value in self.prefetching.items() if now - value < self.prefetch_ttl
+                }
+            self.prefetching[url] = now
+            return True
+
+    def finish_prefetch(self, url):
+        """Отмечает завершение фоновой загрузки"""
+        with self.lock:
+            self.prefetching.pop(url, None)
+
+    def stats(self):
+        """Возвращает счетчики попаданий и промахов"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 3) if total else 0,
+                'prefetching': len(self.prefetching)
+            }
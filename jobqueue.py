@@ -0,0 +1,333 @@
+import os
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from config import (
+    JOB_QUEUE_DB_PATH, JOB_QUEUE_MAX_PENDING, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL, JOB_RETENTION, WORKER_COUNT, PLATFORM_CONCURRENCY
+)
+
+# Количество операций между удалениями завершенных заданий
+PURGE_INTERVAL = 1000
+
+
+def worker_name():
+    """Имя рабочего процесса, уникальное для узла и процесса"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    Очередь заданий на обработку ссылок в SQLite (WAL)
+
+    Один процесс принимает обновления и ставит задания в очередь, а
+    рабочие процессы (в том числе на других узлах с общим файлом базы)
+    забирают их в аренду на JOB_LEASE_SECONDS секунд. Пока задание
+    выполняется, аренда продлевается. Если процесс аварийно завершился,
+    аренда истекает, и задание забирает другой процесс; после
+    JOB_MAX_ATTEMPTS неудачных попыток задание считается проваленным.
+    """
+
+    def __init__(self, db_path=JOB_QUEUE_DB_PATH, max_pending=JOB_QUEUE_MAX_PENDING,
+                 lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+                 retention=JOB_RETENTION):
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.operations = 0
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "platform TEXT NOT NULL, "
+            "user_id INTEGER NOT NULL, "
+            "url TEXT NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "state TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "owner TEXT, "
+            "lease_expires REAL, "
+            "error TEXT, "
+            "created_at REAL NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires, id)"
+        )
+
+    def enqueue(self, platform, user_id, url, message_id):
+        """
+        Ставит задание в очередь
+
+        Returns:
+            int: Количество заданий, ожидающих перед этим (0 - очередь пуста),
+                 или None, если очередь переполнена
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                pending = self.conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE state = 'queued'"
+                ).fetchone()[0]
+                if pending >= self.max_pending:
+                    self.conn.execute("ROLLBACK")
+                    return None
+                self.conn.execute(
+                    "INSERT INTO jobs (platform, user_id, url, message_id, state, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                    (platform, user_id, url, message_id, now, now)
+                )
+                self._maybe_purge(now)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return pending
+
+    def claim(self, owner, exclude=()):
+        """
+        Забирает самое старое задание в аренду
+
+        Args:
+            owner: Имя рабочего процесса
+            exclude: Платформы, задания которых сейчас брать не нужно
+
+        Returns:
+            dict: Задание (id, platform, user_id, url, message_id, attempts, state) или None.
+                  Задание, исчерпавшее попытки, возвращается с состоянием 'failed',
+                  чтобы рабочий процесс сообщил о нем пользователю
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Задания с истекшей арендой остались от остановившихся процессов
+                query = (
+                    "SELECT id, platform, user_id, url, message_id, attempts FROM jobs "
+                    "WHERE (state = 'queued' OR (state = 'leased' AND lease_expires < ?))"
+                )
+                if exclude:
+                    query += f" AND platform NOT IN ({', '.join('?' * len(exclude))})"
+                row = self.conn.execute(query + " ORDER BY id LIMIT 1", (now, *exclude)).fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+                if row[5] >= self.max_attempts:
+                    logging.error(f"Задание {row[0]} не выполнено за {row[5]} попыток: {row[3]}")
+                    self.conn.execute(
+                        "UPDATE jobs SET state = 'failed', owner = NULL, updated_at = ? WHERE id = ?",
+                        (now, row[0])
+                    )
+                    self.conn.execute("COMMIT")
+                    return self._job(row, row[5], 'failed')
+                self.conn.execute(
+                    "UPDATE jobs SET state = 'leased', owner = ?, lease_expires = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (owner, now + self.lease_seconds, now, row[0])
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return self._job(row, row[5] + 1, 'leased')
+
+    def extend(self, job_ids, owner):
+        """Продлевает аренду выполняющихся заданий"""
+        if not job_ids:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                [(now + self.lease_seconds, now, job_id, owner) for job_id in job_ids]
+            )
+
+    def ack(self, job_id, owner):
+        """Отмечает задание выполненным"""
+        self._finish(job_id, owner, 'done', None)
+
+    def fail(self, job_id, owner, error, retry=True):
+        """
+        Отмечает неудачную попытку выполнения
+
+        Args:
+            retry: Вернуть задание в очередь (если попытки не исчерпаны)
+        """
+        self._finish(job_id, owner, 'queued' if retry else 'failed', str(error))
+
+    def pending(self):
+        """Возвращает количество заданий, ожидающих в очереди"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+
+    def stats(self):
+        """Возвращает количество заданий в каждом состоянии"""
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def _job(self, row, attempts, state):
+        """Формирует задание из строки таблицы"""
+        return {
+            'id': row[0],
+            'platform': row[1],
+            'user_id': row[2],
+            'url': row[3],
+            'message_id': row[4],
+            'attempts': attempts,
+            'state': state
+        }
+
+    def _finish(self, job_id, owner, state, error):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (state, error, now, job_id, owner)
+            )
+
+    def _maybe_purge(self, now):
+        """Удаляет давно завершенные задания (вызывается в транзакции)"""
+        self.operations += 1
+        if self.operations % PURGE_INTERVAL == 0:
+            self.conn.execute(
+                "DELETE FROM jobs WHERE state IN ('done', 'failed') AND updated_at < ?",
+                (now - self.retention,)
+            )
+
+
+class QueueWorker:
+    """
+    Рабочий процесс: забирает задания из JobQueue и выполняет их в потоках
+
+    Лимиты параллельных загрузок платформ действуют в пределах процесса:
+    задания платформы, упершейся в лимит, остаются в очереди для других
+    процессов.
+
+    Args:
+        queue: Очередь заданий
+        handler: Функция handler(user_id, url, message_id), обрабатывающая ссылку
+                 и возвращающая результат; задание повторяется, только если
+                 обработчик выбросил исключение или аренда истекла. Ошибки,
+                 о которых обработчик уже сообщил пользователю (результат
+                 'error'), не повторяются: часть медиа могла быть отправлена
+        on_failed: Функция on_failed(job), вызываемая, когда задание исчерпало попытки
+        threads: Количество потоков, одновременно выполняющих задания
+    """
+
+    def __init__(self, queue, handler, on_failed=None, threads=WORKER_COUNT,
+                 poll_interval=JOB_POLL_INTERVAL, platform_limits=PLATFORM_CONCURRENCY):
+        self.queue = queue
+        self.handler = handler
+        self.on_failed = on_failed
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.platform_limits = platform_limits
+        self.owner = worker_name()
+        self.active = {}
+        self.platforms = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.workers = []
+        self.completed = 0
+
+    def start(self):
+        """Запускает потоки выполнения заданий и продления аренды"""
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._work, name=f"queue-worker-{i}")
+            thread.daemon = True
+            thread.start()
+            self.workers.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="queue-heartbeat")
+        heartbeat.daemon = True
+        heartbeat.start()
+        logging.info(f"Рабочий процесс {self.owner} запущен, потоков: {self.threads}")
+
+    def stop(self, timeout=None):
+        """Перестает забирать задания и дожидается выполняющихся"""
+        self.stopped.set()
+        for thread in self.workers:
+            thread.join(timeout)
+        logging.info(f"Рабочий процесс {self.owner} остановлен, выполнено заданий: {self.completed}")
+
+    def active_jobs(self):
+        """Возвращает количество выполняющихся заданий"""
+        with self.lock:
+            return len(self.active)
+
+    def _claim(self):
+        """Забирает задание платформы, для которой есть свободный слот"""
+        with self.lock:
+            exclude = [
+                platform for platform, limit in self.platform_limits.items()
+                if self.platforms.get(platform, 0) >= limit
+            ]
+            job = self.queue.claim(self.owner, exclude)
+            if job and job['state'] == 'failed':
+                return job
+            if job:
+                self.active[job['id']] = job['platform']
+                self.platforms[job['platform']] = self.platforms.get(job['platform'], 0) + 1
+            return job
+
+    def _work(self):
+        """Цикл потока: забрать задание, выполнить, подтвердить"""
+        while not self.stopped.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка при получении задания из очереди: {e}")
+                job = None
+            if job is None:
+                self.stopped.wait(self.poll_interval)
+                continue
+            if job['state'] == 'failed':
+                # Задание исчерпало попытки в процессах, которые аварийно завершились
+                self._failed(job)
+                continue
+
+            try:
+                self.handler(job['user_id'], job['url'], job['message_id'])
+            except Exception as e:
+                logging.error(f"Ошибка при выполнении задания {job['id']} (попытка {job['attempts']}): {e}")
+                retry = job['attempts'] < self.queue.max_attempts
+                self.queue.fail(job['id'], self.owner, e, retry=retry)
+                if not retry:
+                    self._failed(job)
+            else:
+                self.queue.ack(job['id'], self.owner)
+                with self.lock:
+                    self.completed += 1
+            finally:
+                with self.lock:
+                    del self.active[job['id']]
+                    self.platforms[job['platform']] -= 1
+
+    def _failed(self, job):
+        """Сообщает о задании, которое больше не будет выполняться"""
+        if not self.on_failed:
+            return
+        try:
+            self.on_failed(job)
+        except Exception as e:
+            logging.error(f"Ошибка при обработке проваленного задания {job['id']}: {e}")
+
+    def _heartbeat(self):
+        """Продлевает аренду выполняющихся заданий, пока процесс жив"""
+        while not self.stopped.wait(self.queue.lease_seconds / 3):
+            with self.lock:
+                job_ids = list(self.active)
+            try:
+                self.queue.extend(job_ids, self.owner)
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка при продлении аренды заданий: {e}")
@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from config import JOURNAL_DB_PATH, JOURNAL_RESUME_MAX_AGE, JOURNAL_RETENTION
+
+# Этапы обработки ссылки
+QUEUED = 'queued'
+EXTRACTING = 'extracting'
+DOWNLOADED = 'downloaded'
+UPLOADING = 'uploading'
+DONE = 'done'
+
+# Этапы, после которых задание можно продолжить с уже скачанными файлами
+RESUMABLE_STATES = (DOWNLOADED, UPLOADING)
+
+
+class JobJournal:
+    """
+    Журнал заданий на обработку ссылок
+
+    Для каждого задания хранится этап обработки, сообщение о статусе и
+    скачанные файлы. Ключ записи - пара (пользователь, ID сообщения о
+    статусе). После перезапуска процесса незавершенные задания ставятся
+    в очередь заново, а задания, у которых файлы уже скачаны, сразу
+    переходят к отправке. Ссылки из одного сообщения хранятся вместе под
+    ID общего сообщения о статусе и продолжаются с необработанных ссылок.
+    """
+
+    def __init__(self, db_path=JOURNAL_DB_PATH, resume_max_age=JOURNAL_RESUME_MAX_AGE,
+                 retention=JOURNAL_RETENTION):
+        self.resume_max_age = resume_max_age
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.resumed = 0
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "user_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "url TEXT NOT NULL, "
+            "platform TEXT NOT NULL, "
+            "state TEXT NOT NULL, "
+            "job_dir TEXT, "
+            "media TEXT, "
+            "result TEXT, "
+            "created_at REAL NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, message_id))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)")
+        # Ссылки из одного сообщения с общим сообщением о статусе (batch.LinkBatch)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            "user_id INTEGER NOT NULL, "
+            "message_id INTEGER NOT NULL, "
+            "urls TEXT NOT NULL, "
+            "results TEXT NOT NULL, "
+            "done INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, message_id))"
+        )
+        self.conn.commit()
+
+    def add(self, user_id, message_id, url, platform):
+        """Записывает новое задание в очереди"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO jobs (user_id, message_id, url, platform, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, message_id, url, platform, QUEUED, now, now)
+            )
+            self.conn.commit()
+
+    def update(self, user_id, message_id, state, job_dir=None, media=None):
+        """
+        Отмечает переход задания на новый этап
+
+        Args:
+            job_dir: Директория с файлами задания
+            media: Скачанные медиа, готовые к отправке
+        """
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, job_dir = COALESCE(?, job_dir), media = COALESCE(?, media), "
+                "updated_at = ? WHERE user_id = ? AND message_id = ?",
+                (state, job_dir, json.dumps(media) if media is not None else None,
+                 time.time(), user_id, message_id)
+            )
+            self.conn.commit()
+
+    def finish(self, user_id, message_id, result):
+        """Отмечает задание завершенным с результатом result"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, result = ?, media = NULL, updated_at = ? "
+                "WHERE user_id = ? AND message_id = ?",
+                (DONE, result, time.time(), user_id, message_id)
+            )
+            self.conn.commit()
+
+    def add_batch(self, user_id, message_id, urls, results):
+        """Записывает ссылки из одного сообщения под ID общего сообщения о статусе"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO batches (user_id, message_id, urls, results, done, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (user_id, message_id, json.dumps(urls), json.dumps(results), now, now)
+            )
+            self.conn.commit()
+
+    def update_batch(self, user_id, message_id, results):
+        """
+        Сохраняет результаты ссылок из одного сообщения
+
+        Args:
+            results: Результат каждой ссылки (None - ссылка еще обрабатывается)
+        """
+        done = all(result is not None for result in results)
+        with self.lock:
+            self.conn.execute(
+                "UPDATE batches SET results = ?, done = ?, updated_at = ? WHERE user_id = ? AND message_id = ?",
+                (json.dumps(results), int(done), time.time(), user_id, message_id)
+            )
+            self.conn.commit()
+
+    def get(self, user_id, message_id):
+        """
+        Возвращает запись задания
+
+        Returns:
+            dict: Задание (url, platform, state, job_dir, media) или None
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT url, platform, state, job_dir, media FROM jobs WHERE user_id = ? AND message_id = ?",
+                (user_id, message_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'user_id': user_id,
+            'message_id': message_id,
+            'url': row[0],
+            'platform': row[1],
+            'state': row[2],
+            'job_dir': row[3],
+            'media': json.loads(row[4]) if row[4] else None
+        }
+
+    def resumable_media(self, user_id, message_id):
+        """
+        Возвращает уже скачанные медиа задания, если все их файлы сохранились
+
+        Returns:
+            tuple: (запись задания или None, список медиа или None)
+        """
+        job = self.get(user_id, message_id)
+        if not job or job['state'] not in RESUMABLE_STATES or not job['media']:
+            return job, None
+        for media_info in job['media']:
+            file_path = media_info.get('file_path')
+            if not file_path or not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+                return job, None
+        return job, job['media']
+
+    def unfinished(self):
+        """
+        Возвращает задания, прерванные остановкой процесса
+
+        Returns:
+            tuple: (задания, которые можно продолжить, задания старше JOURNAL_RESUME_MAX_AGE)
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT user_id, message_id, url, platform, state, job_dir, created_at FROM jobs "
+                "WHERE state != ? ORDER BY created_at",
+                (DONE,)
+            ).fetchall()
+        deadline = time.time() - self.resume_max_age
+        resumable, expired = [], []
+        for user_id, message_id, url, platform, state, job_dir, created_at in rows:
+            job = {
+                'user_id': user_id,
+                'message_id': message_id,
+                'url': url,
+                'platform': platform,
+                'state': state,
+                'job_dir': job_dir
+            }
+            (resumable if created_at > deadline else expired).append(job)
+        with self.lock:
+            self.resumed += len(resumable)
+        return resumable, expired
+
+    def unfinished_batches(self):
+        """
+        Возвращает сообщения с несколькими ссылками, обработка которых прервана
+
+        Returns:
+            tuple: (сообщения, которые можно продолжить, сообщения старше JOURNAL_RESUME_MAX_AGE)
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT user_id, message_id, urls, results, created_at FROM batches "
+                "WHERE done = 0 ORDER BY created_at"
+            ).fetchall()
+        deadline = time.time() - self.resume_max_age
+        resumable, expired = [], []
+        for user_id, message_id, urls, results, created_at in rows:
+            batch = {
+                'user_id': user_id,
+                'message_id': message_id,
+                'urls': json.loads(urls),
+                'results': json.loads(results)
+            }
+            (resumable if created_at > deadline else expired).append(batch)
+        with self.lock:
+            self.resumed += len(resumable)
+        return resumable, expired
+
+    def purge(self):
+        """Удаляет давно завершенные задания"""
+        deadline = time.time() - self.retention
+        with self.lock:
+            self.conn.execute("DELETE FROM jobs WHERE state = ? AND updated_at < ?", (DONE, deadline))
+            self.conn.execute("DELETE FROM batches WHERE done = 1 AND updated_at < ?", (deadline,))
+            self.conn.commit()
+
+    def stats(self):
+        """Возвращает количество заданий на каждом этапе"""
+        with self.lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+            result = dict(rows)
+            result['batches'] = self.conn.execute("SELECT COUNT(*) FROM batches WHERE done = 0").fetchone()[0]
+            result['resumed'] = self.resumed
+        return result
@@ -1,6 +1,141 @@
 import logging
 import os
-from bot import bot
+import sys
+import signal
+import threading
+import subprocess
+from config import (
+    BOT_RUNTIME, BOT_MODE, BOT_ROLE, WEBHOOK_URL, ALLOWED_UPDATES,
+    METRICS_ENABLED, METRICS_PORT, QUEUE_LOCAL_WORKERS
+)
+
+def start_local_workers(count):
+    """Запускает рабочие процессы общей очереди на этом узле"""
+    processes = []
+    for i in range(count):
+        env = dict(os.environ, BOT_ROLE="worker", METRICS_PORT=str(METRICS_PORT + i + 1))
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker"], env=env))
+    if processes:
+        logging.info(f"Запущено рабочих процессов: {len(processes)}")
+    return processes
+
+def stop_local_workers(processes):
+    """Останавливает рабочие процессы, давая им доделать взятые задания"""
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+def run_sync(mode, ingest=False):
+    """
+    Запускает бота с обработкой ссылок в пуле потоков
+
+    Args:
+        mode: Способ получения обновлений
+        ingest: Только принимать обновления, ставя ссылки в общую очередь заданий
+    """
+    from bot import bot, scheduler, downloader, transcoder, use_job_queue, resume_jobs
+
+    metrics_server = None
+    if METRICS_ENABLED:
+        from metrics import MetricsServer
+
+        metrics_server = MetricsServer()
+        metrics_server.start()
+
+    processes = []
+    if ingest:
+        from jobqueue import JobQueue
+
+        # Задания остановившихся рабочих процессов возвращает в очередь истечение аренды
+        use_job_queue(JobQueue())
+        processes = start_local_workers(QUEUE_LOCAL_WORKERS)
+    else:
+        resume_jobs()
+
+    if mode == "webhook":
+        from webhook import WebhookServer
+
+        # Обновления сразу передаются обработчикам, которые ставят ссылки в очередь
+        server = WebhookServer(bot.process_new_updates)
+        bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=server.secret,
+            allowed_updates=ALLOWED_UPDATES
+        )
+        server.start()
+
+        # По SIGTERM останавливаем прием обновлений и дорабатываем очередь
+        stopped = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+
+        logging.info("Бот запущен (вебхук)")
+        try:
+            stopped.wait()
+        except KeyboardInterrupt:
+            pass
+        server.shutdown()
+    else:
+        # По SIGTERM прекращаем получать обновления и дорабатываем очередь
+        signal.signal(signal.SIGTERM, lambda signum, frame: bot.stop_polling())
+
+        bot.remove_webhook()
+        logging.info("Бот запущен")
+        bot.polling(none_stop=True, interval=0, allowed_updates=ALLOWED_UPDATES)
+
+    logging.info("Бот остановлен, дожидаемся завершения задач в очереди")
+    scheduler.shutdown(drain=True)
+    stop_local_workers(processes)
+    downloader.engine.shutdown()
+    if transcoder:
+        transcoder.shutdown()
+    if metrics_server:
+        metrics_server.shutdown()
+
+def run_worker():
+    """Запускает рабочий процесс, выполняющий задания из общей очереди"""
+    from bot import process_url, fail_job, scheduler, downloader, transcoder
+    from jobqueue import JobQueue, QueueWorker
+    from metrics import REGISTRY, ACTIVE_JOBS
+
+    worker = QueueWorker(JobQueue(), process_url, fail_job)
+    REGISTRY.add_collector(lambda: ACTIVE_JOBS.set(worker.active_jobs()))
+
+    metrics_server = None
+    if METRICS_ENABLED:
+        from metrics import MetricsServer
+
+        metrics_server = MetricsServer()
+        metrics_server.start()
+
+    # По SIGTERM перестаем брать задания и доделываем взятые
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+
+    worker.start()
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+
+    worker.stop()
+    scheduler.shutdown(drain=True)
+    downloader.engine.shutdown()
+    if transcoder:
+        transcoder.shutdown()
+    if metrics_server:
+        metrics_server.shutdown()
+
+def run_async(mode):
+    """Запускает бота в режиме asyncio"""
+    import asyncio
+    from async_bot import run
+
+    logging.info("Бот запущен (asyncio)")
+    try:
+        asyncio.run(run(mode))
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
     # Настройка логирования
@@ -8,7 +143,20 @@ if __name__ == "__main__":
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    
+
+    # Режимы можно переопределить аргументами: python main.py async webhook
+    args = sys.argv[1:]
+    runtime = "async" if "async" in args else "sync" if "sync" in args else BOT_RUNTIME
+    mode = "webhook" if "webhook" in args else "polling" if "polling" in args else BOT_MODE
+    role = "worker" if "worker" in args else "ingest" if "ingest" in args else BOT_ROLE
+
     # Запуск бота
-    logging.info("Бот запущен")
-    bot.polling(none_stop=True, interval=0)
+    if role == "worker":
+        run_worker()
+    elif role == "ingest":
+        # Общая очередь заданий работает только с потоковым ботом
+        run_sync(mode, ingest=True)
+    elif runtime == "async":
+        run_async(mode)
+    else:
+        run_sync(mode)
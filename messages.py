@@ -2,19 +2,20 @@
 
 # Приветственные сообщения
 START_MESSAGE = """
-👋 Привет! Я бот для скачивания фото и видео из Instagram и TikTok.
+👋 Привет! Я бот для скачивания фото и видео из Instagram, TikTok и Pinterest.
 
 Просто отправь мне ссылку на пост, и я скачаю для тебя медиафайл.
 
 ⚠️ Поддерживаемые платформы:
 • Instagram
 • TikTok
+• Pinterest
 """
 
 HELP_MESSAGE = """
 🔍 Как пользоваться ботом:
 
-1️⃣ Скопируйте ссылку на фото или видео из Instagram или TikTok.
+1️⃣ Скопируйте ссылку на фото или видео из Instagram, TikTok или Pinterest.
 2️⃣ Отправьте эту ссылку мне.
 3️⃣ Дождитесь загрузки и получите ваш файл!
 
@@ -31,16 +32,47 @@ HELP_MESSAGE = """
 # Сообщения в процессе обработки
 PROCESSING_MESSAGE = "⏳ Обрабатываю вашу ссылку..."
 DOWNLOADING_MESSAGE = "⏳ Загружаю медиафайл..."
+COMPRESSING_MESSAGE = "🗜 Файл слишком большой для Telegram, сжимаю его..."
 SUCCESS_MESSAGE = "✅ Загрузка успешно завершена!"
+QUEUED_MESSAGE = "⏳ Ваша ссылка в очереди. Позиция: {position}"
 
 # Сообщения об ошибках
 ERROR_INVALID_URL = "❌ Некорректная ссылка. Пожалуйста, проверьте ссылку и попробуйте снова."
-ERROR_UNSUPPORTED_PLATFORM = "❌ Эта платформа не поддерживается. Я могу скачивать только с Instagram и TikTok."
+ERROR_UNSUPPORTED_PLATFORM = "❌ Эта платформа не поддерживается. Я могу скачивать только с Instagram, TikTok и Pinterest."
 ERROR_RATE_LIMIT = "⚠️ Вы отправляете слишком много запросов. Пожалуйста, подождите немного перед следующей загрузкой."
+ERROR_SERVICE_BUSY = "⚠️ Сейчас к боту слишком много запросов. Пожалуйста, попробуйте отправить ссылку через минуту."
 ERROR_DOWNLOAD_FAILED = "❌ Не удалось загрузить медиафайл. Возможно, пост недоступен или это закрытый аккаунт."
 ERROR_FILE_TOO_LARGE = "⚠️ Файл слишком большой для отправки через Telegram. Максимальный размер: 50 МБ."
+ERROR_QUEUE_FULL = "⚠️ Бот сейчас перегружен. Пожалуйста, попробуйте отправить ссылку через несколько минут."
 ERROR_GENERAL = "❌ Произошла ошибка при обработке вашего запроса. Пожалуйста, попробуйте позже."
 
+# Общее сообщение о статусе для нескольких ссылок из одного сообщения
+BATCH_PROGRESS = "⏳ Обрабатываю ссылки: {done} из {total}"
+BATCH_DONE = "✅ Готово: загружено {success} из {total}"
+BATCH_ITEM = "{index}. {status} {platform}"
+BATCH_LINK = "Ссылка"
+BATCH_PENDING = "⏳"
+BATCH_STATUSES = {
+    "success": "✅",
+    "cached": "✅",
+    "shared": "✅",
+    "file_too_large": "⚠️ файл слишком большой -",
+    "rate_limited": "⚠️ превышен лимит запросов -",
+    "service_busy": "⚠️ бот перегружен запросами -",
+    "queue_full": "⚠️ бот перегружен -",
+    "unsupported": "❌ платформа не поддерживается -",
+    "download_failed": "❌ не удалось загрузить -",
+    "expired": "❌ обработка прервана -",
+}
+BATCH_ERROR = "❌ ошибка -"
+
+# Ответы на inline-запросы
+INLINE_MEDIA_TITLE = "📥 Медиа из {platform}"
+INLINE_PENDING_TITLE = "⏳ Медиа загружается..."
+INLINE_PENDING_DESCRIPTION = "Повторите запрос через несколько секунд, чтобы отправить медиа"
+INLINE_UNAVAILABLE_DESCRIPTION = "Этого медиа еще нет в кэше. Отправьте ссылку боту в личные сообщения"
+INLINE_INVALID_BUTTON = "Укажите ссылку на пост из Instagram, TikTok или Pinterest"
+
 # Сообщения о состоянии
 NO_MEDIA_FOUND = "❌ Не найдено медиафайлов по данной ссылке."
 MULTIPLE_MEDIA_FOUND = "📁 Найдено несколько медиафайлов. Отправляю их вам..."
@@ -0,0 +1,303 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import METRICS_HOST, METRICS_PORT, METRICS_BUCKETS
+from messages import ERROR_DOWNLOAD_FAILED, ERROR_FILE_TOO_LARGE, ERROR_QUEUE_FULL, ERROR_GENERAL
+
+# MIME тип текстового формата Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names, values, extra=None):
+    """Формирует строку меток {name="value",...}"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    """Форматирует число так, как его ожидает Prometheus"""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Базовый класс метрики с набором меток"""
+
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        """Значения меток в порядке их объявления"""
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        """Возвращает строки метрики в текстовом формате Prometheus"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение величины (размер очереди, занятое место)"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Распределение длительностей по корзинам"""
+
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=METRICS_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # Количество попаданий в каждую корзину, сумма и общее количество
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Измеряет длительность блока with"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labels, key, ("le", _format_value(float(bound))))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels, key, ("le", "+Inf"))
+        lines.append(f"{self.name}_bucket{labels} {count}")
+        labels = _format_labels(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Набор метрик процесса
+
+    Перед каждым чтением вызываются зарегистрированные сборщики, которые
+    обновляют метрики, вычисляемые по запросу (размер очереди, занятое
+    место, статистика пулов).
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Добавляет функцию без аргументов, обновляющую метрики перед чтением"""
+        with self.lock:
+            self.collectors.append(collector)
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        with self.lock:
+            metrics = list(self.metrics)
+            collectors = list(self.collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logging.error(f"Ошибка при сборе метрик: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Длительность этапов обработки ссылки по платформам
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "bot_stage_duration_seconds",
+    "Длительность этапа обработки ссылки",
+    ("stage", "platform")
+))
+
+# Результаты обработки сообщений и ссылок
+REQUESTS = REGISTRY.register(Counter(
+    "bot_requests_total",
+    "Количество обработанных запросов по результату",
+    ("platform", "result")
+))
+
+# Ошибки скачивания по причинам (file_too_large, empty_file, download_failed...)
+DOWNLOAD_ERRORS = REGISTRY.register(Counter(
+    "bot_download_errors_total",
+    "Количество ошибок скачивания по причине",
+    ("reason",)
+))
+
+# Текущее состояние процесса, обновляется сборщиками перед чтением
+ACTIVE_JOBS = REGISTRY.register(Gauge("bot_active_jobs", "Количество выполняющихся задач"))
+QUEUE_DEPTH = REGISTRY.register(Gauge("bot_queue_depth", "Количество задач в очереди"))
+TEMP_BYTES = REGISTRY.register(Gauge(
+    "bot_temp_bytes",
+    "Объем временных файлов",
+    ("location",)
+))
+COMPONENT_STATS = REGISTRY.register(Gauge(
+    "bot_component_stat",
+    "Числовые показатели stats() компонентов (кэш, сжатие, пулы соединений)",
+    ("component", "stat")
+))
+HTTP_POOL_STATS = REGISTRY.register(Gauge(
+    "bot_http_pool_stat",
+    "Показатели пулов HTTP соединений по хостам",
+    ("host", "stat")
+))
+
+# Причины ошибок для текстов, которые получает пользователь
+ERROR_RESULTS = {
+    ERROR_DOWNLOAD_FAILED: "download_failed",
+    ERROR_FILE_TOO_LARGE: "file_too_large",
+    ERROR_QUEUE_FULL: "queue_full",
+    ERROR_GENERAL: "error",
+}
+
+
+def result_of(error):
+    """Возвращает метку результата обработки ссылки по тексту ошибки"""
+    if not error:
+        return "success"
+    return ERROR_RESULTS.get(error, "error")
+
+
+def observe_stats(component, stats):
+    """Публикует числовые значения из словаря stats() компонента"""
+    for stat, value in stats.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            COMPONENT_STATS.set(value, component=component, stat=stat)
+
+
+def observe_pool_stats(stats):
+    """Публикует статистику пулов HTTP соединений и кэша DNS (http_pool.pool_stats)"""
+    for host, host_stats in stats.get('pools', {}).items():
+        for stat, value in host_stats.items():
+            HTTP_POOL_STATS.set(value, host=host, stat=stat)
+    observe_stats("dns_cache", stats.get('dns', {}))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Отдает метрики по адресу /metrics"""
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Запросы сборщика метрик не пишем в лог"""
+        pass
+
+
+class MetricsServer:
+    """HTTP сервер для сбора метрик Prometheus"""
+
+    def __init__(self, registry=REGISTRY, host=METRICS_HOST, port=METRICS_PORT):
+        self.httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+        self.thread = None
+
+    @property
+    def port(self):
+        """Порт, на котором слушает сервер"""
+        return self.httpd.server_address[1]
+
+    def start(self):
+        """Запускает сервер в отдельном потоке"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics")
+        self.thread.daemon = True
+        self.thread.start()
+        logging.info(f"Метрики доступны на порту {self.port}: /metrics")
+
+    def shutdown(self):
+        """Останавливает сервер"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
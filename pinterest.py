@@ -0,0 +1,209 @@
+import re
+import json
+import codecs
+from config import PINTEREST_MAX_PAGE_BYTES
+
+# Начало встроенного JSON с состоянием страницы
+PAGE_STATE_START = re.compile(
+    r'<script[^>]*id="(?:__PWS_DATA__|__PWS_INITIAL_PROPS__)"[^>]*>'
+)
+PAGE_STATE_END = "</script>"
+
+# Прямые ссылки на видео в HTML коде страницы
+VIDEO_PATTERN = re.compile('|'.join([
+    r'<meta property="og:video(?::url)?" content="([^"]+)"',
+    r'"video_url":"([^"]+)"',
+    r'"url":"(https:[^"]+?\.mp4)"',
+]))
+
+# Прямые ссылки на изображения в HTML коде страницы
+IMAGE_PATTERN = re.compile('|'.join([
+    r'"images":\{[^\}]*"orig":\{"url":"([^"]+)"',
+    r'"image_url":"([^"]+)"',
+    r'<meta property="og:image" content="([^"]+)"',
+    r'<img[^>]*src="([^"]+)"[^>]*class="[^"]*mainImage[^"]*"',
+    r'data-test-id="pin-image"[^>]*src="([^"]+)"',
+]))
+
+# Разрешение видео и ширина изображения в пути к файлу на CDN
+VIDEO_HEIGHT_PATTERN = re.compile(r'/(\d{3,4})[pP]/')
+IMAGE_WIDTH_PATTERN = re.compile(r'/(\d{2,4})x/')
+
+# Видео такого разрешения считается лучшим, дальше страницу можно не читать
+GOOD_VIDEO_HEIGHT = 720
+
+# Сколько символов предыдущей части страницы повторно просматривается,
+# чтобы не пропустить совпадение на границе частей
+OVERLAP = 4096
+
+# Оценка для оригинального изображения (выше любого уменьшенного варианта)
+ORIGINAL_IMAGE_SCORE = 100000
+
+
+def _video_score(url, height=None):
+    """Оценка качества видео: чем выше разрешение, тем лучше"""
+    if height:
+        return height
+    match = VIDEO_HEIGHT_PATTERN.search(url)
+    return int(match.group(1)) if match else 1
+
+
+def _image_score(url, width=None):
+    """Оценка качества изображения: оригинал лучше любого уменьшенного варианта"""
+    if '/originals/' in url:
+        return ORIGINAL_IMAGE_SCORE
+    if width:
+        return width
+    match = IMAGE_WIDTH_PATTERN.search(url)
+    return int(match.group(1)) if match else 1
+
+
+def _walk(node):
+    """Обходит все словари во вложенной структуре JSON"""
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            yield item
+            stack.extend(item.values())
+        elif isinstance(item, list):
+            stack.extend(item)
+
+
+class PinterestPageScanner:
+    """
+    Потоковый поиск ссылки на медиа в странице Pinterest
+
+    Страница передается частями через feed(). Каждая часть просматривается
+    заранее скомпилированными выражениями, а встроенный JSON с состоянием
+    страницы, если он есть, дополнительно разбирается один раз целиком.
+    Чтение можно прекратить, как только feed() вернул True.
+    """
+
+    def __init__(self, media_id=None, max_bytes=PINTEREST_MAX_PAGE_BYTES):
+        self.media_id = str(media_id) if media_id else None
+        self.max_bytes = max_bytes
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.bytes_read = 0
+        self.tail = ""
+        self.state_parts = None
+        self.state_parsed = False
+        self.state_result = None
+        self.videos = {}
+        self.images = {}
+
+    def feed(self, data):
+        """
+        Обрабатывает очередную часть страницы
+
+        Returns:
+            bool: True, если лучшая ссылка уже найдена и читать дальше не нужно
+        """
+        self.bytes_read += len(data)
+        text = self.decoder.decode(data)
+
+        window = self.tail + text
+        # Выражения применяются и к JSON, если его не удастся разобрать
+        self._scan(window)
+
+        if self.state_parts is not None:
+            if self._feed_state(text):
+                return True
+        elif not self.state_parsed:
+            start = PAGE_STATE_START.search(window)
+            if start:
+                self.state_parts = []
+                if self._feed_state(window[start.end():]):
+                    return True
+
+        self.tail = window[-OVERLAP:]
+        if self.videos and max(self.videos.values()) >= GOOD_VIDEO_HEIGHT:
+            return True
+        return self.bytes_read >= self.max_bytes
+
+    def result(self):
+        """
+        Возвращает лучшую найденную ссылку
+
+        Returns:
+            tuple: (URL медиа, тип файла)
+        """
+        if self.state_result:
+            return self.state_result
+        # Видео предпочтительнее изображения
+        if self.videos:
+            return max(self.videos, key=self.videos.get), 'video'
+        if self.images:
+            return max(self.images, key=self.images.get), 'image'
+        raise Exception("Не удалось найти URL медиа в Pinterest HTML")
+
+    def _scan(self, window):
+        """Ищет ссылки на медиа в очередном фрагменте страницы"""
+        for match in VIDEO_PATTERN.finditer(window):
+            url = match.group(match.lastindex).replace('\\/', '/')
+            # Потоковые плейлисты нельзя отправить файлом
+            if '.m3u8' not in url:
+                self.videos[url] = _video_score(url)
+        for match in IMAGE_PATTERN.finditer(window):
+            url = match.group(match.lastindex).replace('\\/', '/')
+            self.images[url] = _image_score(url)
+
+    def _feed_state(self, text):
+        """Накапливает встроенный JSON и разбирает его, когда он получен целиком"""
+        self.state_parts.append(text)
+        # Конец скрипта может оказаться на границе частей
+        recent = ''.join(self.state_parts[-2:])
+        if PAGE_STATE_END not in recent:
+            return False
+
+        content = ''.join(self.state_parts)
+        content = content[:content.index(PAGE_STATE_END)]
+        self.state_parts = None
+        # Состояние на странице одно - повторно начало скрипта не ищем
+        self.state_parsed = True
+        try:
+            self.state_result = self._best_from_state(json.loads(content))
+        except ValueError:
+            self.state_result = None
+        # Если в JSON ничего не нашлось, продолжаем просматривать страницу
+        return self.state_result is not None
+
+    def _best_from_state(self, state):
+        """
+        Выбирает медиа максимального качества из состояния страницы
+
+        Если ID пина известен, а в состоянии его нет, возвращает None: другие
+        пины в состоянии - это похожие публикации, а не запрошенная.
+        """
+        pin = None
+        for item in _walk(state):
+            if not (item.get('videos') or item.get('images') or item.get('story_pin_data')):
+                continue
+            if not self.media_id or str(item.get('id')) == self.media_id:
+                pin = item
+                break
+        if pin is None:
+            return None
+
+        videos = {}
+        images = {}
+        for item in _walk(pin):
+            video_list = item.get('video_list')
+            if isinstance(video_list, dict):
+                for variant in video_list.values():
+                    url = isinstance(variant, dict) and variant.get('url')
+                    if url and '.m3u8' not in url:
+                        videos[url] = _video_score(url, variant.get('height'))
+            image_variants = item.get('images')
+            if isinstance(image_variants, dict):
+                for name, variant in image_variants.items():
+                    url = isinstance(variant, dict) and variant.get('url')
+                    if url:
+                        score = ORIGINAL_IMAGE_SCORE if name == 'orig' else _image_score(url, variant.get('width'))
+                        images[url] = score
+
+        if videos:
+            return max(videos, key=videos.get), 'video'
+        if images:
+            return max(images, key=images.get), 'image'
+        return None
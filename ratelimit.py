@@ -0,0 +1,200 @@
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import (
+    RATE_LIMIT, RATE_LIMIT_PERIOD, PLATFORM_RATE_LIMITS, GLOBAL_RATE_LIMIT,
+    RATE_LIMIT_BACKEND, RATE_LIMIT_DB_PATH, RATE_LIMIT_MAX_KEYS
+)
+
+# Сколько простаивающих ключей удаляется за одну проверку
+EVICT_BATCH = 2
+
+# Как часто (в проверках) из SQLite удаляются простаивающие ключи
+SQLITE_PURGE_INTERVAL = 1000
+
+
+def _refill(state, rate, capacity, now):
+    """Возвращает количество токенов в корзине на текущий момент"""
+    if state is None:
+        return capacity
+    tokens, updated_at = state
+    return min(capacity, tokens + (now - updated_at) * rate)
+
+
+def _denied(rules, levels):
+    """Возвращает ключ первой корзины без токенов или None"""
+    for (key, _, _), tokens in zip(rules, levels):
+        if tokens < 1:
+            return key
+    return None
+
+
+class MemoryBackend:
+    """
+    Хранение корзин токенов в памяти процесса
+
+    Ключи упорядочены по времени последнего обращения, поэтому
+    простаивающие ключи удаляются с начала словаря за O(1).
+    """
+
+    def __init__(self, idle_ttl=RATE_LIMIT_PERIOD, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, rules):
+        """
+        Списывает по одному токену из каждой корзины, если во всех они есть
+
+        Args:
+            rules: Список (ключ, скорость пополнения в секунду, емкость)
+
+        Returns:
+            str: Ключ первой пустой корзины или None, если запрос разрешен
+        """
+        now = time.monotonic()
+        with self.lock:
+            levels = [_refill(self.buckets.get(key), rate, capacity, now)
+                      for key, rate, capacity in rules]
+            denied = _denied(rules, levels)
+            allowed = denied is None
+            for (key, _, _), tokens in zip(rules, levels):
+                self.buckets[key] = (tokens - 1 if allowed else tokens, now)
+                self.buckets.move_to_end(key)
+            self._evict(now)
+        return denied
+
+    def _evict(self, now):
+        """Удаляет несколько самых старых ключей, корзины которых уже полны"""
+        for _ in range(EVICT_BATCH):
+            if not self.buckets:
+                return
+            key, (_, updated_at) = next(iter(self.buckets.items()))
+            if now - updated_at < self.idle_ttl and len(self.buckets) <= self.max_keys:
+                return
+            del self.buckets[key]
+
+    def size(self):
+        """Возвращает количество отслеживаемых ключей"""
+        return len(self.buckets)
+
+
+class SQLiteBackend:
+    """
+    Хранение корзин токенов в SQLite
+
+    Позволяет нескольким процессам бота соблюдать общие лимиты:
+    проверка и списание токенов выполняются в одной транзакции.
+    """
+
+    def __init__(self, db_path=RATE_LIMIT_DB_PATH, idle_ttl=RATE_LIMIT_PERIOD):
+        self.idle_ttl = idle_ttl
+        self.lock = threading.Lock()
+        self.checks = 0
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "key TEXT PRIMARY KEY, "
+            "tokens REAL NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS rate_limits_updated ON rate_limits (updated_at)"
+        )
+
+    def take(self, rules):
+        """
+        Списывает по одному токену из каждой корзины, если во всех они есть
+
+        Args:
+            rules: Список (ключ, скорость пополнения в секунду, емкость)
+
+        Returns:
+            str: Ключ первой пустой корзины или None, если запрос разрешен
+        """
+        # Время должно быть общим для всех процессов
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = []
+                for key, rate, capacity in rules:
+                    row = self.conn.execute(
+                        "SELECT tokens, updated_at FROM rate_limits WHERE key = ?", (key,)
+                    ).fetchone()
+                    levels.append(_refill(row, rate, capacity, now))
+                denied = _denied(rules, levels)
+                allowed = denied is None
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO rate_limits (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(key, tokens - 1 if allowed else tokens, now)
+                     for (key, _, _), tokens in zip(rules, levels)]
+                )
+
+                self.checks += 1
+                if self.checks % SQLITE_PURGE_INTERVAL == 0:
+                    self.conn.execute(
+                        "DELETE FROM rate_limits WHERE updated_at < ?", (now - self.idle_ttl,)
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return denied
+
+    def size(self):
+        """Возвращает количество отслеживаемых ключей"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+
+class RateLimiter:
+    """
+    Ограничение частоты запросов по алгоритму корзины токенов
+
+    Запрос проверяется сразу по нескольким лимитам: для пользователя,
+    для платформы (на весь бот) и общему лимиту бота. Запрос разрешается,
+    только если ни один из лимитов не превышен.
+    """
+
+    def __init__(self, backend=None, user_limit=RATE_LIMIT, period=RATE_LIMIT_PERIOD,
+                 platform_limits=PLATFORM_RATE_LIMITS, global_limit=GLOBAL_RATE_LIMIT):
+        if backend is None:
+            backend = SQLiteBackend() if RATE_LIMIT_BACKEND == "sqlite" else MemoryBackend()
+        self.backend = backend
+        self.period = period
+        self.user_limit = user_limit
+        self.platform_limits = platform_limits or {}
+        self.global_limit = global_limit
+
+    def _rule(self, key, limit):
+        """Корзина на limit запросов за период"""
+        return key, limit / self.period, limit
+
+    def check(self, user_id, platform=None):
+        """
+        Проверяет лимиты и учитывает запрос
+
+        Args:
+            user_id: Идентификатор пользователя
+            platform: Платформа, с которой скачивается медиа
+
+        Returns:
+            tuple: (запрос разрешен, лимит, который его отклонил: 'user',
+                    'platform', 'global' или None)
+        """
+        rules = [self._rule(f"user:{user_id}", self.user_limit)]
+        platform_limit = self.platform_limits.get(platform)
+        if platform_limit:
+            rules.append(self._rule(f"platform:{platform}", platform_limit))
+        if self.global_limit:
+            rules.append(self._rule("global", self.global_limit))
+        denied = self.backend.take(rules)
+        if denied is None:
+            return True, None
+        return False, denied.split(":", 1)[0]
@@ -0,0 +1,118 @@
+import time
+import logging
+import threading
+import requests
+from collections import OrderedDict
+from urllib.parse import urlparse, urlunparse
+from config import REQUEST_TIMEOUT, SHORT_LINK_CACHE_TTL, SHORT_LINK_CACHE_SIZE
+from utils import get_platform, extract_media_id
+
+# Домены коротких ссылок
+SHORT_LINK_DOMAINS = ['vm.tiktok.com', 'vt.tiktok.com', 'pin.it']
+
+
+def is_short_link(url):
+    """Проверяет, является ли URL короткой ссылкой, которую нужно раскрыть"""
+    parsed_url = urlparse(url)
+    domain = parsed_url.netloc.lower()
+    if domain in SHORT_LINK_DOMAINS:
+        return True
+    # Формат https://www.tiktok.com/t/{code}/
+    return domain.endswith('tiktok.com') and parsed_url.path.startswith('/t/')
+
+
+def canonical_url(url):
+    """
+    Приводит ссылку на пост к каноническому виду
+
+    Returns:
+        str: Канонический URL или None, если ID медиа определить не удалось
+    """
+    platform = get_platform(url)
+    media_id = extract_media_id(url, platform) if platform else None
+    if not media_id:
+        return None
+    if platform == 'pinterest':
+        return f"https://www.pinterest.com/pin/{media_id}/"
+    # Параметры отслеживания в запросе не нужны
+    parsed_url = urlparse(url)
+    return urlunparse((parsed_url.scheme, parsed_url.netloc, parsed_url.path, '', '', ''))
+
+
+class ShortLinkResolver:
+    """
+    Раскрывает короткие ссылки (vm.tiktok.com, vt.tiktok.com, pin.it)
+
+    Переходы по редиректам выполняются без загрузки тела страницы,
+    а результат кэшируется, чтобы одна и та же короткая ссылка
+    раскрывалась один раз.
+    """
+
+    def __init__(self, session, ttl=SHORT_LINK_CACHE_TTL, max_entries=SHORT_LINK_CACHE_SIZE):
+        self.session = session
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def resolve(self, url):
+        """
+        Возвращает канонический URL поста
+
+        Args:
+            url: Исходная ссылка
+
+        Returns:
+            str: Канонический URL или исходная ссылка, если раскрыть ее не удалось
+        """
+        if not is_short_link(url):
+            return canonical_url(url) or url
+
+        now = time.time()
+        with self.lock:
+            entry = self.cache.get(url)
+            if entry and entry[0] > now:
+                self.cache.move_to_end(url)
+                return entry[1]
+
+        final_url = self._follow_redirects(url)
+        resolved = canonical_url(final_url) if final_url else None
+        if not resolved or is_short_link(resolved):
+            logging.warning(f"Не удалось раскрыть короткую ссылку: {url}")
+            return url
+
+        logging.info(f"Короткая ссылка {url} раскрыта: {resolved}")
+        with self.lock:
+            self.cache[url] = (now + self.ttl, resolved)
+            self.cache.move_to_end(url)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return resolved
+
+    def lookup(self, url):
+        """
+        Возвращает канонический URL поста без обращений к сети
+
+        Returns:
+            str: Канонический URL или None, если короткая ссылка еще не раскрывалась
+        """
+        if not is_short_link(url):
+            return canonical_url(url)
+        with self.lock:
+            entry = self.cache.get(url)
+            if entry and entry[0] > time.time():
+                return entry[1]
+        return None
+
+    def _follow_redirects(self, url):
+        """Проходит по редиректам и возвращает конечный URL"""
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+            if response.status_code not in (403, 405):
+                return response.url
+            # Некоторые серверы не поддерживают HEAD - делаем GET без чтения тела
+            with self.session.get(url, allow_redirects=True, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                return response.url
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Ошибка при раскрытии короткой ссылки {url}: {e}")
+            return None
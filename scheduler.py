@@ -0,0 +1,241 @@
+import logging
+import threading
+from collections import deque, OrderedDict
+from config import (
+    WORKER_COUNT, QUEUE_MAX_SIZE, PLATFORM_CONCURRENCY, JOB_COSTS,
+    SCHEDULER_CHEAP_COST, SCHEDULER_QUANTUM, ADMIN_IDS
+)
+
+
+class Job:
+    """Задача на обработку одной ссылки"""
+
+    def __init__(self, platform, fn, args, user=None, cost=None):
+        self.platform = platform
+        self.fn = fn
+        self.args = args
+        self.user = user
+        self.cost = cost
+
+
+class FairQueue:
+    """
+    Очередь задач со справедливым разделением между пользователями
+
+    Задачи каждого пользователя ждут в своей очереди, а пользователи
+    обслуживаются по кругу (deficit round robin): за каждый круг
+    пользователь получает quantum единиц, которые тратятся на стоимость
+    его задач. Пользователь, отправивший много ссылок, не задерживает
+    остальных, а дешевые задачи проходят чаще дорогих.
+    """
+
+    def __init__(self, quantum):
+        self.quantum = quantum
+        self.users = OrderedDict()
+        self.deficit = {}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for queue in self.users.values():
+            yield from queue
+
+    def push(self, job):
+        self.users.setdefault(job.user, deque()).append(job)
+        self.deficit.setdefault(job.user, 0)
+        self.size += 1
+
+    def pop(self, can_run):
+        """
+        Извлекает следующую задачу
+
+        Args:
+            can_run: Функция, проверяющая, можно ли сейчас запустить задачу
+
+        Returns:
+            Job: Задача или None, если ни одну задачу запустить нельзя
+        """
+        while True:
+            found = False
+            for user in list(self.users):
+                queue = self.users[user]
+                job = next((job for job in queue if can_run(job)), None)
+                if job is None:
+                    continue
+                found = True
+                if self.deficit[user] >= job.cost:
+                    # Пользователь остается первым в круге, пока не потратит свой квант
+                    self.deficit[user] -= job.cost
+                    queue.remove(job)
+                    self.size -= 1
+                    if not queue:
+                        del self.users[user]
+                        del self.deficit[user]
+                    return job
+                self.deficit[user] += self.quantum
+                self.users.move_to_end(user)
+            if not found:
+                return None
+
+    def clear(self):
+        self.users.clear()
+        self.deficit.clear()
+        self.size = 0
+
+
+class JobScheduler:
+    """
+    Пул рабочих потоков с ограниченной очередью задач
+
+    Общее количество одновременно выполняемых задач ограничено числом
+    потоков, а для каждой платформы действует свой лимит параллельных
+    загрузок. Задачи платформы, упершейся в лимит, ждут в очереди и не
+    мешают задачам других платформ.
+
+    Очередь состоит из трех уровней, которые обслуживаются по порядку:
+    задачи администраторов, дешевые задачи (медиа из кэша, изображения)
+    и все остальные. Внутри уровня пользователи обслуживаются по кругу
+    с учетом стоимости задач (FairQueue).
+    """
+
+    def __init__(self, workers=WORKER_COUNT, max_queue=QUEUE_MAX_SIZE,
+                 platform_limits=PLATFORM_CONCURRENCY, quantum=SCHEDULER_QUANTUM,
+                 cheap_cost=SCHEDULER_CHEAP_COST, admin_ids=ADMIN_IDS):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.platform_limits = platform_limits
+        self.cheap_cost = cheap_cost
+        self.admin_ids = admin_ids
+        # Уровни очереди в порядке обслуживания: администраторы, дешевые задачи, остальные
+        self.lanes = [FairQueue(quantum) for _ in range(3)]
+        self.active = {}
+        self.idle = 0
+        self.accepting = False
+        self.condition = threading.Condition()
+        self.threads = []
+
+    def start(self):
+        """Запускает рабочие потоки"""
+        with self.condition:
+            if self.accepting:
+                return
+            self.accepting = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        logging.info(f"Запущено рабочих потоков: {self.workers}")
+
+    def submit(self, platform, fn, *args, user=None, cost=None):
+        """
+        Ставит задачу в очередь
+
+        Args:
+            platform: Платформа, к которой относится задача
+            fn: Функция обработки
+            args: Аргументы функции
+            user: Пользователь, между которыми делится очередь
+            cost: Оценка стоимости задачи (по умолчанию - как для неизвестного типа медиа)
+
+        Returns:
+            int: Позиция в очереди (0 - задача начнет выполняться сразу)
+                 или None, если очередь переполнена или пул остановлен
+        """
+        job = Job(platform, fn, args, user, cost or JOB_COSTS['unknown'])
+        lane = self._lane(job)
+        with self.condition:
+            if not self.accepting or self._queued() >= self.max_queue:
+                return None
+            self.lanes[lane].push(job)
+            # Приблизительная позиция: задачи этого и более приоритетных уровней
+            position = sum(len(queue) for queue in self.lanes[:lane + 1])
+            self.condition.notify()
+            # Задача стартует сразу, если хватает свободных потоков и слотов платформы
+            pending = sum(1 for queue in self.lanes for queued in queue if queued.platform == platform) - 1
+            if self._queued() <= self.idle and self._has_capacity(platform, pending):
+                return 0
+            return position
+
+    def queue_size(self):
+        """Возвращает количество задач, ожидающих в очереди"""
+        with self.condition:
+            return self._queued()
+
+    def active_jobs(self):
+        """Возвращает количество выполняющихся задач"""
+        with self.condition:
+            return sum(self.active.values())
+
+    def shutdown(self, drain=True, timeout=None):
+        """
+        Останавливает прием задач и завершает рабочие потоки
+
+        Args:
+            drain: Дождаться выполнения задач, уже стоящих в очереди
+            timeout: Максимальное время ожидания каждого потока
+        """
+        with self.condition:
+            self.accepting = False
+            if not drain:
+                dropped = self._queued()
+                for queue in self.lanes:
+                    queue.clear()
+                if dropped:
+                    logging.warning(f"Отброшено задач из очереди: {dropped}")
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        logging.info("Пул рабочих потоков остановлен")
+
+    def _lane(self, job):
+        """Уровень очереди для задачи"""
+        if job.user is not None and job.user in self.admin_ids:
+            return 0
+        if job.cost <= self.cheap_cost:
+            return 1
+        return 2
+
+    def _queued(self):
+        """Количество задач во всех уровнях очереди (вызывается под блокировкой)"""
+        return sum(len(queue) for queue in self.lanes)
+
+    def _has_capacity(self, platform, pending=0):
+        """Проверяет, не достигнут ли лимит параллельных задач платформы"""
+        limit = self.platform_limits.get(platform)
+        return limit is None or self.active.get(platform, 0) + pending < limit
+
+    def _next_job(self):
+        """Извлекает следующую задачу, для платформы которой есть свободный слот"""
+        for queue in self.lanes:
+            job = queue.pop(lambda job: self._has_capacity(job.platform))
+            if job:
+                return job
+        return None
+
+    def _worker(self):
+        """Цикл рабочего потока"""
+        while True:
+            with self.condition:
+                self.idle += 1
+                job = self._next_job()
+                while job is None:
+                    if not self.accepting and not self._queued():
+                        self.idle -= 1
+                        return
+                    self.condition.wait()
+                    job = self._next_job()
+                self.idle -= 1
+                self.active[job.platform] = self.active.get(job.platform, 0) + 1
+
+            try:
+                job.fn(*job.args)
+            except Exception as e:
+                logging.error(f"Ошибка при выполнении задачи: {e}")
+            finally:
+                with self.condition:
+                    self.active[job.platform] -= 1
+                    # Освободился слот платформы - задачи этой платформы могут ждать
+                    self.condition.notify_all()
@@ -0,0 +1,638 @@
+"""
+Нагрузочный бенчмарк конвейера bot.py без доступа к сети.
+
+Бот запускается в режиме polling против локальной заглушки Bot API
+(getUpdates, sendMessage, editMessageText, sendVideo и т.д.), файлы
+отдает локальный HTTP сервер с поддержкой Range, а вместо yt-dlp
+используется заглушка экстрактора с настраиваемой задержкой. Ссылки
+подаются с заданной частотой от заданного количества пользователей,
+часть ссылок повторяется. Генератор случайных чисел инициализируется
+seed, поэтому одинаковые параметры дают одинаковую нагрузку.
+
+В отчете: пропускная способность, задержка от получения обновления
+до отправки медиа (p50/p95/p99), пиковая память процесса, количество
+потоков и объем временных файлов.
+
+С --workers N процесс только принимает обновления и ставит ссылки в
+общую очередь заданий (jobqueue.JobQueue), а обрабатывают их N рабочих
+процессов, как при запуске main.py с ролями ingest и worker.
+
+Запуск из корня проекта:
+    python scripts/load_bench.py --links 200 --rate 20 --users 50 --duplicates 0.3 --sizes 1M,4M
+    python scripts/load_bench.py --links 400 --rate 100 --workers 4
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from collections import deque, Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from messages import (
+    ERROR_INVALID_URL, ERROR_UNSUPPORTED_PLATFORM, ERROR_RATE_LIMIT, ERROR_SERVICE_BUSY,
+    ERROR_DOWNLOAD_FAILED, ERROR_FILE_TOO_LARGE, ERROR_GENERAL, ERROR_QUEUE_FULL
+)
+
+# Тексты, которыми заканчивается обработка ссылки с ошибкой
+ERROR_REASONS = {
+    ERROR_INVALID_URL: "invalid_url",
+    ERROR_UNSUPPORTED_PLATFORM: "unsupported",
+    ERROR_RATE_LIMIT: "rate_limited",
+    ERROR_SERVICE_BUSY: "service_busy",
+    ERROR_DOWNLOAD_FAILED: "download_failed",
+    ERROR_FILE_TOO_LARGE: "file_too_large",
+    ERROR_GENERAL: "error",
+    ERROR_QUEUE_FULL: "queue_full",
+}
+
+# Методы Bot API, которыми бот отправляет медиа
+MEDIA_METHODS = {"sendVideo", "sendPhoto", "sendAnimation", "sendDocument", "sendMediaGroup"}
+
+# Поле chat_id в теле multipart запроса
+CHAT_ID_PATTERN = re.compile(rb'name="chat_id"\r\n\r\n(-?\d+)')
+
+# Максимальное время ожидания getUpdates в заглушке (в секундах)
+POLL_WAIT = 1.0
+
+SIZE_UNITS = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+
+
+def parse_size(value):
+    """Переводит строку вида 512K или 4M в байты"""
+    value = value.strip().upper()
+    if value and value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+    return int(value)
+
+
+def percentile(values, q):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def read_body(handler):
+    """Читает тело запроса, в том числе переданное с Transfer-Encoding: chunked"""
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        parts = []
+        while True:
+            size = int(handler.rfile.readline().split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # Завершающая пустая строка (заголовки trailer не используются)
+                handler.rfile.readline()
+                break
+            parts.append(handler.rfile.read(size))
+            handler.rfile.readline()
+        return b"".join(parts)
+    length = int(handler.headers.get("Content-Length", 0) or 0)
+    return handler.rfile.read(length) if length else b""
+
+
+class LoadStats:
+    """Учет ссылок: время отправки и результат обработки"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.latencies = []
+        self.results = Counter()
+        self.sent = 0
+        self.first_sent = None
+        self.last_done = None
+        self.done = threading.Condition(self.lock)
+
+    def sent_link(self, chat_id):
+        now = time.monotonic()
+        with self.lock:
+            self.pending.setdefault(chat_id, deque()).append(now)
+            self.sent += 1
+            if self.first_sent is None:
+                self.first_sent = now
+
+    def finished(self, chat_id, result):
+        """Завершает самую раннюю незавершенную ссылку чата"""
+        now = time.monotonic()
+        with self.lock:
+            queue = self.pending.get(chat_id)
+            if not queue:
+                return
+            started = queue.popleft()
+            self.results[result] += 1
+            if result == "success":
+                self.latencies.append(now - started)
+            self.last_done = now
+            self.done.notify_all()
+
+    def completed(self):
+        return sum(self.results.values())
+
+    def wait(self, timeout):
+        """Ждет завершения всех отправленных ссылок"""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while sum(self.results.values()) < self.sent:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.done.wait(remaining)
+            return True
+
+
+class FakeBotAPI(BaseHTTPRequestHandler):
+    """Заглушка Bot API: принимает запросы бота и отвечает как Telegram"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        method = parsed.path.rsplit("/", 1)[-1]
+        params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        body = read_body(self)
+        if body and self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+            params.update({key: values[0] for key, values in parse_qs(body.decode()).items()})
+
+        chat_id = params.get("chat_id")
+        if chat_id is None:
+            match = CHAT_ID_PATTERN.search(body)
+            chat_id = match.group(1).decode() if match else None
+        chat_id = int(chat_id) if chat_id is not None else None
+
+        if server.latency and method != "getUpdates":
+            time.sleep(server.latency)
+
+        if method == "getUpdates":
+            result = server.updates.get(int(params.get("offset", 0)))
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("deleteWebhook", "setWebhook"):
+            result = True
+        elif method == "sendMediaGroup":
+            media = json.loads(params.get("media", "[]"))
+            result = [server.message(chat_id, {"photo": server.photo()}) for _ in media]
+        elif method in MEDIA_METHODS:
+            result = server.message(chat_id, server.media(method))
+        elif method in ("sendMessage", "editMessageText"):
+            result = server.message(chat_id, {"text": params.get("text", "")})
+        else:
+            result = True
+
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+        # Результат ссылки засчитываем после ответа, как его увидит бот
+        if method in MEDIA_METHODS:
+            server.stats.finished(chat_id, "success")
+        elif method in ("sendMessage", "editMessageText") and params.get("text") in ERROR_REASONS:
+            server.stats.finished(chat_id, ERROR_REASONS[params["text"]])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UpdateQueue:
+    """Обновления для getUpdates с учетом offset"""
+
+    def __init__(self):
+        self.updates = []
+        self.next_id = 1
+        self.condition = threading.Condition()
+
+    def put(self, message):
+        with self.condition:
+            self.updates.append({"update_id": self.next_id, "message": message})
+            self.next_id += 1
+            self.condition.notify_all()
+
+    def get(self, offset):
+        with self.condition:
+            # Подтвержденные ботом обновления больше не нужны
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+            if not self.updates:
+                self.condition.wait(POLL_WAIT)
+            return list(self.updates)
+
+
+class FakeBotAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, stats, latency):
+        super().__init__(("127.0.0.1", 0), FakeBotAPI)
+        self.stats = stats
+        self.latency = latency
+        self.updates = UpdateQueue()
+        self.message_ids = 0
+        self.lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        """Соединения рабочих процессов обрываются при их завершении - это не ошибка"""
+        pass
+
+    def message(self, chat_id, extra):
+        """Формирует объект Message"""
+        with self.lock:
+            self.message_ids += 1
+            message_id = self.message_ids
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        message.update(extra)
+        return message
+
+    def photo(self):
+        file_id = f"photo-{random.getrandbits(32)}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 1080, "height": 1080}]
+
+    def media(self, method):
+        file_id = f"file-{random.getrandbits(32)}"
+        if method == "sendPhoto":
+            return {"photo": self.photo()}
+        if method == "sendDocument":
+            return {"document": {"file_id": file_id, "file_unique_id": file_id}}
+        field = "video" if method == "sendVideo" else "animation"
+        return {field: {"file_id": file_id, "file_unique_id": file_id, "width": 720, "height": 1280, "duration": 10}}
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Отдает файлы заданного размера: /media/<размер>/<имя>, поддерживает Range"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "media" or not parts[1].isdigit():
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        total = int(parts[1])
+        start, end = 0, total - 1
+        range_header = self.headers.get("Range")
+        if range_header:
+            match = re.match(r"bytes=(\d+)-(\d*)", range_header)
+            start = int(match.group(1))
+            end = min(int(match.group(2)), total - 1) if match.group(2) else total - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if not send_body:
+            return
+
+        block = self.server.block
+        position = start
+        try:
+            while position <= end:
+                offset = position % len(block)
+                chunk = block[offset:offset + end + 1 - position]
+                self.wfile.write(chunk)
+                position += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MediaHandler)
+        # Содержимое файлов повторяет один блок, чтобы не держать их в памяти
+        self.block = bytes(range(256)) * 1024
+
+    def handle_error(self, request, client_address):
+        pass
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubEngine:
+    """
+    Заглушка YtdlpEngine: вместо обращения к платформе ждет заданное
+    время и возвращает ссылку на файл локального сервера (или скачивает
+    его, как это сделал бы yt-dlp)
+
+    Счетчик вызовов calls - multiprocessing.Value, общий для рабочих процессов.
+    """
+
+    def __init__(self, media_base, sizes, extract_delay, calls):
+        self.media_base = media_base
+        self.sizes = sizes
+        self.extract_delay = extract_delay
+        self.calls = calls
+
+    def extract(self, url, options=None, save_dir=None, download=True, timeout=None,
+                max_size=None, policy=None, download_entries=True):
+        import requests
+        from utils import get_platform, extract_media_id
+        from ytdlp_engine import YtdlpError
+
+        with self.calls.get_lock():
+            self.calls.value += 1
+        time.sleep(self.extract_delay)
+        media_id = extract_media_id(url, get_platform(url))
+        size = self.sizes[media_id]
+        media_url = f"{self.media_base}/media/{size}/{media_id}.mp4"
+        info = {"id": media_id, "extractor": "tiktok", "ext": "mp4", "url": media_url,
+                "filesize": size, "http_headers": {}}
+        if max_size and size > max_size:
+            raise YtdlpError(f"Все форматы больше {max_size} байт", "file_too_large")
+        if not download:
+            return info
+
+        file_path = os.path.join(save_dir, f"tiktok_{media_id}.mp4")
+        with requests.get(media_url, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            with open(file_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=256 * 1024):
+                    f.write(chunk)
+        info["filepath"] = file_path
+        return info
+
+    def shutdown(self):
+        pass
+
+
+def proc_status():
+    """Возвращает пиковую память (КБ) и количество потоков процесса из /proc"""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("VmHWM", "VmRSS", "Threads"):
+                    values[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def dir_size(path):
+    """Суммарный размер файлов в директории"""
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.path.getsize(os.path.join(dir_path, file_name))
+            except OSError:
+                pass
+    return total
+
+
+class Sampler(threading.Thread):
+    """Периодически снимает количество потоков и объем временных файлов"""
+
+    def __init__(self, temp_dir, interval=0.2):
+        super().__init__(daemon=True)
+        self.temp_dir = temp_dir
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_disk = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak_threads = max(self.peak_threads, proc_status().get("Threads", threading.active_count()))
+            self.peak_disk = max(self.peak_disk, dir_size(self.temp_dir))
+
+
+def configure_bot(bot_module, work_dir, pipeline, rate_limit, engine):
+    """Подключает bot.py к заглушкам (в процессе приема обновлений и в рабочих процессах)"""
+    from storage import StorageManager
+    from ratelimit import RateLimiter, MemoryBackend
+
+    bot_module.SEND_BY_URL = False
+    bot_module.STREAM_UPLOAD = pipeline == "stream"
+    # Все временные файлы - на диске в рабочей директории, чтобы их объем было видно
+    bot_module.storage = StorageManager(root=os.path.join(work_dir, "downloads"), memory_root=None)
+    if not rate_limit:
+        bot_module.rate_limiter = RateLimiter(
+            MemoryBackend(), user_limit=10 ** 9, platform_limits={}, global_limit=None
+        )
+    bot_module.downloader.engine.shutdown()
+    bot_module.downloader.engine = engine
+
+
+def run_worker(api_url, work_dir, pipeline, engine, stopped):
+    """Рабочий процесс: выполняет задания общей очереди, пока не установлен stopped"""
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    os.chdir(work_dir)
+
+    from telebot import apihelper
+    apihelper.API_URL = api_url
+
+    import bot as bot_module
+    from jobqueue import JobQueue, QueueWorker
+
+    configure_bot(bot_module, work_dir, pipeline, True, engine)
+    worker = QueueWorker(JobQueue(), bot_module.process_url, bot_module.fail_job)
+    worker.start()
+    stopped.wait()
+    os._exit(0)
+
+
+def generate_load(args, rng):
+    """Формирует последовательность ссылок: (пользователь, ID медиа, размер)"""
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    links = []
+    known = []
+    for index in range(args.links):
+        user_id = 100000 + rng.randrange(args.users)
+        if known and rng.random() < args.duplicates:
+            media_id, size = rng.choice(known)
+        else:
+            media_id = str(7300000000000000000 + index)
+            size = rng.choice(sizes)
+            known.append((media_id, size))
+        links.append((user_id, media_id, size))
+    return links
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк bot.py с локальными заглушками")
+    parser.add_argument("--links", type=int, default=200, help="количество ссылок")
+    parser.add_argument("--rate", type=float, default=20, help="ссылок в секунду")
+    parser.add_argument("--users", type=int, default=50, help="количество пользователей")
+    parser.add_argument("--duplicates", type=float, default=0.3, help="доля повторных ссылок")
+    parser.add_argument("--sizes", default="1M,4M", help="размеры файлов через запятую (K, M, G)")
+    parser.add_argument("--pipeline", choices=("stream", "download"), default="stream",
+                        help="stream - потоковая передача, download - скачивание на диск")
+    parser.add_argument("--extract-ms", type=float, default=200, help="задержка заглушки экстрактора")
+    parser.add_argument("--api-ms", type=float, default=0, help="задержка ответов заглушки Bot API")
+    parser.add_argument("--rate-limit", action="store_true", help="включить ограничение запросов пользователей")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="количество рабочих процессов общей очереди (0 - обработка в одном процессе)")
+    parser.add_argument("--seed", type=int, default=1, help="seed генератора нагрузки")
+    parser.add_argument("--timeout", type=float, default=300, help="время ожидания завершения ссылок")
+    parser.add_argument("--json", help="сохранить результат в JSON файл")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    links = generate_load(args, rng)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # Базы данных и временные файлы бота создаются в отдельной директории
+    work_dir = tempfile.mkdtemp(prefix="load_bench_")
+    os.chdir(work_dir)
+
+    stats = LoadStats()
+    api = FakeBotAPIServer(stats, args.api_ms / 1000)
+    media = MediaServer()
+    for server in (api, media):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    from telebot import apihelper
+    api_url = f"http://127.0.0.1:{api.server_address[1]}/bot{{0}}/{{1}}"
+    apihelper.API_URL = api_url
+
+    import bot as bot_module
+
+    # Рабочие процессы запускаются заново (spawn), а не копией процесса с потоками
+    context = multiprocessing.get_context("spawn")
+    engine = StubEngine(
+        media.base_url, {media_id: size for _, media_id, size in links},
+        args.extract_ms / 1000, context.Value("i", 0)
+    )
+    configure_bot(bot_module, work_dir, args.pipeline, args.rate_limit, engine)
+
+    workers = []
+    stopped = context.Event()
+    if args.workers:
+        from jobqueue import JobQueue
+
+        bot_module.use_job_queue(JobQueue())
+        for _ in range(args.workers):
+            process = context.Process(target=run_worker, args=(api_url, work_dir, args.pipeline, engine, stopped))
+            process.start()
+            workers.append(process)
+
+    polling = threading.Thread(
+        target=bot_module.bot.polling,
+        kwargs={"non_stop": True, "interval": 0, "long_polling_timeout": 1},
+        daemon=True
+    )
+    polling.start()
+
+    baseline = proc_status()
+    sampler = Sampler(os.path.join(work_dir, "downloads"))
+    sampler.start()
+
+    print(f"Ссылок: {len(links)}, частота: {args.rate}/с, пользователей: {args.users}, "
+          f"повторов: {args.duplicates:.0%}, размеры: {args.sizes}, режим: {args.pipeline}, "
+          f"рабочих процессов: {args.workers}")
+    started = time.monotonic()
+    for index, (user_id, media_id, size) in enumerate(links):
+        # Ссылки подаются по расписанию, а не после обработки предыдущих
+        delay = started + index / args.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        stats.sent_link(user_id)
+        api.updates.put({
+            "message_id": index + 1,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+            "text": f"https://www.tiktok.com/@bench/video/{media_id}",
+        })
+
+    finished = stats.wait(args.timeout)
+    sampler.stopped.set()
+    sampler.join()
+    bot_module.bot.stop_polling()
+    bot_module.scheduler.shutdown(drain=False)
+    stopped.set()
+    for process in workers:
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+
+    latencies = sorted(stats.latencies)
+    elapsed = (stats.last_done or time.monotonic()) - stats.first_sent
+    status = proc_status()
+    result = {
+        "links": stats.sent,
+        "completed": stats.completed(),
+        "results": dict(stats.results),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(stats.completed() / elapsed, 2) if elapsed else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "workers": args.workers,
+        "extractor_calls": engine.calls.value,
+        "baseline_rss_kb": baseline.get("VmRSS"),
+        "peak_rss_kb": status.get("VmHWM"),
+        "baseline_threads": baseline.get("Threads"),
+        "peak_threads": sampler.peak_threads,
+        "peak_temp_bytes": sampler.peak_disk,
+        "timed_out": not finished,
+    }
+
+    print(f"Завершено: {result['completed']} из {result['links']} за {elapsed:.2f} с "
+          f"({result['throughput_per_second']}/с)" + ("" if finished else " - превышено время ожидания"))
+    print(f"Результаты: {result['results']}")
+    if latencies:
+        print(f"Задержка: p50 {result['latency_p50']:.3f} с, p95 {result['latency_p95']:.3f} с, "
+              f"p99 {result['latency_p99']:.3f} с")
+    print(f"Вызовов экстрактора: {engine.calls.value}")
+    print(f"Память: {result['baseline_rss_kb']} КБ до нагрузки, пик {result['peak_rss_kb']} КБ")
+    print(f"Потоков: {result['baseline_threads']} до нагрузки, пик {result['peak_threads']}")
+    print(f"Временные файлы: пик {result['peak_temp_bytes'] / 1024 / 1024:.1f} МБ")
+    print("Память и потоки включают заглушки, работающие в том же процессе"
+          + (" (рабочие процессы не учитываются)" if workers else ""))
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+    api.shutdown()
+    media.shutdown()
+    os.chdir("/")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    # Рабочие потоки бота не являются демонами - завершаем процесс явно
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Микробенчмарк ограничителя запросов: стоимость одной проверки не должна
+расти с количеством отслеживаемых пользователей.
+
+Запуск из корня проекта: python scripts/ratelimit_bench.py [пользователей]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import RateLimiter, MemoryBackend, SQLiteBackend
+
+# Количество проверок в каждом замере
+SAMPLE_CHECKS = 100000
+
+# Количество проверок в замере для SQLite
+SQLITE_SAMPLE_CHECKS = 5000
+
+PLATFORMS = ["instagram", "tiktok", "pinterest"]
+
+
+def measure(limiter, users, checks):
+    """Возвращает среднее время одной проверки (в микросекундах) для случайных пользователей"""
+    user_ids = [random.randrange(users) for _ in range(checks)]
+    started = time.perf_counter()
+    for user_id in user_ids:
+        limiter.check(user_id, PLATFORMS[user_id % 3])
+    return (time.perf_counter() - started) / checks * 1e6
+
+
+def fill(limiter, users):
+    """Заводит корзины для указанного количества пользователей"""
+    for user_id in range(users):
+        limiter.check(user_id, PLATFORMS[user_id % 3])
+
+
+def main():
+    max_users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    # Общие лимиты отключены, чтобы все проверки проходили полный путь
+    print("Хранилище в памяти")
+    backend = MemoryBackend()
+    limiter = RateLimiter(backend, platform_limits={}, global_limit=None)
+    tracked = 0
+    users = 1000
+    while users <= max_users:
+        fill(limiter, users)
+        tracked = backend.size()
+        cost = measure(limiter, users, SAMPLE_CHECKS)
+        print(f"  {tracked:>9} ключей: {cost:.2f} мкс на проверку")
+        users *= 10
+
+    print("Хранилище SQLite")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = SQLiteBackend(os.path.join(tmp_dir, "rate_limits.db"))
+        limiter = RateLimiter(backend, platform_limits={}, global_limit=None)
+        users = 1000
+        while users <= min(max_users, 100000):
+            fill(limiter, users)
+            cost = measure(limiter, users, SQLITE_SAMPLE_CHECKS)
+            print(f"  {backend.size():>9} ключей: {cost:.2f} мкс на проверку")
+            users *= 10
+
+
+if __name__ == "__main__":
+    main()
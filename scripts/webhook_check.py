@@ -0,0 +1,101 @@
+"""
+Локальная проверка вебхука: поднимает WebhookServer и отправляет ему
+синтетические обновления, как это делает Telegram.
+
+Запуск из корня проекта: python scripts/webhook_check.py
+"""
+import os
+import sys
+import json
+import time
+import urllib.request
+import urllib.error
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webhook import WebhookServer, SECRET_HEADER
+
+SECRET = "local-check-secret"
+
+# Синтетическое обновление с текстовым сообщением
+MESSAGE_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "https://www.tiktok.com/@user/video/7300000000000000000"
+    }
+}
+
+# Обновление типа, который бот не обрабатывает
+EDITED_UPDATE = {
+    "update_id": 2,
+    "edited_message": MESSAGE_UPDATE["message"]
+}
+
+
+def post(port, path, body, secret=SECRET):
+    """Отправляет POST запрос и возвращает код ответа и время ответа"""
+    data = body if isinstance(body, bytes) else json.dumps(body).encode()
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}",
+        data=data,
+        headers={"Content-Type": "application/json", SECRET_HEADER: secret},
+        method="POST"
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+
+def main():
+    received = []
+
+    def dispatch(updates):
+        # Имитируем долгую обработку: ответ не должен ее ждать
+        time.sleep(0.5)
+        received.extend(updates)
+
+    server = WebhookServer(dispatch, host="127.0.0.1", port=0, path="/webhook", secret=SECRET)
+    server.start()
+
+    checks = [
+        ("сообщение принимается", post(server.port, "/webhook", MESSAGE_UPDATE), 200),
+        ("неверный токен отклоняется", post(server.port, "/webhook", MESSAGE_UPDATE, "wrong"), 403),
+        ("неизвестный путь", post(server.port, "/other", MESSAGE_UPDATE), 404),
+        ("некорректный JSON", post(server.port, "/webhook", b"{not json"), 400),
+        ("лишний тип обновления", post(server.port, "/webhook", EDITED_UPDATE), 200),
+    ]
+
+    failed = False
+    for name, (status, elapsed), expected in checks:
+        ok = status == expected
+        failed |= not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {name}: {status} (ожидался {expected}), {elapsed * 1000:.1f} мс")
+
+    # Ответ на первое обновление должен прийти раньше, чем закончится обработка
+    if checks[0][1][1] >= 0.5:
+        print("FAIL ответ вебхука ждал обработки обновления")
+        failed = True
+
+    time.sleep(1)
+    server.shutdown()
+
+    update_ids = [update.update_id for update in received]
+    if update_ids != [MESSAGE_UPDATE["update_id"]]:
+        print(f"FAIL переданы на обработку обновления {update_ids}, ожидалось [1]")
+        failed = True
+    else:
+        print("OK   на обработку передано только сообщение")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
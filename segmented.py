@@ -0,0 +1,206 @@
+import os
+import re
+import time
+import random
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    MAX_RETRIES, RETRY_DELAY, RETRY_MAX_DELAY, REQUEST_TIMEOUT, DOWNLOAD_SEGMENTS,
+    DOWNLOAD_SEGMENT_MIN_SIZE, DOWNLOAD_WORKERS, DOWNLOAD_CHUNK_MIN, DOWNLOAD_CHUNK_MAX
+)
+
+# Заголовок Content-Range ответа 206: "bytes 0-1023/4096"
+CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+\d+-\d+/(\d+)')
+
+# Сколько частей чтения приходится на файл при выборе размера части
+CHUNKS_PER_FILE = 256
+
+
+class DownloadError(Exception):
+    """Ошибка скачивания файла"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def backoff_delay(attempt):
+    """Экспоненциальная задержка перед повтором со случайным разбросом"""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** attempt))
+
+
+def chunk_size_for(total):
+    """Размер части чтения: для больших файлов больше, чтобы реже обращаться к сокету"""
+    if not total:
+        return DOWNLOAD_CHUNK_MIN
+    return max(DOWNLOAD_CHUNK_MIN, min(DOWNLOAD_CHUNK_MAX, total // CHUNKS_PER_FILE))
+
+
+class SegmentedDownloader:
+    """
+    Скачивание файлов по HTTP с докачкой
+
+    Если сервер поддерживает запросы Range, большие файлы делятся на
+    сегменты, которые скачиваются параллельно. После обрыва соединения
+    скачивание продолжается с места остановки, а не начинается заново.
+    Повторы выполняются с экспоненциальной задержкой, а итоговый размер
+    файла сверяется с размером, который сообщил сервер.
+    """
+
+    def __init__(self, session, segments=DOWNLOAD_SEGMENTS,
+                 min_segment_size=DOWNLOAD_SEGMENT_MIN_SIZE, workers=DOWNLOAD_WORKERS):
+        self.session = session
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="segment")
+
+    def download(self, url, path, max_size, headers=None):
+        """
+        Скачивает файл по URL
+
+        Args:
+            url: URL файла
+            path: Путь для сохранения
+            max_size: Максимальный размер файла
+            headers: Дополнительные заголовки запросов (например, от yt-dlp для CDN)
+
+        Raises:
+            DownloadError: Если скачать файл не удалось
+        """
+        response = self._open(url, 0, headers)
+        with response:
+            total, ranged = self._inspect(response)
+            if total is not None and total > max_size:
+                logging.warning(f"Файл слишком большой: {total} байт")
+                raise DownloadError("file_too_large")
+
+            if ranged and total and total >= self.min_segment_size * 2 and self.segments > 1:
+                response.close()
+                self._download_segments(url, path, total, headers)
+            else:
+                self._download_single(url, path, response, total, ranged, max_size, headers)
+
+        file_size = os.path.getsize(path)
+        if file_size == 0:
+            logging.warning("Скачан пустой файл")
+            raise DownloadError("empty_file")
+        if total is not None and file_size != total:
+            logging.warning(f"Размер скачанного файла {file_size} не совпадает с ожидаемым {total}")
+            raise DownloadError("download_failed")
+
+    def _open(self, url, offset, headers=None):
+        """Открывает поток с указанной позиции, повторяя запрос при ошибках"""
+        headers = dict(headers or {}, Range=f'bytes={offset}-')
+        for attempt in range(MAX_RETRIES):
+            try:
+                response = self.session.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT)
+                response.raise_for_status()
+                return response
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Ошибка при скачивании (попытка {attempt+1}/{MAX_RETRIES}): {e}")
+                if attempt < MAX_RETRIES - 1:
+                    time.sleep(backoff_delay(attempt))
+        raise DownloadError("download_failed")
+
+    def _inspect(self, response):
+        """
+        Определяет размер файла и поддержку докачки
+
+        Returns:
+            tuple: (размер файла или None, поддерживает ли сервер Range)
+        """
+        if response.status_code == 206:
+            match = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+            return (int(match.group(1)) if match else None), True
+
+        total = None
+        # Для сжатого при передаче ответа Content-Length не совпадает с размером файла
+        if response.headers.get('Content-Length') and not response.headers.get('Content-Encoding'):
+            total = int(response.headers['Content-Length'])
+        return total, response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+
+    def _download_single(self, url, path, response, total, ranged, max_size, headers=None):
+        """Скачивает файл одним соединением, продолжая с места обрыва"""
+        chunk_size = chunk_size_for(total)
+        with open(path, 'wb') as f:
+            for attempt in range(MAX_RETRIES):
+                try:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        # Прекращаем скачивание, как только файл превысил лимит
+                        if f.tell() + len(chunk) > max_size:
+                            logging.warning(f"Скачанный файл больше {max_size} байт")
+                            raise DownloadError("file_too_large")
+                        f.write(chunk)
+                    return
+                except requests.exceptions.RequestException as e:
+                    response.close()
+                    logging.error(f"Обрыв скачивания на {f.tell()} байте (попытка {attempt+1}/{MAX_RETRIES}): {e}")
+                    if attempt == MAX_RETRIES - 1:
+                        raise DownloadError("download_failed")
+                    time.sleep(backoff_delay(attempt))
+
+                    offset = f.tell() if ranged else 0
+                    response = self._open(url, offset, headers)
+                    # Сервер может проигнорировать Range и отдать файл целиком
+                    if response.status_code != 206:
+                        offset = 0
+                    f.seek(offset)
+                    f.truncate()
+
+    def _download_segments(self, url, path, total, headers=None):
+        """Скачивает файл параллельными сегментами"""
+        count = min(self.segments, total // self.min_segment_size)
+        segment_size = -(-total // count)
+        chunk_size = chunk_size_for(segment_size)
+
+        # Файл создается сразу нужного размера, сегменты пишутся каждый в свою область
+        with open(path, 'wb') as f:
+            f.truncate(total)
+
+        failed = threading.Event()
+        futures = [
+            self.executor.submit(
+                self._download_segment, url, path, start, min(start + segment_size, total) - 1,
+                chunk_size, failed, headers
+            )
+            for start in range(0, total, segment_size)
+        ]
+        logging.info(f"Скачиваем {total} байт в {len(futures)} сегментов: {url}")
+        for future in futures:
+            future.result()
+
+    def _download_segment(self, url, path, start, end, chunk_size, failed, headers=None):
+        """Скачивает диапазон байт [start, end], докачивая его после обрывов"""
+        offset = start
+        with open(path, 'r+b') as f:
+            for attempt in range(MAX_RETRIES):
+                if failed.is_set():
+                    raise DownloadError("download_failed")
+                try:
+                    range_headers = dict(headers or {}, Range=f'bytes={offset}-{end}')
+                    with self.session.get(url, headers=range_headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                        response.raise_for_status()
+                        if response.status_code != 206:
+                            logging.error(f"Сервер перестал поддерживать Range: {url}")
+                            failed.set()
+                            raise DownloadError("download_failed")
+                        f.seek(offset)
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            chunk = chunk[:end + 1 - offset]
+                            f.write(chunk)
+                            offset += len(chunk)
+                            if offset > end or failed.is_set():
+                                break
+                    if offset > end:
+                        return
+                    logging.warning(f"Сегмент {start}-{end} получен не полностью: {offset - start} байт")
+                except requests.exceptions.RequestException as e:
+                    logging.error(f"Ошибка сегмента {start}-{end} на {offset} байте "
+                                  f"(попытка {attempt+1}/{MAX_RETRIES}): {e}")
+                if attempt < MAX_RETRIES - 1:
+                    time.sleep(backoff_delay(attempt))
+
+        failed.set()
+        raise DownloadError("download_failed")
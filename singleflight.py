@@ -0,0 +1,112 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """Выполняющийся запрос и его результат"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные одинаковые запросы в один
+
+    Пока запрос с некоторым ключом выполняется, остальные вызовы с тем же
+    ключом не запускают его повторно, а ждут и получают тот же результат
+    (или то же исключение).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Выполняет fn один раз для всех одновременных вызовов с ключом key
+
+        Args:
+            key: Ключ запроса
+            fn: Функция, выполняющая запрос
+
+        Returns:
+            tuple: (результат, shared), где shared=True, если результат
+                   получен от запроса, запущенного другим вызовом
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self.calls[key] = call
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+        return call.result, False
+
+    def in_flight(self):
+        """Возвращает количество выполняющихся запросов"""
+        with self.lock:
+            return len(self.calls)
+
+
+class AsyncSingleFlight:
+    """То же, что SingleFlight, но для корутин asyncio"""
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Выполняет корутину fn один раз для всех одновременных вызовов с ключом key
+
+        Returns:
+            tuple: (результат, shared), где shared=True, если результат
+                   получен от запроса, запущенного другим вызовом
+        """
+        future = self.calls.get(key)
+        if future is not None:
+            # shield: отмена одного ожидающего не должна отменять общий запрос
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(e)
+            # Помечаем исключение полученным, даже если ожидающих не было
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            del self.calls[key]
+            if not future.done():
+                future.cancel()
+        return result, False
+
+    def in_flight(self):
+        """Возвращает количество выполняющихся запросов"""
+        return len(self.calls)
@@ -0,0 +1,241 @@
+import os
+import time
+import shutil
+import tempfile
+import logging
+import threading
+from collections import OrderedDict
+from config import (
+    TEMP_DIR, TEMP_FILE_TTL, STORAGE_MAX_BYTES, STORAGE_MIN_LEASE,
+    STORAGE_MEMORY_DIR, STORAGE_MEMORY_MAX_FILE, STORAGE_MEMORY_MAX_BYTES
+)
+
+
+class StorageManager:
+    """
+    Учет временных файлов заданий
+
+    Каждый скачанный файл берется в аренду на TEMP_FILE_TTL секунд и
+    удаляется, когда задание его освобождает или когда аренда истекает.
+    Общий объем файлов ограничен бюджетом: при его превышении удаляются
+    давно не использовавшиеся файлы (LRU) заданий, которые не работали
+    ни с одним своим файлом последние STORAGE_MIN_LEASE секунд, даже если
+    аренда этих файлов еще не истекла. Файлы заданий, работавших с ними
+    недавно, не вытесняются: если места не хватает, новый файл
+    отклоняется, а размер известен заранее - задание отклоняется еще до
+    скачивания. Небольшие файлы по возможности размещаются в памяти (tmpfs).
+    """
+
+    def __init__(self, root=TEMP_DIR, ttl=TEMP_FILE_TTL, max_bytes=STORAGE_MAX_BYTES,
+                 min_lease=STORAGE_MIN_LEASE, memory_root=STORAGE_MEMORY_DIR,
+                 memory_max_file=STORAGE_MEMORY_MAX_FILE, memory_max_bytes=STORAGE_MEMORY_MAX_BYTES):
+        self.root = os.path.abspath(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.min_lease = min_lease
+        self.memory_max_file = memory_max_file
+        self.memory_max_bytes = memory_max_bytes
+        self.memory_root = None
+        if memory_root and os.path.isdir(os.path.dirname(memory_root)):
+            self.memory_root = memory_root
+
+        # Путь -> [размер, время истечения аренды, время последнего использования]
+        self.files = OrderedDict()
+        self.used_bytes = 0
+        self.memory_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+        for path in (self.root, self.memory_root):
+            if path:
+                os.makedirs(path, exist_ok=True)
+        # Файлы, оставшиеся от предыдущего запуска, удаляем после истечения TTL
+        self.sweep()
+
+    def job_dir(self, user_id, size_hint=None):
+        """
+        Создает отдельную директорию для файлов задания пользователя
+
+        Args:
+            user_id: Идентификатор пользователя
+            size_hint: Ожидаемый размер файла, если он известен заранее
+
+        Returns:
+            str: Путь к новой директории (в памяти для небольших файлов)
+        """
+        root = self.root
+        if self.memory_root and size_hint and size_hint <= self.memory_max_file:
+            with self.lock:
+                if self.memory_bytes + size_hint <= self.memory_max_bytes:
+                    root = self.memory_root
+        user_dir = os.path.join(root, str(user_id))
+        os.makedirs(user_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix="job_", dir=user_dir)
+
+    def has_room(self, size=None):
+        """
+        Проверяет до скачивания, поместится ли файл в бюджет
+
+        При необходимости вытесняет давно не использовавшиеся файлы.
+
+        Args:
+            size: Ожидаемый размер файла; если он неизвестен, проверяется
+                только, что бюджет еще не исчерпан
+
+        Returns:
+            bool: True, если место под файл есть
+        """
+        now = time.time()
+        with self.lock:
+            self._make_room(size or 0, now)
+            if size:
+                return self.used_bytes + size <= self.max_bytes
+            return self.used_bytes < self.max_bytes
+
+    def track(self, path, ttl=None):
+        """
+        Берет файл в аренду
+
+        Returns:
+            bool: True, если файл помещается в бюджет, иначе файл удаляется
+        """
+        path = os.path.abspath(path)
+        size = os.path.getsize(path)
+        now = time.time()
+        with self.lock:
+            self._forget(path)
+            self._make_room(size, now)
+            if self.used_bytes + size <= self.max_bytes:
+                self.files[path] = [size, now + (ttl or self.ttl), now]
+                self.used_bytes += size
+                if self._in_memory(path):
+                    self.memory_bytes += size
+                return True
+        logging.warning(f"Недостаточно места для временного файла {path} ({size} байт)")
+        self._remove(path)
+        return False
+
+    def touch(self, path):
+        """Отмечает, что задание продолжает работать с файлом"""
+        path = os.path.abspath(path)
+        with self.lock:
+            entry = self.files.get(path)
+            if entry:
+                entry[2] = time.time()
+                self.files.move_to_end(path)
+
+    def release(self, path):
+        """Освобождает аренду и удаляет файл"""
+        path = os.path.abspath(path)
+        with self.lock:
+            self._forget(path)
+        self._remove(path)
+
+    def release_job(self, job_dir):
+        """Освобождает все файлы задания и удаляет его директорию"""
+        job_dir = os.path.abspath(job_dir)
+        prefix = job_dir + os.sep
+        with self.lock:
+            for path in [path for path in self.files if path.startswith(prefix)]:
+                self._forget(path)
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    def sweep(self):
+        """Удаляет файлы с истекшей арендой и файлы, о которых менеджер не знает"""
+        now = time.time()
+        with self.lock:
+            expired = [path for path, (_, expires_at, _) in self.files.items() if expires_at <= now]
+            for path in expired:
+                self._forget(path)
+            self.expirations += len(expired)
+            known = set(self.files)
+
+        for path in expired:
+            logging.info(f"Аренда временного файла истекла: {path}")
+            self._remove(path)
+
+        # Файлы, которые не были взяты в аренду (прерванные загрузки, остатки после сбоев)
+        for root in (self.root, self.memory_root):
+            if not root or not os.path.isdir(root):
+                continue
+            for dir_path, dir_names, file_names in os.walk(root, topdown=False):
+                for file_name in file_names:
+                    path = os.path.join(dir_path, file_name)
+                    try:
+                        if path not in known and now - os.path.getmtime(path) > self.ttl:
+                            os.remove(path)
+                    except OSError:
+                        pass
+                # Пустые директории удаляем, только если ими давно не пользовались
+                try:
+                    if dir_path != root and not os.listdir(dir_path) \
+                            and now - os.path.getmtime(dir_path) > self.ttl:
+                        os.rmdir(dir_path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Возвращает текущее использование места"""
+        with self.lock:
+            return {
+                'files': len(self.files),
+                'used_bytes': self.used_bytes,
+                'memory_bytes': self.memory_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def _make_room(self, size, now):
+        """Вытесняет давно не использовавшиеся файлы, пока новый файл не поместится"""
+        if self.used_bytes + size <= self.max_bytes:
+            return
+        # Время, когда задание последний раз работало с любым из своих файлов
+        job_used = {}
+        for path, (_, _, last_used) in self.files.items():
+            job = self._job_of(path)
+            job_used[job] = max(job_used.get(job, 0), last_used)
+        for path in list(self.files):
+            if self.used_bytes + size <= self.max_bytes:
+                return
+            # Файлы упорядочены по времени использования - дальше только более свежие
+            if now - self.files[path][2] < self.min_lease:
+                return
+            if now - job_used[self._job_of(path)] < self.min_lease:
+                continue
+            logging.warning(f"Временный файл вытеснен из-за нехватки места: {path}")
+            self._forget(path)
+            self.evictions += 1
+            self._remove(path)
+
+    def _forget(self, path):
+        """Снимает файл с учета (вызывается под блокировкой)"""
+        entry = self.files.pop(path, None)
+        if entry:
+            self.used_bytes -= entry[0]
+            if self._in_memory(path):
+                self.memory_bytes -= entry[0]
+
+    def _job_of(self, path):
+        """Директория задания, к которому относится файл (<корень>/<пользователь>/<задание>)"""
+        for root in (self.root, self.memory_root):
+            if root and path.startswith(root + os.sep):
+                parts = os.path.relpath(path, root).split(os.sep)
+                if len(parts) > 2:
+                    return os.path.join(root, parts[0], parts[1])
+        return os.path.dirname(path)
+
+    def _in_memory(self, path):
+        """Проверяет, размещен ли файл в памяти"""
+        return bool(self.memory_root) and path.startswith(self.memory_root + os.sep)
+
+    def _remove(self, path):
+        """Удаляет файл с диска"""
+        try:
+            os.remove(path)
+            logging.info(f"Файл удален: {path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Не удалось удалить файл: {path} ({e})")
@@ -0,0 +1,156 @@
+import uuid
+import logging
+import requests
+from telebot import apihelper, types
+from config import TOKEN, MAX_FILE_SIZE, REQUEST_TIMEOUT, UPLOAD_TIMEOUT, STREAM_CHUNK_SIZE
+from http_pool import create_session
+
+# Адрес Bot API по умолчанию (если в telebot не задан свой)
+DEFAULT_API_URL = "https://api.telegram.org/bot{0}/{1}"
+
+# Метод Bot API, имя поля и MIME тип для каждого типа медиа
+UPLOAD_METHODS = {
+    'video': ('sendVideo', 'video', 'video/mp4'),
+    'image': ('sendPhoto', 'photo', 'image/jpeg'),
+    'gif': ('sendAnimation', 'animation', 'image/gif'),
+}
+DOCUMENT_METHOD = ('sendDocument', 'document', 'application/octet-stream')
+
+
+class StreamingError(Exception):
+    """Ошибка потоковой передачи файла"""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class StreamingMultipart:
+    """
+    Тело запроса multipart/form-data, которое передает файл по частям
+
+    Содержимое файла не собирается в памяти целиком: части читаются из
+    источника по мере отправки запроса. Если размер файла известен,
+    у объекта есть атрибут len, и requests отправит Content-Length,
+    иначе тело будет передано с Transfer-Encoding: chunked.
+    """
+
+    def __init__(self, fields, file_field, file_name, mime_type, chunks, file_size=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.chunks = chunks
+        self.sent = 0
+
+        head = b"".join(
+            self._field_header(name) + str(value).encode() + b"\r\n"
+            for name, value in fields.items() if value is not None
+        )
+        self.head = head + (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{file_name}"\r\n'
+            f'Content-Type: {mime_type}\r\n\r\n'
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+        if file_size:
+            self.len = len(self.head) + file_size + len(self.tail)
+
+    def _field_header(self, name):
+        """Заголовок обычного текстового поля формы"""
+        return (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+        ).encode()
+
+    def __iter__(self):
+        yield self.head
+        for chunk in self.chunks:
+            if not chunk:
+                continue
+            self.sent += len(chunk)
+            if self.sent > MAX_FILE_SIZE:
+                raise StreamingError("file_too_large")
+            yield chunk
+        if self.sent == 0:
+            raise StreamingError("empty_file")
+        yield self.tail
+
+
+class StreamingUploader:
+    """Передает медиафайл с CDN в Telegram без сохранения на диск"""
+
+    def __init__(self, download_session):
+        self.download_session = download_session
+        self.upload_session = create_session()
+
+    def upload(self, chat_id, media_url, file_type, file_name, caption, headers=None):
+        """
+        Скачивает файл по частям и сразу отправляет его в Telegram
+
+        Args:
+            chat_id: Идентификатор чата
+            media_url: Прямая ссылка на медиафайл
+            file_type: Тип медиа (video, image, gif)
+            file_name: Имя файла для Telegram
+            caption: Подпись
+            headers: Дополнительные заголовки для запроса к CDN
+
+        Returns:
+            Message: Отправленное сообщение
+
+        Raises:
+            StreamingError: Если файл слишком большой, пустой или недоступен
+            ApiTelegramException: Если Telegram отклонил запрос
+        """
+        method, file_field, mime_type = UPLOAD_METHODS.get(file_type, DOCUMENT_METHOD)
+
+        try:
+            response = self.download_session.get(
+                media_url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+            )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Ошибка при запросе медиафайла для потоковой передачи: {e}")
+            raise StreamingError("download_failed")
+
+        with response:
+            # При сжатии на стороне CDN размер тела не совпадает с Content-Length
+            file_size = None
+            if not response.headers.get('Content-Encoding'):
+                file_size = int(response.headers.get('Content-Length', 0)) or None
+            if file_size and file_size > MAX_FILE_SIZE:
+                logging.warning(f"Файл слишком большой: {file_size} байт")
+                raise StreamingError("file_too_large")
+
+            body = StreamingMultipart(
+                fields={
+                    'chat_id': chat_id,
+                    'caption': caption,
+                    'supports_streaming': 'true' if file_type == 'video' else None,
+                },
+                file_field=file_field,
+                file_name=file_name,
+                mime_type=mime_type,
+                chunks=response.iter_content(chunk_size=STREAM_CHUNK_SIZE),
+                file_size=file_size
+            )
+
+            api_url = (apihelper.API_URL or DEFAULT_API_URL).format(TOKEN, method)
+            result = self.upload_session.post(
+                api_url,
+                data=body,
+                headers={'Content-Type': body.content_type},
+                timeout=(REQUEST_TIMEOUT, UPLOAD_TIMEOUT)
+            )
+
+        if result.status_code == 413:
+            raise StreamingError("file_too_large")
+        try:
+            result_json = result.json()
+        except ValueError:
+            raise StreamingError("upload_failed")
+        if not result_json.get('ok'):
+            raise apihelper.ApiTelegramException(method, result, result_json)
+
+        logging.info(f"Файл передан в Telegram потоком: {body.sent / 1024:.2f} КБ")
+        return types.Message.de_json(result_json['result'])
@@ -0,0 +1,235 @@
+import os
+import time
+import shutil
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from config import (
+    MAX_FILE_SIZE, TRANSCODE_ENABLED, TRANSCODE_WORKERS, TRANSCODE_QUEUE_SIZE,
+    TRANSCODE_TIMEOUT, TRANSCODE_AUDIO_BITRATE, TRANSCODE_MIN_VIDEO_BITRATE,
+    TRANSCODE_IMAGE_MAX_SIZE, TRANSCODE_FFMPEG_THREADS
+)
+
+# Доля лимита, на которую рассчитывается битрейт (контейнер и погрешность кодировщика)
+SIZE_MARGIN = 0.92
+
+# Во сколько раз снижается битрейт, если файл после первой попытки не поместился
+RETRY_FACTOR = 0.8
+
+# Максимальная высота видео в зависимости от доступного битрейта (кбит/с)
+HEIGHT_BY_BITRATE = [(2500, 1080), (1200, 720), (600, 480), (0, 360)]
+
+# Максимальная сторона изображения после пересжатия
+IMAGE_MAX_SIDE = 2560
+
+# Качество JPEG для ffmpeg (2 - лучшее, 31 - худшее)
+IMAGE_QUALITY = [3, 6, 10]
+
+
+def _run_ffmpeg(args, timeout):
+    """Запускает ffmpeg и возвращает True при успешном завершении"""
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(command, capture_output=True, timeout=timeout)
+    if result.returncode != 0:
+        logging.warning(f"ffmpeg завершился с ошибкой: {result.stderr.decode(errors='replace')[-500:]}")
+        return False
+    return True
+
+
+def _probe_duration(path):
+    """Возвращает длительность видео в секундах или None"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        capture_output=True, timeout=30
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def _max_height(video_bitrate):
+    """Подбирает разрешение, при котором битрейт дает приемлемое качество"""
+    for min_bitrate, height in HEIGHT_BY_BITRATE:
+        if video_bitrate >= min_bitrate:
+            return height
+
+
+class Transcoder:
+    """
+    Сжатие медиа, которое не помещается в лимит Telegram
+
+    Видео перекодируется ffmpeg с битрейтом, рассчитанным по длительности
+    и MAX_FILE_SIZE, а слишком большие изображения пересжимаются в JPEG.
+    Одновременно работает не больше TRANSCODE_WORKERS процессов ffmpeg,
+    а очередь ожидающих заданий ограничена TRANSCODE_QUEUE_SIZE, поэтому
+    сжатие не отнимает процессор у загрузок.
+    """
+
+    def __init__(self, workers=TRANSCODE_WORKERS, max_queue=TRANSCODE_QUEUE_SIZE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcode")
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.jobs = 0
+        self.failures = 0
+        self.rejected = 0
+        self.encode_seconds = 0.0
+        self.input_bytes = 0
+        self.output_bytes = 0
+
+    def needs_transcode(self, media_info):
+        """Проверяет, нужно ли сжимать скачанный файл"""
+        file_size = os.path.getsize(media_info['file_path'])
+        if media_info['file_type'] == 'image':
+            return file_size > TRANSCODE_IMAGE_MAX_SIZE
+        if media_info['file_type'] == 'video':
+            return file_size > MAX_FILE_SIZE
+        return False
+
+    def fit(self, media_info, timeout=TRANSCODE_TIMEOUT):
+        """
+        Сжимает файл так, чтобы он поместился в лимит
+
+        Args:
+            media_info: Информация о скачанном файле
+            timeout: Максимальное время ожидания с учетом очереди
+
+        Returns:
+            dict: Информация о сжатом файле или None, если сжать не удалось
+        """
+        with self.lock:
+            if self.pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                logging.warning(f"Очередь сжатия переполнена, файл не сжат: {media_info['file_path']}")
+                return None
+            self.pending += 1
+
+        future = self.executor.submit(self._transcode, media_info, timeout)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            logging.warning(f"Превышено время ожидания сжатия: {media_info['file_path']}")
+            return None
+
+    def stats(self):
+        """Возвращает статистику сжатия"""
+        with self.lock:
+            return {
+                'jobs': self.jobs,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'queued': self.pending,
+                'encode_seconds': round(self.encode_seconds, 1),
+                'size_reduction': round(1 - self.output_bytes / self.input_bytes, 3) if self.input_bytes else 0
+            }
+
+    def shutdown(self):
+        """Дожидается завершения запущенных процессов ffmpeg"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _transcode(self, media_info, timeout):
+        """Выполняется в пуле: сжимает файл и учитывает результат в статистике"""
+        source_path = media_info['file_path']
+        source_size = os.path.getsize(source_path)
+        started = time.monotonic()
+        try:
+            if media_info['file_type'] == 'video':
+                file_path = self._encode_video(source_path, timeout)
+            else:
+                file_path = self._encode_image(source_path, timeout)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.error(f"Ошибка при сжатии {source_path}: {e}")
+            file_path = None
+        finally:
+            elapsed = time.monotonic() - started
+            with self.lock:
+                self.pending -= 1
+
+        with self.lock:
+            self.encode_seconds += elapsed
+            if not file_path:
+                self.failures += 1
+                return None
+            output_size = os.path.getsize(file_path)
+            self.jobs += 1
+            self.input_bytes += source_size
+            self.output_bytes += output_size
+
+        logging.info(
+            f"Файл сжат за {elapsed:.1f} с: {source_path} "
+            f"({source_size / 1024 / 1024:.1f} МБ -> {output_size / 1024 / 1024:.1f} МБ)"
+        )
+        result = dict(media_info)
+        result['file_path'] = file_path
+        result['file_name'] = os.path.basename(file_path)
+        return result
+
+    def _encode_video(self, source_path, timeout):
+        """Перекодирует видео в H.264/AAC с битрейтом, при котором файл помещается в лимит"""
+        duration = _probe_duration(source_path)
+        if not duration:
+            logging.warning(f"Не удалось определить длительность видео: {source_path}")
+            return None
+
+        target_path = os.path.splitext(source_path)[0] + "_compressed.mp4"
+        # Общий битрейт в кбит/с, из которого вычитается звук
+        total_bitrate = MAX_FILE_SIZE * 8 * SIZE_MARGIN / duration / 1000
+        video_bitrate = int(total_bitrate - TRANSCODE_AUDIO_BITRATE)
+
+        for _ in range(2):
+            if video_bitrate < TRANSCODE_MIN_VIDEO_BITRATE:
+                logging.warning(f"Видео слишком длинное для сжатия до лимита: {source_path} ({duration:.0f} с)")
+                return None
+            height = _max_height(video_bitrate)
+            ok = _run_ffmpeg([
+                "-i", source_path,
+                "-threads", str(TRANSCODE_FFMPEG_THREADS),
+                "-vf", f"scale=-2:'min({height},ih)'",
+                "-c:v", "libx264", "-preset", "veryfast",
+                "-b:v", f"{video_bitrate}k",
+                "-maxrate", f"{video_bitrate}k", "-bufsize", f"{video_bitrate * 2}k",
+                "-c:a", "aac", "-b:a", f"{TRANSCODE_AUDIO_BITRATE}k",
+                "-movflags", "+faststart",
+                target_path
+            ], timeout)
+            if not ok:
+                return None
+            if os.path.getsize(target_path) <= MAX_FILE_SIZE:
+                return target_path
+            video_bitrate = int(video_bitrate * RETRY_FACTOR)
+
+        os.remove(target_path)
+        return None
+
+    def _encode_image(self, source_path, timeout):
+        """Пересжимает изображение в JPEG, постепенно снижая качество"""
+        target_path = os.path.splitext(source_path)[0] + "_compressed.jpg"
+        for quality in IMAGE_QUALITY:
+            ok = _run_ffmpeg([
+                "-i", source_path,
+                "-vf", f"scale='min({IMAGE_MAX_SIDE},iw)':'min({IMAGE_MAX_SIDE},ih)':force_original_aspect_ratio=decrease",
+                "-q:v", str(quality),
+                "-frames:v", "1",
+                target_path
+            ], timeout)
+            if not ok:
+                return None
+            if os.path.getsize(target_path) <= TRANSCODE_IMAGE_MAX_SIZE:
+                return target_path
+
+        os.remove(target_path)
+        return None
+
+
+def create_transcoder():
+    """Создает Transcoder, если сжатие включено и ffmpeg установлен"""
+    if not TRANSCODE_ENABLED:
+        return None
+    if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+        logging.warning("ffmpeg не найден, сжатие медиа отключено")
+        return None
+    return Transcoder()
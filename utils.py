@@ -1,34 +1,17 @@
 import os
 import re
-import time
 import logging
-import shutil
 from urllib.parse import urlparse, ParseResult
-from config import SUPPORTED_PLATFORMS, TEMP_DIR
+from config import SUPPORTED_PLATFORMS, MEDIA_GROUP_SIZE
 
-# Словарь для отслеживания последних запросов пользователей
-user_requests = {}
+# Типы медиа, которые можно объединять в альбом
+MEDIA_GROUP_TYPES = ('image', 'video')
 
-def create_temp_dir():
-    """Создает временную директорию, если она не существует"""
-    if not os.path.exists(TEMP_DIR):
-        os.makedirs(TEMP_DIR)
+# Ссылка в тексте сообщения без разметки entities
+URL_PATTERN = re.compile(r'https?://[^\s<>"\']+')
 
-def cleanup_temp_files():
-    """Удаляет старые временные файлы"""
-    try:
-        if os.path.exists(TEMP_DIR):
-            shutil.rmtree(TEMP_DIR)
-            create_temp_dir()
-    except Exception as e:
-        logging.error(f"Ошибка при очистке временных файлов: {e}")
-
-def get_user_download_dir(user_id):
-    """Создает и возвращает путь к директории для загрузок пользователя"""
-    user_dir = os.path.join(TEMP_DIR, str(user_id))
-    if not os.path.exists(user_dir):
-        os.makedirs(user_dir)
-    return user_dir
+# Знаки препинания, которые не относятся к ссылке в конце предложения
+URL_TRAILING_CHARS = '.,;:!?)»"\''
 
 def is_valid_url(url):
     """Проверяет, является ли строка корректным URL"""
@@ -38,6 +21,37 @@ def is_valid_url(url):
     except:
         return False
 
+def extract_urls(text, entities=None):
+    """
+    Извлекает ссылки из текста сообщения
+
+    Ссылки берутся из entities сообщения (url и text_link), которые
+    размечает Telegram, а если их нет - находятся в тексте по шаблону.
+
+    Args:
+        text: Текст сообщения
+        entities: Разметка сообщения (MessageEntity)
+
+    Returns:
+        list: Ссылки в порядке появления в тексте
+    """
+    urls = []
+    links = [entity for entity in entities or [] if entity.type in ('url', 'text_link')]
+    if links:
+        # Смещения entities указаны в UTF-16 единицах
+        encoded = text.encode('utf-16-le')
+        for entity in sorted(links, key=lambda entity: entity.offset):
+            if entity.type == 'text_link':
+                url = entity.url
+            else:
+                url = encoded[entity.offset * 2:(entity.offset + entity.length) * 2].decode('utf-16-le')
+            if '://' not in url:
+                url = 'https://' + url
+            urls.append(url)
+    else:
+        urls = [url.rstrip(URL_TRAILING_CHARS) for url in URL_PATTERN.findall(text)]
+    return [url for url in urls if is_valid_url(url)]
+
 def get_platform(url):
     """Определяет платформу по URL"""
     if not is_valid_url(url):
@@ -100,33 +114,23 @@ def extract_media_id(url, platform):
     
     return None
 
-def rate_limit_check(user_id, limit=5, period=60):
+def guess_media_type(url, platform):
     """
-    Проверяет ограничение на количество запросов от пользователя
-    
-    Args:
-        user_id: Идентификатор пользователя
-        limit: Максимальное количество запросов за период
-        period: Период в секундах
-    
+    Определяет тип медиа по URL, не обращаясь к платформе
+
     Returns:
-        bool: True, если лимит не превышен, False в противном случае
+        str: 'video', 'image' или None, если по ссылке тип не понять
     """
-    current_time = time.time()
-    
-    if user_id not in user_requests:
-        user_requests[user_id] = []
-    
-    # Удаляем устаревшие запросы
-    user_requests[user_id] = [t for t in user_requests[user_id] if current_time - t < period]
-    
-    # Проверяем лимит
-    if len(user_requests[user_id]) >= limit:
-        return False
-    
-    # Добавляем текущий запрос
-    user_requests[user_id].append(current_time)
-    return True
+    path = urlparse(url).path
+    if platform == 'instagram':
+        # Посты /p/ бывают и фото, и видео, и подборками
+        return 'video' if re.search(r'/(reel|reels|tv)/', path) else None
+    if platform == 'tiktok':
+        if '/photo/' in path:
+            return 'image'
+        if '/video/' in path:
+            return 'video'
+    return None
 
 def get_file_extension(file_type):
     """Возвращает расширение файла в зависимости от его типа"""
@@ -140,3 +144,44 @@ def get_file_extension(file_type):
 def sanitize_filename(filename):
     """Очищает имя файла от недопустимых символов"""
     return re.sub(r'[\\/*?:"<>|]', "_", filename)
+
+def get_file_id(response):
+    """Извлекает file_id из ответа Telegram на отправку медиа"""
+    if response.video:
+        return response.video.file_id
+    if response.animation:
+        return response.animation.file_id
+    if response.photo:
+        # Берем фото в максимальном разрешении
+        return response.photo[-1].file_id
+    if response.document:
+        return response.document.file_id
+    return None
+
+def plan_media_groups(file_types, group_size=MEDIA_GROUP_SIZE):
+    """
+    Разбивает медиа на альбомы для send_media_group
+
+    Фото и видео объединяются в альбомы по group_size штук, остальные
+    типы (GIF, документы) отправляются отдельными сообщениями.
+
+    Args:
+        file_types: Типы медиа в порядке отправки
+        group_size: Максимальный размер альбома
+
+    Returns:
+        list: Списки индексов медиа; список из одного индекса - отдельное сообщение
+    """
+    groups = []
+    album = []
+    for index, file_type in enumerate(file_types):
+        if file_type not in MEDIA_GROUP_TYPES:
+            groups.append([index])
+            continue
+        album.append(index)
+        if len(album) == group_size:
+            groups.append(album)
+            album = []
+    if album:
+        groups.append(album)
+    return groups
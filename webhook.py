@@ -0,0 +1,112 @@
+import json
+import hmac
+import logging
+import secrets
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from telebot import types
+from config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_MAX_BODY, ALLOWED_UPDATES
+)
+
+# Заголовок, в котором Telegram передает секретный токен вебхука
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Принимает обновления от Telegram и сразу отвечает 200"""
+
+    def do_POST(self):
+        server = self.server
+        if self.path != server.path:
+            self._reply(404)
+            return
+
+        # Проверяем секретный токен, заданный при установке вебхука
+        token = self.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), server.secret.encode()):
+            logging.warning(f"Запрос к вебхуку с неверным токеном от {self.client_address[0]}")
+            self._reply(403)
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = 0
+        if length <= 0 or length > WEBHOOK_MAX_BODY:
+            self._reply(400)
+            return
+
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400)
+            return
+        if not isinstance(update, dict):
+            self._reply(400)
+            return
+
+        # Отвечаем сразу, обработка идет после ответа
+        self._reply(200)
+
+        if not any(key in update for key in server.allowed_updates):
+            return
+        try:
+            server.dispatch([types.Update.de_json(update)])
+        except Exception as e:
+            logging.error(f"Ошибка при передаче обновления на обработку: {e}")
+
+    def _reply(self, status):
+        """Отправляет пустой ответ с указанным статусом"""
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        """Запросы Telegram не пишем в лог, чтобы не засорять его"""
+        pass
+
+
+class WebhookServer:
+    """
+    Встроенный HTTP сервер для приема обновлений через вебхук
+
+    Args:
+        dispatch: Функция, принимающая список обновлений (types.Update)
+    """
+
+    def __init__(self, dispatch, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                 secret=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES):
+        if not secret:
+            # Без общего секрета вебхук можно использовать только в одном экземпляре
+            secret = secrets.token_urlsafe(32)
+            logging.warning("WEBHOOK_SECRET не задан, используется случайный токен")
+        self.secret = secret
+        self.allowed_updates = allowed_updates
+        self.httpd = ThreadingHTTPServer((host, port), WebhookHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.dispatch = dispatch
+        self.httpd.path = path
+        self.httpd.secret = secret
+        self.httpd.allowed_updates = allowed_updates
+        self.thread = None
+
+    @property
+    def port(self):
+        """Порт, на котором слушает сервер"""
+        return self.httpd.server_address[1]
+
+    def start(self):
+        """Запускает сервер в отдельном потоке"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="webhook")
+        self.thread.daemon = True
+        self.thread.start()
+        logging.info(f"Вебхук слушает порт {self.port}")
+
+    def shutdown(self):
+        """Останавливает сервер"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread:
+            self.thread.join()
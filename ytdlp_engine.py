@@ -0,0 +1,309 @@
+import os
+import json
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import yt_dlp
+from yt_dlp.postprocessor import FFmpegMergerPP
+from config import YTDLP_WORKERS, YTDLP_TIMEOUT, FORMAT_POLICY, FORMAT_SIZE_MARGIN
+
+# Шаблон имени файла, который формирует yt-dlp
+OUTPUT_TEMPLATE = "%(extractor)s_%(id)s.%(ext)s"
+
+# Экстракторы, которые импортируются при запуске рабочего процесса
+PRELOADED_EXTRACTORS = ["Instagram", "TikTok", "Pinterest"]
+
+# Поля информации yt-dlp, которые возвращаются из рабочего процесса
+INFO_FIELDS = [
+    "id", "extractor", "title", "ext", "url", "duration", "width", "height",
+    "filesize", "filesize_approx", "vcodec", "acodec", "http_headers", "filepath"
+]
+
+# Экземпляры YoutubeDL рабочего процесса, по одному на набор опций
+_instances = {}
+
+
+class YtdlpError(Exception):
+    """Ошибка извлечения или скачивания медиа через yt-dlp"""
+
+    def __init__(self, message, reason=None):
+        super().__init__(message)
+        self.reason = reason
+
+    def __reduce__(self):
+        # Причина ошибки должна сохраниться при передаче из рабочего процесса
+        return YtdlpError, (str(self), self.reason)
+
+
+def _estimate_size(fmt):
+    """Возвращает известный или оцененный размер формата в байтах или None"""
+    if fmt.get("filesize"):
+        return fmt["filesize"]
+    if fmt.get("filesize_approx"):
+        # Оценка неточная, поэтому оставляем запас
+        return fmt["filesize_approx"] / FORMAT_SIZE_MARGIN
+    return None
+
+
+def _quality(fmt):
+    """Ключ сортировки форматов по качеству"""
+    return fmt.get("height") or 0, fmt.get("width") or 0, fmt.get("tbr") or 0
+
+
+def _can_merge(ydl):
+    """Проверяет, может ли yt-dlp объединять отдельные видео и звук (нужен ffmpeg)"""
+    merger = FFmpegMergerPP(ydl)
+    return merger.available and merger.can_merge()
+
+
+class SizeAwareSelector:
+    """
+    Выбор формата с учетом ограничения на размер файла
+
+    Кандидаты - форматы, в которых есть и видео, и звук, а также пары
+    из отдельных видео и звука, которые yt-dlp объединяет (их размер
+    складывается). Выбирается лучший по качеству кандидат
+    (политика "quality") или самый маленький (политика "size") из тех,
+    чей размер известен или оценен и не превышает лимит. Если размер
+    неизвестен ни для одного кандидата, используется стандартный выбор
+    yt-dlp, а от скачивания слишком большого файла защищает параметр
+    max_filesize.
+    """
+
+    def __init__(self, ydl, default_selector, policy=FORMAT_POLICY):
+        self.ydl = ydl
+        self.merge = _can_merge(ydl)
+        # Без опции "format" yt-dlp строит выбор по умолчанию сам, а мы его заменяем
+        if default_selector is None:
+            default_selector = ydl.build_format_selector(ydl._default_format_spec({}, download=True))
+        self.default_selector = default_selector
+        self.policy = policy
+        self.max_size = None
+        self.rejected = False
+
+    def _candidates(self, formats):
+        """
+        Возвращает кандидатов: (размер или None, ключ качества, спецификация формата)
+        """
+        complete, videos, audios = [], [], []
+        for fmt in formats:
+            has_video = fmt.get("vcodec") != "none"
+            has_audio = fmt.get("acodec") != "none"
+            if has_video and has_audio:
+                complete.append(fmt)
+            elif has_video:
+                videos.append(fmt)
+            elif has_audio:
+                audios.append(fmt)
+
+        candidates = [(_estimate_size(fmt), _quality(fmt), fmt["format_id"]) for fmt in complete]
+        # Без ffmpeg пары берем, только если других вариантов нет (как и выбор по умолчанию)
+        if self.merge or not complete:
+            for video in videos:
+                for audio in audios:
+                    video_size, audio_size = _estimate_size(video), _estimate_size(audio)
+                    size = video_size + audio_size if video_size and audio_size else None
+                    quality = _quality(video) + (audio.get("abr") or audio.get("tbr") or 0,)
+                    candidates.append((size, quality, f"{video['format_id']}+{audio['format_id']}"))
+        return candidates
+
+    def _select(self, spec, ctx):
+        """Выбирает формат (или пару форматов) по спецификации средствами yt-dlp"""
+        yield from self.ydl.build_format_selector(spec)(ctx)
+
+    def __call__(self, ctx):
+        self.rejected = False
+        if not self.max_size:
+            yield from self.default_selector(ctx)
+            return
+
+        fitting = []
+        unknown = []
+        too_large = False
+        for candidate in self._candidates(ctx["formats"]):
+            size = candidate[0]
+            if size is None:
+                unknown.append(candidate)
+            elif size <= self.max_size:
+                fitting.append(candidate)
+            else:
+                too_large = True
+
+        if fitting:
+            if self.policy == "size":
+                chosen = min(fitting, key=lambda candidate: candidate[0])
+            else:
+                chosen = max(fitting, key=lambda candidate: candidate[1])
+            yield from self._select(chosen[2], ctx)
+        elif unknown:
+            chosen = (min if self.policy == "size" else max)(unknown, key=lambda candidate: candidate[1])
+            yield from self._select(chosen[2], ctx)
+        elif too_large:
+            # Все форматы больше лимита - скачивать нечего
+            self.rejected = True
+        else:
+            yield from self.default_selector(ctx)
+
+
+def _has_file(summary):
+    """Проверяет, что yt-dlp сохранил хотя бы один файл"""
+    if summary.get("filepath") and os.path.exists(summary["filepath"]):
+        return True
+    return any(_has_file(entry) for entry in summary.get("entries") or [])
+
+
+def _default_options():
+    """Базовые опции yt-dlp для всех запросов"""
+    return {
+        "quiet": True,
+        "no_warnings": True,
+        "noprogress": True,
+        "outtmpl": OUTPUT_TEMPLATE,
+    }
+
+
+def _get_instance(options):
+    """Возвращает экземпляр YoutubeDL для набора опций, создавая его при необходимости"""
+    key = json.dumps(options, sort_keys=True)
+    ydl = _instances.get(key)
+    if ydl is None:
+        params = _default_options()
+        params.update(options)
+        # Экземпляр живет все время работы процесса и переиспользует HTTP соединения
+        ydl = yt_dlp.YoutubeDL(params)
+        ydl.format_selector = SizeAwareSelector(ydl, ydl.format_selector)
+        _instances[key] = ydl
+    return ydl
+
+
+def _warm_up():
+    """Инициализация рабочего процесса: заранее импортирует экстракторы"""
+    ydl = _get_instance({})
+    for ie_key in PRELOADED_EXTRACTORS:
+        ydl.get_info_extractor(ie_key)
+
+
+def _summarize(info):
+    """Оставляет только нужные поля информации о медиа"""
+    result = {field: info.get(field) for field in INFO_FIELDS}
+
+    # Путь к итоговому файлу (после объединения форматов и постобработки)
+    requested = info.get("requested_downloads") or []
+    if requested and requested[0].get("filepath"):
+        result["filepath"] = requested[0]["filepath"]
+
+    if info.get("entries") is not None:
+        result["entries"] = [_summarize(entry) for entry in info["entries"] if entry]
+    return result
+
+
+def _extract(url, options, save_dir, download, max_size, policy, download_entries):
+    """Выполняется в рабочем процессе: извлекает информацию и скачивает медиа"""
+    ydl = _get_instance(options)
+    ydl.params["paths"] = {"home": save_dir} if save_dir else {}
+    ydl.params["max_filesize"] = max_size
+    ydl.format_selector.max_size = max_size
+    ydl.format_selector.policy = policy or FORMAT_POLICY
+    try:
+        info = ydl.extract_info(url, download=False, process=False)
+        # Элементы подборки вызывающий код может скачать сам, параллельно
+        if info and info.get("_type") == "playlist" and not download_entries:
+            download = False
+        info = ydl.process_ie_result(info, download=download) if info else None
+    except Exception as e:
+        if ydl.format_selector.rejected:
+            raise YtdlpError(f"Все форматы больше {max_size} байт", "file_too_large")
+        # Исключения yt-dlp не всегда переживают передачу между процессами
+        raise YtdlpError(str(e))
+    if not info:
+        raise YtdlpError("yt-dlp не вернул информацию о медиа")
+
+    summary = _summarize(ydl.sanitize_info(info))
+    # yt-dlp молча пропускает файл, если он оказался больше max_filesize
+    if download and max_size and not _has_file(summary):
+        raise YtdlpError(f"Файл больше {max_size} байт", "file_too_large")
+    return summary
+
+
+class YtdlpEngine:
+    """
+    Пул долгоживущих процессов для работы с yt-dlp
+
+    Вместо запуска отдельного процесса yt-dlp на каждую загрузку запросы
+    выполняются через API YoutubeDL в заранее запущенных процессах,
+    в которых экстракторы уже импортированы.
+    """
+
+    def __init__(self, workers=YTDLP_WORKERS):
+        self.workers = workers
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def _get_pool(self):
+        """Возвращает пул процессов, запуская его при первом обращении"""
+        with self.lock:
+            if self.pool is None:
+                # forkserver не наследует потоки бота и не импортирует main.py
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["ytdlp_engine"])
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_warm_up
+                )
+            return self.pool
+
+    def _reset_pool(self, pool):
+        """Пересоздает пул, если один из процессов аварийно завершился"""
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def extract(self, url, options=None, save_dir=None, download=True, timeout=YTDLP_TIMEOUT,
+                max_size=None, policy=None, download_entries=True):
+        """
+        Извлекает информацию о медиа и при необходимости скачивает его
+
+        Args:
+            url: URL поста
+            options: Дополнительные опции YoutubeDL
+            save_dir: Директория для сохранения
+            download: Скачивать ли файл или только извлечь информацию
+            timeout: Максимальное время ожидания результата
+            max_size: Максимальный размер файла - выбирается формат, который в него помещается
+            policy: Политика выбора формата ("quality" или "size"), по умолчанию FORMAT_POLICY
+            download_entries: Скачивать ли элементы подборки (при False для них
+                только выбирается формат и возвращается прямая ссылка url)
+
+        Returns:
+            dict: Информация о медиа, включая путь к скачанному файлу (filepath)
+
+        Raises:
+            YtdlpError: Если извлечь или скачать медиа не удалось
+                (reason "file_too_large", если ни один формат не помещается в max_size)
+        """
+        pool = self._get_pool()
+        # Рабочие процессы не должны зависеть от текущей директории бота
+        if save_dir:
+            save_dir = os.path.abspath(save_dir)
+        try:
+            future = pool.submit(
+                _extract, url, options or {}, save_dir, download, max_size, policy, download_entries
+            )
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise YtdlpError(f"Превышено время ожидания yt-dlp ({timeout} с)")
+        except BrokenProcessPool as e:
+            logging.error(f"Пул процессов yt-dlp аварийно завершился: {e}")
+            self._reset_pool(pool)
+            raise YtdlpError(str(e))
+
+    def shutdown(self):
+        """Останавливает рабочие процессы"""
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)